@@ -0,0 +1,52 @@
+"""Benchmark summarizing a multiplicative model exactly against sampling it.
+
+Usage:
+    python benchmarks/closed_form_benchmark.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import simplefermi as sf
+from simplefermi import graph, utils
+
+
+def model(gravity):
+    # The mass of the atmosphere, in the style of the README.
+    pressure = sf.lognormal(0.9, 1.1, "atm")
+    radius = sf.lognormal(6300, 6400, "km")
+    return pressure / (gravity() * sf.percent(7)) * 4 * np.pi * radius**2
+
+
+def sampled():
+    # A normal factor leaves the lognormals, so this model has to be sampled.
+    x = model(lambda: sf.plusminus(9.8, 0.05, "m/s^2"))
+    return utils.summary(x.magnitude)
+
+
+def exact():
+    x = model(lambda: sf.lognormal(9.75, 9.85, "m/s^2"))
+    return graph.closed_form(x).summary()
+
+
+def main(repeats=20):
+    print(f"{'':10}  {'median':>10}  {'low':>10}  {'high':>10}  {'time':>10}")
+    for name, fn in [("sampled", sampled), ("exact", exact)]:
+        with graph.lazy():
+            start = time.perf_counter()
+            for _ in range(repeats):
+                summary = fn()
+            elapsed = (time.perf_counter() - start) / repeats
+        print(
+            f"{name:10}  {'  '.join(f'{x:10.4g}' for x in summary)}"
+            f"  {1e3 * elapsed:7.3f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Benchmark how fast the quantiles of a model converge with each sampling design.
+
+Usage:
+    python benchmarks/design_benchmark.py
+"""
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import simplefermi as sf
+from simplefermi import sampling
+
+QUANTILES = [0.16, 0.5, 0.84]
+
+
+def model():
+    return sf.lognormal(1, 10) * sf.lognormal(2, 5) / sf.normal(3, 4)
+
+
+def quantiles(design, n, seed):
+    with sampling.quasi(design), sf.samples(n), sampling.rng(seed):
+        return np.quantile(model(), QUANTILES)
+
+
+def main(repeats=20):
+    # A reference that is itself far more accurate than the estimates.
+    reference = np.mean([quantiles("sobol", 2**21, seed) for seed in range(8)], 0)
+    print("relative rms error of the 16%, 50% and 84% quantiles")
+    for n in [2**10, 2**12, 2**14, 2**16, 2**18]:
+        line = f"N={n:>9,}"
+        for design in ["random", "lhs", "halton", "sobol"]:
+            errors = [
+                quantiles(design, n, seed) / reference - 1
+                for seed in range(1, repeats + 1)
+            ]
+            line += f"  {design} {np.sqrt(np.mean(np.square(errors))):.4f}"
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""Benchmark binning and drawing quantile dotplots.
+
+Usage:
+    python benchmarks/dotplot_benchmark.py
+"""
+
+import io
+import os
+import sys
+import timeit
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import matplotlib.pyplot as plt
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import dotplots
+
+
+def render(values, quantiles):
+    fig, _ = dotplots.dotplot(values, quantiles=quantiles, log=True)
+    fig.savefig(io.BytesIO(), format="png")
+    plt.close(fig)
+
+
+def main():
+    values = np.random.default_rng(0).lognormal(0, 1, 200_000)
+    for quantiles in [20, 100, 500, 2000]:
+        qs = np.arange(0.5 / quantiles, 1, 1 / quantiles)
+        x = np.quantile(np.log10(values), qs)
+        width = 5 / 2 * (x.max() - x.min()) / quantiles
+        fn = lambda: dotplots.dotbin(x, width, smooth=True)
+        t_bin = min(timeit.repeat(fn, number=10, repeat=3)) / 10
+        t_render = min(timeit.repeat(lambda: render(values, quantiles), number=1))
+        print(
+            f"quantiles={quantiles:5d}  dotbin {1e3 * t_bin:8.3f} ms"
+            f"  render {1e3 * t_render:8.1f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
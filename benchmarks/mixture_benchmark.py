@@ -0,0 +1,51 @@
+"""Benchmark mixtures and weighted bootstraps.
+
+Usage:
+    python benchmarks/mixture_benchmark.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import distributions as d
+
+
+def previous_mixture(*dists, weights=None):
+    """The previous implementation, which pooled the samples in python lists."""
+    if weights is None:
+        values = [x for dist in dists for x in d.data(dist)]
+        return np.random.choice(values, len(dists[0]))
+    values, weights = zip(*[(x, w) for dist, w in zip(dists, weights) for x in dist])
+    weights = np.asarray(weights) / np.sum(weights)
+    return np.random.choice(values, len(dists[0]), p=weights)
+
+
+def bench(fn, repeat=3):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    sources = [d.lognormal(i + 1, 10 * (i + 1)) for i in range(10)]
+    weights = np.arange(1.0, 11.0)
+    print(f"N={len(sources[0]):,}")
+    print(
+        f"  one source                {1e3 * bench(lambda: d.data(sources[0])):10.2f} ms"
+    )
+    for k in [2, 10]:
+        t = bench(lambda: d.mixture(*sources[:k]))
+        print(f"  mixture of {k:2}             {1e3 * t:10.2f} ms")
+        t = bench(lambda: d.mixture(*sources[:k], weights=weights[:k]))
+        print(f"  weighted mixture of {k:2}    {1e3 * t:10.2f} ms")
+        t = bench(lambda: previous_mixture(*sources[:k], weights=weights[:k]), 1)
+        print(f"  previous weighted of {k:2}   {1e3 * t:10.2f} ms")
+    t = bench(lambda: d.data([31, 29, 30, 28], weights=[2800, 97, 1600, 303]))
+    print(f"  month (alias table)       {1e3 * t:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""Benchmark updating a large live notebook after an edit.
+
+Usage:
+    python benchmarks/notebook_benchmark.py
+"""
+
+import os
+import sys
+import tempfile
+import timeit
+import warnings
+
+import markdown
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import diskcache
+from simplefermi import notebook
+
+warnings.simplefilter("ignore", DeprecationWarning)
+
+
+def make_notebook(sections=100):
+    parts = []
+    for i in range(sections):
+        parts.append(f"## Section {i}\n\nSome text about $x_{i}$ and *more*.\n\n")
+        parts.append(f"```fermi\nx{i} = 1 to 10 m\ny{i} = x{i} * 2\ny{i}\n```\n\n")
+    return "".join(parts)
+
+
+def full(text):
+    """The previous implementation, everything is rendered on every save."""
+    content = notebook.preprocess_math(text)
+    content = notebook.preprocess_fermi(content)
+    return markdown.markdown(
+        content,
+        extensions=["codehilite", "fenced_code"],
+    )
+
+
+def bench(fn, repeat=5):
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    text = make_notebook()
+    edits = {
+        "markdown": text.replace("Section 50", "Part 50"),
+        "fermi": text.replace("x50 = 1 to 10 m", "x50 = 2 to 10 m"),
+    }
+    print(f"notebook with {len(notebook.split_blocks(text))} blocks")
+    print(f"  full render                {1e3 * bench(lambda: full(text)):8.1f} ms")
+    document = notebook.Document()
+    print(
+        f"  first update               {1e3 * bench(lambda: document.update(text), 1):8.1f} ms"
+    )
+    for name, edited in edits.items():
+
+        def edit():
+            document.update(edited)
+            document.update(text)
+
+        t = bench(edit) / 2
+        print(f"  edit one {name:10s}        {1e3 * t:8.1f} ms")
+
+    for name, text in [("quick", text), ("slow", make_slow_notebook())]:
+        restart(name, text)
+
+
+def make_slow_notebook(sections=10, terms=40):
+    """A notebook whose blocks each take a few hundred milliseconds."""
+    parts = []
+    for i in range(sections):
+        total = " + ".join(f"({k} to {k + 2}) * x{i}" for k in range(1, terms))
+        parts.append(f"## Section {i}\n\n")
+        parts.append(f"```fermi\nx{i} = 1 to 10 m\ny{i} = {total}\ny{i}\n```\n\n")
+    return "".join(parts)
+
+
+def restart(name, text):
+    """Opening a notebook without a cache, with an empty cache and after a restart."""
+
+    def cold():
+        notebook.Document().update(text)
+
+    print(f"{name} notebook with {len(notebook.split_blocks(text))} blocks")
+    print(f"  open without disk cache    {1e3 * bench(cold, 3):8.1f} ms")
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "cache.sqlite")
+        cache = diskcache.DiskCache(path)
+        t = bench(lambda: notebook.Document(cache=cache).update(text), 1)
+        print(f"  open with empty disk cache {1e3 * t:8.1f} ms")
+        t = bench(lambda: notebook.Document(cache=cache).update(text), 3)
+        print(f"  restart with disk cache    {1e3 * t:8.1f} ms")
+        print(f"  disk cache size            {os.path.getsize(path) / 2**20:8.1f} MiB")
+        cache.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""Benchmark the throughput of parsing fermi blocks.
+
+Usage:
+    python benchmarks/parser_benchmark.py
+"""
+
+import concurrent.futures
+import os
+import random
+import sys
+import time
+import warnings
+
+warnings.simplefilter("ignore", DeprecationWarning)
+
+import tree_sitter
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import parser
+
+SNIPPETS = [
+    "x{i} = 1 to 10 m",
+    "y{i} = x{i} * 2 kg / s",
+    "func f{i}(a, b) = a * b^2",
+    "z{i} = {{ a = 3; a * 4 }}",
+    "print 1 outof {i}",
+    "w{i} = (3 + {i}) m -> km",
+]
+
+
+def corpus(size=2000, unique=200, seed=0):
+    """Fermi blocks of a few statements, with some blocks repeated like in notebooks."""
+    rng = random.Random(seed)
+    blocks = [
+        "\n".join(
+            rng.choice(SNIPPETS).format(i=rng.randrange(100))
+            for _ in range(rng.randint(1, 8))
+        )
+        + "\n"
+        for _ in range(unique)
+    ]
+    return [rng.choice(blocks) for _ in range(size)]
+
+
+def fresh(s):
+    """The previous implementation, a new parser for every parse."""
+    p = tree_sitter.Parser(parser.FERMI)
+    return p.parse(bytes(s, "utf-8")).root_node
+
+
+def uncached(s):
+    return parser.parser().parse(bytes(s, "utf-8")).root_node
+
+
+def throughput(fn, blocks, workers=1):
+    parser.tree_cache.clear()
+    start = time.perf_counter()
+    if workers == 1:
+        for block in blocks:
+            fn(block)
+    else:
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            list(pool.map(fn, blocks, chunksize=64))
+    return len(blocks) / (time.perf_counter() - start)
+
+
+def main():
+    blocks = corpus()
+    print(f"{len(blocks)} blocks, {len(set(blocks))} distinct")
+    for name, fn in [("fresh", fresh), ("pooled", uncached), ("cached", parser.parse)]:
+        for workers in [1, 4]:
+            rate = throughput(fn, blocks, workers)
+            print(f"  {name:8s} workers={workers}  {rate:12,.0f} blocks/s")
+
+
+if __name__ == "__main__":
+    main()
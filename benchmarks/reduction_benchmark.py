@@ -0,0 +1,62 @@
+"""Benchmark the variance reductions by the error of the estimates per CPU time.
+
+Usage:
+    python benchmarks/reduction_benchmark.py
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import simplefermi as sf
+from simplefermi import sampling
+
+N = 20_000
+QUANTILES = [0.16, 0.5, 0.84]
+
+
+def model():
+    return sf.lognormal(1, 10) * sf.percent(20) + sf.plusminus(3, 1)
+
+
+def resample():
+    return sf.data(np.arange(100.0) ** 2, weights=np.arange(1, 101))
+
+
+def estimates(fn, reduction, seed):
+    with sampling.reduced(reduction), sf.samples(N), sampling.rng(seed):
+        start = time.process_time()
+        x = np.asarray(fn())
+        estimate = np.array([x.mean(), *np.quantile(x, QUANTILES)])
+        return estimate, time.process_time() - start
+
+
+def main(repeats=100):
+    for name, fn in [("model", model), ("weighted data", resample)]:
+        with sampling.rng(0), sf.samples(4_000_000):
+            x = np.asarray(fn())
+            reference = np.array([x.mean(), *np.quantile(x, QUANTILES)])
+        print(
+            f"{name}, N={N:,}: relative rms error of the mean and 16/50/84% quantiles"
+        )
+        baseline = None
+        for reduction in ["none", "antithetic", "stratified"]:
+            runs = [estimates(fn, reduction, seed) for seed in range(1, repeats + 1)]
+            errors = np.array([e for e, _ in runs]) / reference - 1
+            rmse = np.sqrt(np.mean(np.square(errors), axis=0))
+            cpu = np.mean([t for _, t in runs])
+            # How many times fewer CPU seconds the same error takes.
+            efficiency = 1 / (np.mean(np.square(rmse)) * cpu)
+            baseline = baseline or efficiency
+            print(
+                f"  {reduction:10}  {'  '.join(f'{e:.4f}' for e in rmse)}"
+                f"  {1e3 * cpu:7.2f} ms  efficiency x{efficiency / baseline:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
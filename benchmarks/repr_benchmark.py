@@ -0,0 +1,60 @@
+"""Benchmark the latency of printing an uncertain quantity.
+
+Usage:
+    python benchmarks/repr_benchmark.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import simplefermi as sf
+from simplefermi import api, core, utils
+
+
+def sorted_repr(values, padding=2):
+    """The previous implementation, a python sort followed by list indexing."""
+    sorted_values = list(sorted(values))
+    left, right = utils.interval(sorted_values)
+    center = utils.median(sorted_values)
+    return utils.round_repr(center, left, right, padding=padding)
+
+
+def bench(fn, *args, repeat=3):
+    number = 1
+    return min(timeit.repeat(lambda: fn(*args), number=number, repeat=repeat)) / number
+
+
+def uncached_human_lookup(units):
+    """The previous implementation, which works out the dimensionality every time."""
+    return core.human.get(units.dimensionality)
+
+
+def main():
+    q = sf.Q(1.0, "kWh/day")
+    number = 10_000
+    for name, fn in [
+        ("previous human_lookup", lambda: uncached_human_lookup(q.units)),
+        ("core.human_lookup", lambda: core.human_lookup(q)),
+    ]:
+        time = min(timeit.repeat(fn, number=number, repeat=3))
+        print(f"{name:24}{1e6 * time / number:10.2f} us")
+    for n in [200_000, 20_000_000]:
+        q = sf.lognormal(1.0, 10.0, units="m", n=n)
+        print(f"N={n:,}")
+        print(f"  utils.summary    {1e3 * bench(utils.summary, q.magnitude):10.2f} ms")
+        print(f"  api.plain_repr   {1e3 * bench(api.plain_repr, q):10.2f} ms")
+        print(f"  api.html_repr    {1e3 * bench(api.html_repr, q):10.2f} ms")
+        if n <= 1_000_000:
+            legacy = bench(sorted_repr, q.magnitude) + bench(
+                np.quantile, q.magnitude, [0.16, 0.5, 0.84]
+            )
+            print(f"  previous repr    {1e3 * legacy:10.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
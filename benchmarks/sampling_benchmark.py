@@ -0,0 +1,42 @@
+"""Benchmark drawing samples on a pool of workers.
+
+Usage:
+    python benchmarks/sampling_benchmark.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import sampling
+
+
+def main():
+    seed = np.random.SeedSequence(0)
+    for n in [200_000, 10_000_000]:
+        print(f"N={n:,}")
+        legacy = min(timeit.repeat(lambda: np.random.randn(n), number=1, repeat=3))
+        print(f"  np.random.randn            {1e3 * legacy:10.2f} ms")
+        reference = sampling.fill(seed, "standard_normal", n)
+        for backend in ["thread", "process"]:
+            for workers in [1, 2, 4, 8]:
+                if workers == 1 and backend == "process":
+                    continue
+                fn = lambda: sampling.fill(
+                    seed, "standard_normal", n, workers=workers, backend=backend
+                )
+                fn()
+                t = min(timeit.repeat(fn, number=1, repeat=3))
+                same = np.array_equal(fn(), reference)
+                print(
+                    f"  {backend:8s} workers={workers}     {1e3 * t:10.2f} ms"
+                    f"  identical={same}"
+                )
+
+
+if __name__ == "__main__":
+    main()
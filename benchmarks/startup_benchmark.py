@@ -0,0 +1,46 @@
+"""Benchmark the time to import simplefermi and to first use its constants.
+
+Usage:
+    python benchmarks/startup_benchmark.py
+"""
+
+import os
+import subprocess
+import sys
+import timeit
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+
+def run(code, repeat=5):
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    fn = lambda: subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    return min(timeit.repeat(fn, number=1, repeat=repeat))
+
+
+def main():
+    baseline = run("import pint, numpy")
+    print(f"import pint, numpy       {1e3 * baseline:10.2f} ms")
+    t = run("import simplefermi")
+    print(f"import simplefermi       {1e3 * t:10.2f} ms")
+    t = run("import simplefermi; simplefermi.G")
+    print(f"  + first use of G       {1e3 * t:10.2f} ms")
+    code = (
+        "import resource, simplefermi;"
+        "print(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)"
+    )
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    rss = subprocess.run(
+        [sys.executable, "-c", code], env=env, capture_output=True, text=True
+    ).stdout
+    print(f"peak memory after import {int(rss) / 1024:10.1f} MB")
+
+    import simplefermi
+
+    t = min(timeit.repeat(lambda: simplefermi.G, number=1000, repeat=3)) / 1000
+    print(f"cached access to G       {1e6 * t:10.2f} us")
+
+
+if __name__ == "__main__":
+    main()
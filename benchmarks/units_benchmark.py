@@ -0,0 +1,57 @@
+"""Benchmark the cost of the unit bookkeeping in arithmetic on quantities.
+
+Usage:
+    python benchmarks/units_benchmark.py
+"""
+
+import os
+import sys
+import timeit
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import core
+
+Q = core.Q
+
+
+def bench(fn, number=200, repeat=5):
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def main():
+    for n in [100, 100_000]:
+        a = Q(np.linspace(1, 2, n), "m")
+        b = Q(np.linspace(2, 3, n), "cm")
+        t = Q(np.linspace(3, 4, n), "s")
+        d = Q(np.linspace(4, 5, n), "m")
+
+        def chain(a, b, t):
+            return (a * b / t + a * a / t) ** 2 / (a + b) ** 3
+
+        cases = [
+            ("a * t", lambda: a * t),
+            ("a * b (reduced)", lambda: a * b),
+            ("a / d (dimensionless)", lambda: a / d),
+            ("a + b", lambda: a + b),
+            ("a ** 2", lambda: a**2),
+            ("2.0 * a", lambda: 2.0 * a),
+            ("chain", lambda: chain(a, b, t)),
+        ]
+        fast_chain = core.kernel(chain)
+        print(f"N={n:,}")
+        for name, fn in cases:
+            core.fast_units(False)
+            before = bench(fn)
+            core.fast_units(True)
+            after = bench(fn)
+            print(f"  {name:24} {1e6 * before:10.1f} us {1e6 * after:10.1f} us")
+        print(
+            f"  {'chain as a kernel':24} {'':13} {1e6 * bench(lambda: fast_chain(a, b, t)):10.1f} us"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,6 +1,34 @@
 from simplefermi.core import *
 from simplefermi.library import *
 from simplefermi.distributions import *
+from simplefermi.config import *
+from simplefermi.graph import *
+from simplefermi.sampling import *
 from simplefermi.api import *
+from simplefermi.streaming import *
+from simplefermi.storage import *
+from simplefermi.serialize import *
+from simplefermi.convergence import *
 
-__all__ = ["library", "distributions", "api", "core"]
+__all__ = [
+    "library",
+    "distributions",
+    "api",
+    "core",
+    "config",
+    "graph",
+    "sampling",
+    "streaming",
+    "storage",
+    "serialize",
+    "convergence",
+]
+
+
+def __getattr__(name):
+    # The uncertain constants and most units are only created on first use.
+    return getattr(library, name)
+
+
+def __dir__():
+    return sorted(set(globals()) | set(dir(library)))
@@ -1,8 +1,23 @@
 import IPython
+from traitlets.config import Config
 
+import simplefermi
 from .core import *
 from .library import *
 from .distributions import *
 from .api import *
 
-IPython.embed(colors="neutral")
+
+class Namespace(dict):
+    """The interactive namespace, which falls back on the lazily created constants and units."""
+
+    def __missing__(self, name):
+        try:
+            return getattr(simplefermi, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+
+config = Config()
+config.InteractiveShell.colors = "neutral"
+IPython.start_ipython(argv=[], user_ns=Namespace(globals()), config=config)
@@ -2,10 +2,10 @@ import pint
 from io import BytesIO
 from termcolor import colored
 import numpy as np
-import matplotlib.units
 import base64
-from PIL import Image
+import sys
 
+from simplefermi import config
 from simplefermi import core
 from simplefermi import library
 from simplefermi import utils
@@ -18,19 +18,31 @@ P = utils.P
 u = core.ureg
 
 
+def _summary(q: pint.Quantity):
+    """The formatted median and interval of a quantity, the interval is None if there is no spread.
+
+    Anything with a `summary` method, like a streamed result, is summarized by it instead.
+    """
+    if hasattr(q, "summary"):
+        mid, low, high = q.summary()
+    else:
+        mid, low, high = utils.summary(q.magnitude)
+    if high - low:
+        return utils.round_repr(mid, low, high)
+    return mid, None, None
+
+
 def repr(q: pint.Quantity) -> str:
-    low, mid, high = np.quantile(q.magnitude, [(1 - P) / 2, 0.5, 1 - (1 - P) / 2])
-    rg = high - low
+    mid, low, high = _summary(q)
 
     result = f"{mid}"
 
-    if rg:
-        mid, low, high = utils.repr(q.magnitude)
+    if low is not None:
         result = f"{mid}" + colored(f" ({low} to {high})", "green")
 
     result = result + colored(f" [{q.units:~P}]", "blue")
 
-    human_name = core.human_lookup(q.units)
+    human_name = core.human_lookup(q)
     if human_name:
         result = result + colored(f" {{{human_name}}}", "yellow")
 
@@ -38,18 +50,16 @@ def repr(q: pint.Quantity) -> str:
 
 
 def html_repr(q: pint.Quantity) -> str:
-    low, mid, high = np.quantile(q.magnitude, [(1 - P) / 2, 0.5, 1 - (1 - P) / 2])
-    rg = high - low
+    mid, low, high = _summary(q)
 
     result = f"{mid}"
 
-    if rg:
-        mid, low, high = utils.repr(q.magnitude)
+    if low is not None:
         result = f"{mid}" + f"<font color='green'> ({low} to {high})</font>"
 
     result = result + f"<font color='blue'> [{q.units:~P}]</font>"
 
-    human_name = core.human_lookup(q.units)
+    human_name = core.human_lookup(q)
     if human_name:
         result = result + f"<font color='orange'> {{{human_name}}}</font>"
 
@@ -57,18 +67,16 @@ def html_repr(q: pint.Quantity) -> str:
 
 
 def plain_repr(q: pint.Quantity) -> str:
-    low, mid, high = np.quantile(q.magnitude, [(1 - P) / 2, 0.5, 1 - (1 - P) / 2])
-    rg = high - low
+    mid, low, high = _summary(q)
 
     result = f"{mid}"
 
-    if rg:
-        mid, low, high = utils.repr(q.magnitude)
+    if low is not None:
         result = f"{mid}" + f" ({low} to {high})"
 
     result = result + f" [{q.units:~}]"
 
-    human_name = core.human_lookup(q.units)
+    human_name = core.human_lookup(q)
     if human_name:
         result = result + f" {{{human_name}}}"
 
@@ -84,7 +92,7 @@ core.ureg.Quantity.__repr__ = plain_repr
 core.ureg.Quantity._repr_pretty_ = _repr_pretty_
 
 
-class QuantityConverter(matplotlib.units.ConversionInterface):
+class QuantityConverter:
     @staticmethod
     def convert(value, unit, axis):
         "Convert a datetime value to a scalar or array."
@@ -93,6 +101,8 @@ class QuantityConverter(matplotlib.units.ConversionInterface):
     @staticmethod
     def axisinfo(unit, axis):
         "Return major and minor tick locators and formatters."
+        import matplotlib.units
+
         return matplotlib.units.AxisInfo(label=str(unit))
 
     @staticmethod
@@ -101,39 +111,100 @@ class QuantityConverter(matplotlib.units.ConversionInterface):
         return x.to_base_units().units
 
 
-matplotlib.units.registry[core.ureg.Quantity] = QuantityConverter()
+def _register_converter():
+    import matplotlib.units
+
+    matplotlib.units.registry[core.ureg.Quantity] = QuantityConverter()
+
+
+def _pyplot():
+    """Imports pyplot, matplotlib is only imported once something is drawn with it."""
+    import matplotlib.pyplot
+
+    _register_converter()
+    return matplotlib.pyplot
+
+
+if "matplotlib" in sys.modules:
+    _register_converter()
+
+
+def set_plots(kind):
+    """Sets whether quantities are displayed with "svg" (the default) or "png" dotplots.
+
+    The svg dotplots are drawn without matplotlib and are much smaller in a
+    saved notebook, the png ones are drawn with matplotlib.
+    """
+    config.update(plots=kind)
+
+
+def _label(q) -> str:
+    label = f"{q.units:~P}"
+    human_name = core.human_lookup(q)
+    if human_name:
+        label = label + f" {{{human_name}}}"
+    return label
 
 
 def dotplot(q, quantiles=20, log=False, width=None, **circle_kwargs):
-    if isinstance(q, core.ureg.Quantity):
-        fig, axs = dotplots.dotplot(q.magnitude, quantiles, log, width, **circle_kwargs)
-        label = f"{q.units:~P}"
-        human_name = core.human_lookup(q.units)
-        if human_name:
-            label = label + f" {{{human_name}}}"
-        axs.set_xlabel(label)
+    _register_converter()
+    if isinstance(q, core.ureg.Quantity) or hasattr(q, "quantile"):
+        values = q.magnitude if isinstance(q, core.ureg.Quantity) else q
+        fig, axs = dotplots.dotplot(values, quantiles, log, width, **circle_kwargs)
+        axs.set_xlabel(_label(q))
     else:
         fig, axs = dotplots.dotplot(q, quantiles, log, width, **circle_kwargs)
     return fig, axs
 
 
-def _plotter(q: core.ureg.Quantity):
-    with BytesIO() as b, matplotlib.pyplot.ioff():
-        fig, axs = dotplot(q)
+def svgplot(q, quantiles=20, log=False, width=None, **options) -> str:
+    """A dotplot of a quantity as the text of an SVG image, drawn without matplotlib."""
+    if isinstance(q, core.ureg.Quantity) or hasattr(q, "quantile"):
+        values = q.magnitude if isinstance(q, core.ureg.Quantity) else q
+        return dotplots.svg(values, quantiles, log, width, label=_label(q), **options)
+    return dotplots.svg(q, quantiles, log, width, **options)
+
+
+# Rendered plots and html, keyed by a fingerprint of the samples, the units and
+# the plot options.  Notebooks ask for several mimetypes for every display and
+# redisplay the same quantities often.
+render_cache = utils.LRUCache(maxsize=128)
+
+
+def _cached(output, q, render, **options):
+    magnitude = getattr(q, "magnitude", None)
+    if not isinstance(magnitude, np.ndarray):
+        return render()
+    key = (output, utils.fingerprint(magnitude), str(q.units), tuple(options.items()))
+    result = render_cache.get(key)
+    if result is None:
+        result = render()
+        render_cache.put(key, result)
+    return result
+
+
+def _render_png(q: core.ureg.Quantity, **options) -> bytes:
+    plt = _pyplot()
+    with BytesIO() as b, plt.ioff():
+        fig, axs = dotplot(q, **options)
         fig.tight_layout()
         fig.savefig(b, format="png")
-        matplotlib.pyplot.close(fig)
+        plt.close(fig)
         return b.getvalue()
 
 
+def _plotter(q: core.ureg.Quantity, **options):
+    return _cached("png", q, lambda: _render_png(q, **options), **options)
+
+
+def _svg(q: core.ureg.Quantity, **options):
+    return _cached("svg", q, lambda: svgplot(q, **options), **options)
+
+
 def plot(q: core.ureg.Quantity):
-    b = BytesIO()
-    with matplotlib.pyplot.ioff():
-        fig, axs = dotplot(q)
-        fig.tight_layout()
-        fig.savefig(b, format="png")
-        matplotlib.pyplot.close(fig)
-        return Image.open(b)
+    from PIL import Image
+
+    return Image.open(BytesIO(_plotter(q)))
 
 
 def build_data_url(mimetype: str, data: bytes) -> str:
@@ -142,13 +213,32 @@ def build_data_url(mimetype: str, data: bytes) -> str:
     return f"data:{mimetype};base64,{str_repr}"
 
 
-def _mime_(q: core.ureg.Quantity):
+def _render_html(q: core.ureg.Quantity, kind) -> str:
+    if kind == "svg":
+        return f"{html_repr(q)}<br>{_svg(q)}"
     plot_bytes = base64.b64encode(_plotter(q))
     data_url = build_data_url("image/png", plot_bytes)
-    return ("text/html", f"{html_repr(q)}<br><img src='{data_url}' />")
+    return f"{html_repr(q)}<br><img src='{data_url}' />"
+
+
+def _mime_(q: core.ureg.Quantity):
+    kind = config.get("plots")
+    return ("text/html", _cached("html", q, lambda: _render_html(q, kind), kind=kind))
+
+
+def _repr_png_(q: core.ureg.Quantity):
+    # Notebooks ask for every format, only draw the kind of plot that is shown.
+    if config.get("plots") == "png":
+        return _plotter(q)
+
+
+def _repr_svg_(q: core.ureg.Quantity):
+    if config.get("plots") == "svg":
+        return _svg(q)
 
 
 core.ureg.Quantity.plot = plot
-core.ureg.Quantity._repr_png_ = _plotter
+core.ureg.Quantity._repr_png_ = _repr_png_
+core.ureg.Quantity._repr_svg_ = _repr_svg_
 core.ureg.Quantity._mime_ = _mime_
 core.ureg.Quantity._repr_html_ = lambda self: _mime_(self)[1]
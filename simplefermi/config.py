@@ -0,0 +1,137 @@
+"""Global and context-scoped settings that control how samples are generated."""
+
+import contextlib
+import contextvars
+import os
+
+import numpy as np
+
+__all__ = ["samples", "set_samples"]
+
+N = 200_000
+
+_defaults = {
+    "samples": N,
+    "dtype": np.dtype(np.float64),
+    "lazy": False,
+    "workers": 1,
+    "backend": "thread",
+    "plots": "svg",
+    "storage": "memory",
+    "scratch": None,
+    "design": "random",
+    "reduction": "none",
+}
+
+# Settings that can be None, which stands for something else.
+_NULLABLE = {"scratch"}
+
+
+class _Unset:
+    def __repr__(self):
+        return "UNSET"
+
+
+# Stands for a setting that isn't given, since None can be a value.
+UNSET = _Unset()
+
+# Settings made inside a `with` block live in a context variable, so they are
+# local to the current thread or asyncio task and are undone on exit.
+_overrides = contextvars.ContextVar("simplefermi_config", default={})
+
+
+def _validate(name, value):
+    if name not in _defaults:
+        raise KeyError(f"Unknown setting {name!r}.")
+    if value is None:
+        if name in _NULLABLE:
+            return None
+        raise ValueError(f"The {name} setting can't be None.")
+    if name == "samples":
+        value = int(value)
+        if value < 1:
+            raise ValueError(f"Need at least one sample, got {value}.")
+    elif name == "dtype":
+        value = np.dtype(value)
+        if value not in (np.float32, np.float64):
+            raise ValueError(f"Samples are stored as float32 or float64, not {value}.")
+    elif name == "lazy":
+        value = bool(value)
+    elif name == "workers":
+        value = int(value)
+        if value < 1:
+            raise ValueError(f"Need at least one worker, got {value}.")
+    elif name == "backend":
+        if value not in ("thread", "process"):
+            raise ValueError(
+                f"Workers are either 'thread' or 'process', not {value!r}."
+            )
+    elif name == "plots":
+        if value not in ("svg", "png"):
+            raise ValueError(f"Plots are either 'svg' or 'png', not {value!r}.")
+    elif name == "storage":
+        if value not in ("memory", "mmap"):
+            raise ValueError(
+                f"Samples are kept in either 'memory' or 'mmap', not {value!r}."
+            )
+    elif name == "scratch":
+        value = os.fspath(value)
+    elif name == "design":
+        if value not in ("random", "sobol", "halton", "lhs"):
+            raise ValueError(
+                "Inputs are drawn 'random'ly or from 'sobol', 'halton' or 'lhs'"
+                f" designs, not {value!r}."
+            )
+    elif name == "reduction":
+        if value not in ("none", "antithetic", "stratified"):
+            raise ValueError(
+                "Variance is reduced with 'antithetic' or 'stratified' draws,"
+                f" or 'none', not {value!r}."
+            )
+    return value
+
+
+def get(name):
+    """Returns the current value of a setting."""
+    overrides = _overrides.get()
+    if name in overrides:
+        return overrides[name]
+    return _defaults[name]
+
+
+def update(**settings):
+    """Changes the global defaults, the settings that are `UNSET` stay as they are."""
+    settings = {k: _validate(k, v) for k, v in settings.items() if v is not UNSET}
+    _defaults.update(settings)
+
+
+@contextlib.contextmanager
+def using(**settings):
+    """Overrides settings for the duration of a `with` block, except the ones that are `UNSET`."""
+    settings = {k: _validate(k, v) for k, v in settings.items() if v is not UNSET}
+    token = _overrides.set({**_overrides.get(), **settings})
+    try:
+        yield
+    finally:
+        _overrides.reset(token)
+
+
+## Samples
+
+
+def set_samples(n=UNSET, dtype=UNSET):
+    """Sets the default number of samples and their storage dtype.
+
+    For example `set_samples(20_000, dtype="float32")` is a quick low resolution
+    mode that uses a twentieth of the default memory.
+    """
+    update(samples=n, dtype=dtype)
+
+
+def samples(n=UNSET, dtype=UNSET):
+    """Context manager that sets the number of samples and their storage dtype.
+
+    >>> with samples(20_000):
+    ...     x = lognormal(1, 10)
+    """
+    return using(samples=n, dtype=dtype)
@@ -0,0 +1,192 @@
+"""Evaluating a model with as many samples as its printed summary needs.
+
+`adaptive` runs a model in batches of growing size and stops once the
+median and interval it would print have settled: when the Monte Carlo
+standard error of each of those quantiles is below a fraction of the last
+digit that `utils.repr_mag` prints, and the printed summary didn't change
+with the last batch.  The standard error of a quantile is found from the
+order statistics around it, without assuming anything about the shape of
+the distribution.
+"""
+
+import functools
+import math
+import sys
+
+import numpy as np
+import pint
+
+from simplefermi import api
+from simplefermi import config
+from simplefermi import graph
+from simplefermi import sampling
+from simplefermi import streaming
+from simplefermi import utils
+from simplefermi.core import ureg
+
+__all__ = ["adaptive"]
+
+eprint = functools.partial(print, file=sys.stderr)
+
+
+def _ranks(size, alpha=utils.ALPHA):
+    """The ranks of the order statistics `utils.summary` reports: low, middle and high."""
+    cut = int(size * alpha / 2.0)
+    if cut < 10:
+        return [0, (size - 1) // 2, size - 1]
+    return [cut, (size - 1) // 2, size - cut]
+
+
+def stderrs(values, alpha=utils.ALPHA):
+    """The Monte Carlo standard errors of the median and the ends of the interval.
+
+    The standard error of the `k`-th order statistic is half the distance
+    between the ones a binomial standard deviation, `sqrt(n p (1 - p))`,
+    below and above it.
+    """
+    values = np.ravel(values)
+    size = values.size
+    bounds = []
+    for k in _ranks(size, alpha):
+        p = (k + 0.5) / size
+        spread = math.sqrt(size * p * (1 - p))
+        bounds += [max(0, math.floor(k - spread)), min(size - 1, math.ceil(k + spread))]
+    if hasattr(values, "order_statistics"):
+        selected = dict(zip(bounds, values.order_statistics(bounds)))
+    else:
+        selected = np.partition(values, bounds)
+    low, mid, high = [
+        0.5 * float(selected[bounds[i + 1]] - selected[bounds[i]]) for i in (0, 2, 4)
+    ]
+    return utils.Summary(mid, low, high)
+
+
+def resolution(summary, padding=2):
+    """The place of the last digit `utils.round_repr` prints for a summary."""
+    mid, low, high = summary
+    return 10.0 ** (utils.magnitude(high - low) - padding + 1)
+
+
+class Estimate:
+    """The samples of one output of an adaptively sized model, with the standard errors of its summary."""
+
+    def __init__(self, value, stderr, converged, history):
+        self.value = value
+        self.stderr = stderr
+        self.converged = converged
+        # (samples, median, low, high, stderr) after every batch.
+        self.history = history
+        if isinstance(value, pint.Quantity):
+            self.units = value.units
+        else:
+            self.units = ureg.dimensionless
+
+    @property
+    def magnitude(self):
+        if isinstance(self.value, pint.Quantity):
+            return self.value.magnitude
+        return self.value
+
+    @property
+    def n(self):
+        return np.size(self.magnitude)
+
+    def summary(self, alpha=utils.ALPHA):
+        return utils.summary(self.magnitude, alpha)
+
+    def __repr__(self):
+        return api.plain_repr(self)
+
+    def _repr_pretty_(self, printer, cycle):
+        printer.text(api.repr(self))
+
+    def _repr_html_(self):
+        return api.html_repr(self)
+
+
+class _Output:
+    """The batches of samples of one output."""
+
+    def __init__(self):
+        self.units = None
+        self.batches = []
+        self.history = []
+        self.printed = None
+        self.stable = False
+
+    def add(self, value):
+        if isinstance(value, pint.Quantity):
+            if self.units is None:
+                self.units = value.units
+            value = value.to(self.units).magnitude
+        self.batches.append(np.ravel(value))
+
+    def check(self, tolerance):
+        values = np.concatenate(self.batches)
+        self.batches = [values]
+        summary = utils.summary(values)
+        errors = stderrs(values)
+        printed = utils.round_repr(*summary)
+        step = resolution(summary)
+        self.stable = printed == self.printed and max(errors) <= tolerance * step
+        self.printed = printed
+        self.history.append((values.size, *summary, errors))
+        return self.stable
+
+    def estimate(self):
+        values = self.batches[0]
+        if self.units is not None:
+            values = ureg.Quantity(values, self.units)
+        return Estimate(values, self.history[-1][-1], self.stable, self.history)
+
+
+def _report(outputs, estimates):
+    for (key, output), (_, estimate) in zip(outputs, streaming._flatten(estimates)):
+        name = "" if key is None else f"{key}: "
+        mid, low, high = output.history[-1][-1]
+        eprint(
+            f"{name}n={estimate.n:,} {api.plain_repr(estimate)}"
+            f" ± {mid:.2g} ({low:.2g} to {high:.2g})"
+        )
+
+
+def adaptive(model, tolerance=0.5, start=2_000, max_samples=None, verbose=False):
+    """Evaluates `model` with more and more samples until its printed summary settles.
+
+    >>> def model():
+    ...     return logstudent(1, 10, df=2) * percent(20)
+    >>> adaptive(model)
+
+    `model` is a function of no arguments that builds the model from the
+    distributions, like for `stream`, and is called with the sample count
+    set to the size of each batch.  The first batch has `start` samples and
+    every further one as many as all before it, until the standard errors
+    of the median and interval of every output are below `tolerance` times
+    the last digit that is printed, or `max_samples` (fifty times the
+    default sample count) are drawn.  Returns an `Estimate` for each output,
+    in the same structure as the model returns them.
+    """
+    if max_samples is None:
+        max_samples = 50 * config.get("samples")
+    outputs = template = None
+    done = 0
+    while True:
+        size = min(max(start, done), max_samples - done)
+        # Each batch gets its own seed, so the library's constants are drawn
+        # again for it rather than repeating those of the batch before.
+        with config.samples(size), sampling.seeded(sampling.spawn()):
+            values = model()
+        if outputs is None:
+            template = values
+            outputs = [(k, _Output()) for k, _ in streaming._flatten(values)]
+        for (_, output), (_, value) in zip(outputs, streaming._flatten(values)):
+            output.add(graph.evaluate(value))
+        done += size
+        stable = [output.check(tolerance) for _, output in outputs]
+        estimates = streaming._unflatten(
+            template, [(k, output.estimate()) for k, output in outputs]
+        )
+        if verbose:
+            _report(outputs, estimates)
+        if all(stable) or done >= max_samples:
+            return estimates
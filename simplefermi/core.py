@@ -1,5 +1,12 @@
+import functools
+import math
+import operator
+
+import numpy as np
 import pint
 
+from simplefermi import utils
+
 ureg = pint.UnitRegistry(auto_reduce_dimensions=True)
 
 Quantity = ureg.Quantity
@@ -13,12 +20,328 @@ def make(s):
 
 ## Human
 
+# Human names of dimensionalities, and the units that are named after them.
 human = {}
+named = {}
+
+# The human names of units and the best named units for dimensionalities,
+# worked out once for every units container that is displayed.
+_human_names = utils.LRUCache(maxsize=4096)
+_best_units = utils.LRUCache(maxsize=4096)
+_MISSING = object()
+
+
+def _container(q):
+    """The units container of a unit or quantity."""
+    units = getattr(q, "_units", None)
+    return q.units._units if units is None else units
 
 
 def human_lookup(q: pint.Unit) -> str:
-    return human.get(q.dimensionality)
+    units = _container(q)
+    name = _human_names.get(units, _MISSING)
+    if name is _MISSING:
+        name = human.get(ureg._get_dimensionality(units))
+        _human_names.put(units, name)
+    return name
 
 
 def store(quantity: pint.Unit, name):
     human[quantity.dimensionality] = name
+    _human_names.clear()
+
+
+def name_unit(unit: pint.Unit):
+    """Makes `unit` the one that `best_unit` proposes for its dimensionality."""
+    named[unit.dimensionality] = ureg.Unit(_container(unit))
+    _best_units.clear()
+
+
+def _score(dimensionality):
+    return sum(abs(e) for e in dimensionality.values())
+
+
+def _best_unit(dimensionality):
+    if dimensionality in named:
+        return named[dimensionality]
+    # A single dimension to the first power has a named base unit.
+    base = {
+        next(iter(d)): u for d, u in named.items() if len(d) == 1 and _score(d) == 1
+    }
+    if any(d not in base for d in dimensionality):
+        return None
+    # Otherwise the named unit (or its inverse) that leaves the fewest base
+    # units to make up the rest, if that beats base units alone.  Of those
+    # that leave as many, the one that covers the most is preferred.
+    best, score = None, (_score(dimensionality), -math.inf)
+    for d, unit in named.items():
+        if len(d) < 2:
+            continue
+        for power in (1, -1):
+            rest = dimensionality / d**power
+            if any(x not in base for x in rest):
+                continue
+            candidate = (_score(rest) + 1, -_score(d))
+            if candidate < score:
+                best, score = (unit, power, rest), candidate
+    if best is None:
+        unit = ureg.Unit("")
+        for d, e in dimensionality.items():
+            unit = unit * base[d] ** e
+        return unit
+    unit, power, rest = best
+    unit = unit**power
+    for d, e in rest.items():
+        unit = unit * base[d] ** e
+    return unit
+
+
+def best_unit(q):
+    """The simplest unit made of named units for the dimensionality of a unit or quantity.
+
+    This is the unit named after the dimensionality if there is one, `kg m^2
+    s^-3` is best expressed in `W`, otherwise a named unit times base units,
+    like `W / m^2`, or the base units alone.  None if the dimensionality has
+    dimensions without a named unit.
+
+        >>> q.to(best_unit(q))
+    """
+    dimensionality = ureg._get_dimensionality(_container(q))
+    unit = _best_units.get(dimensionality, _MISSING)
+    if unit is _MISSING:
+        unit = _best_unit(dimensionality)
+        _best_units.put(dimensionality, unit)
+    return unit
+
+
+## Fast units
+#
+# pint works out the units of every result from scratch, and with
+# `auto_reduce_dimensions` it looks for units to cancel after every multiply
+# and divide.  For arrays of samples that bookkeeping costs far more than the
+# arithmetic.  The outcome only depends on the units of the operands, so it
+# is worked out once, by letting pint do the operation on quantities of
+# magnitude one, and remembered: the units of the result and the factor its
+# magnitude gets scaled by.  Anything unusual, like offset units, operands
+# that aren't numbers or arrays, or integer arrays that would need a
+# fractional factor, goes through pint as before.
+
+unit_rules = utils.LRUCache(maxsize=4096)
+
+_FALLBACK = object()
+_NUMBERS = (int, float, np.generic, np.ndarray)
+_UFUNCS = {operator.add: np.add, operator.sub: np.subtract}
+
+_mul_div = ureg.Quantity._mul_div
+_add_sub = ureg.Quantity._add_sub
+_pow = ureg.Quantity.__pow__
+
+
+def _new(cls, magnitude, units):
+    inst = object.__new__(cls)
+    inst._magnitude = magnitude
+    inst._units = units
+    return inst
+
+
+def _multiplicative(units):
+    return not Q(1.0, units)._get_non_multiplicative_units()
+
+
+def _mul_div_rule(units_op, units, other_units):
+    """The units and the conversion factor (None if there is none) of a product or quotient."""
+    if not _multiplicative(units) or not (
+        other_units is None or _multiplicative(other_units)
+    ):
+        return _FALLBACK
+    raw = units_op(units, ureg.UnitsContainer() if other_units is None else other_units)
+    probe = _new(Q, 1.0, raw)
+    if ureg.autoconvert_to_preferred:
+        return _FALLBACK
+    if not ureg.auto_reduce_dimensions:
+        return raw, None, None
+    probe.ito_reduced_units()
+    if probe._units == raw:
+        return raw, None, None
+    # Pint keeps integers integers when the conversion factor is a whole number.
+    whole = _new(Q, 1, raw)
+    whole.ito_reduced_units()
+    whole = whole._magnitude if isinstance(whole._magnitude, int) else None
+    return probe._units, probe._magnitude, whole
+
+
+def _add_sub_rule(units, other_units):
+    """The factor (and whole factor) that converts `other_units` to `units` for a sum or difference.
+
+    None if the units are the same.
+    """
+    a, b = Q(1.0, units), Q(1.0, other_units)
+    if a._get_non_multiplicative_units() or b._get_non_multiplicative_units():
+        return _FALLBACK
+    if a._get_delta_units() and not b._get_delta_units():
+        return _FALLBACK
+    if a.dimensionality != b.dimensionality:
+        return _FALLBACK
+    if units == other_units:
+        return None
+    # Pint keeps integers integers when the conversion factor is a whole number.
+    whole = _add_sub(Q(0, units), Q(1, other_units), operator.add)._magnitude
+    whole = whole if isinstance(whole, int) else None
+    return b.to(units)._magnitude, whole
+
+
+def _rule(key, make, *args):
+    rule = unit_rules.get(key, _MISSING)
+    if rule is _MISSING:
+        rule = make(*args)
+        unit_rules.put(key, rule)
+    return rule
+
+
+def _is_integer(magnitude):
+    if isinstance(magnitude, np.ndarray):
+        return magnitude.dtype.kind in "iu"
+    return isinstance(magnitude, (int, np.integer)) and not isinstance(magnitude, bool)
+
+
+def _fast_mul_div(self, other, magnitude_op, units_op=None):
+    if units_op is None:
+        units_op = magnitude_op
+    cls = type(self)
+    if type(other) is cls:
+        other_units, other_magnitude = other._units, other._magnitude
+    elif isinstance(other, _NUMBERS) and not isinstance(other, bool):
+        other_units, other_magnitude = None, other
+    else:
+        return _mul_div(self, other, magnitude_op, units_op)
+    rule = _rule(
+        ("muldiv", units_op, self._units, other_units),
+        _mul_div_rule,
+        units_op,
+        self._units,
+        other_units,
+    )
+    if rule is _FALLBACK:
+        return _mul_div(self, other, magnitude_op, units_op)
+    units, factor, whole = rule
+    magnitude = magnitude_op(self._magnitude, other_magnitude)
+    if factor is not None:
+        if whole is not None and _is_integer(magnitude):
+            magnitude = magnitude * whole
+        elif isinstance(magnitude, np.ndarray) and magnitude.dtype.kind in "iu":
+            # Pint scales integer arrays in place, which fails for a
+            # fractional factor, so pint gets to raise that error.
+            return _mul_div(self, other, magnitude_op, units_op)
+        elif isinstance(magnitude, np.ndarray) and magnitude.dtype.kind == "f":
+            # The same as pint's conversion, which scales arrays in place.
+            magnitude *= factor
+        else:
+            magnitude = magnitude * factor
+    return _new(cls, magnitude, units)
+
+
+def _fast_add_sub(self, other, op):
+    if type(other) is not type(self):
+        return _add_sub(self, other, op)
+    rule = _rule(
+        ("addsub", self._units, other._units),
+        _add_sub_rule,
+        self._units,
+        other._units,
+    )
+    if rule is _FALLBACK:
+        return _add_sub(self, other, op)
+    magnitude = other._magnitude
+    if rule is None:
+        magnitude = op(self._magnitude, magnitude)
+    else:
+        factor, whole = rule
+        if whole is not None and _is_integer(magnitude):
+            magnitude = magnitude * whole
+        else:
+            magnitude = magnitude * factor
+        ufunc = _UFUNCS.get(op)
+        if (
+            ufunc is not None
+            and type(magnitude) is np.ndarray
+            and np.result_type(self._magnitude, magnitude) == magnitude.dtype
+            and np.broadcast_shapes(np.shape(self._magnitude), magnitude.shape)
+            == magnitude.shape
+        ):
+            # The converted copy is ours, so the result can reuse it.
+            magnitude = ufunc(self._magnitude, magnitude, out=magnitude)
+        else:
+            magnitude = op(self._magnitude, magnitude)
+    return _new(type(self), magnitude, self._units)
+
+
+def _fast_pow(self, other):
+    if (
+        not isinstance(other, (int, float))
+        or isinstance(other, bool)
+        or other in (0, 1)
+        or not _rule(("mult", self._units), _multiplicative, self._units)
+    ):
+        return _pow(self, other)
+    units = _rule(("pow", self._units, other), operator.pow, self._units, other)
+    return _new(type(self), self._magnitude**other, units)
+
+
+def fast_units(enabled=True):
+    """Turns the cached unit arithmetic of quantities on or off."""
+    ureg.Quantity._mul_div = _fast_mul_div if enabled else _mul_div
+    ureg.Quantity._add_sub = _fast_add_sub if enabled else _add_sub
+    ureg.Quantity.__pow__ = _fast_pow if enabled else _pow
+
+
+fast_units()
+
+
+def _kernel_rule(fn, args, units):
+    """The root unit scales of the arguments, and the units and root unit scale of the result."""
+    if not all(u is None or _multiplicative(u) for u in units):
+        return _FALLBACK
+    scales = [None if u is None else ureg.get_root_units(u)[0] for u in units]
+    probe = fn(*[a if u is None else Q(1.0, u) for a, u in zip(args, units)])
+    if not isinstance(probe, Q):
+        return scales, None, None
+    if not _multiplicative(probe._units):
+        return _FALLBACK
+    return scales, probe._units, ureg.get_root_units(probe._units)[0]
+
+
+def kernel(fn):
+    """Decorates an elementwise function of quantities to run on bare magnitudes.
+
+    The first call with arguments in some units runs `fn` on quantities of
+    magnitude one to find the units of its result.  After that `fn` gets the
+    magnitudes of its arguments in root units, as plain numbers and arrays,
+    and the units are attached once to what it returns.  Everything with
+    units has to come in through the arguments, and the units of the result
+    can only depend on the units of the arguments.
+
+        >>> @kernel
+        ... def energy(m, v):
+        ...     return 0.5 * m * v**2
+    """
+
+    @functools.wraps(fn)
+    def wrapped(*args):
+        units = tuple(a._units if isinstance(a, Q) else None for a in args)
+        rule = _rule((wrapped, units), _kernel_rule, fn, args, units)
+        if rule is _FALLBACK:
+            return fn(*args)
+        scales, out, factor = rule
+        result = fn(
+            *[
+                a if s is None else a._magnitude if s == 1 else a._magnitude * s
+                for a, s in zip(args, scales)
+            ]
+        )
+        if out is None:
+            return result
+        if factor != 1:
+            result = result / factor
+        return _new(Q, result, out)
+
+    return wrapped
@@ -0,0 +1,284 @@
+"""A persistent cache of the results of slow fermi blocks.
+
+Results are stored in a SQLite database: the html of a block's outputs, and
+the values it bound, as their magnitudes and their units.  Large samples are
+quantized to 16 bits, which makes them four times smaller, and the bytes of
+every array are shuffled so that the parts that compress can be compressed.
+
+An entry is keyed by a hash of the block's code, of the keys of the blocks
+that bound the names it uses, of the seed and of the sample policy.  The
+notebook runs every block seeded from its key, so the key determines the
+result, and a block can be restored without knowing the values of the blocks
+above it.  Only blocks that took at least `min_seconds` to run are stored,
+since for anything quicker reading the samples back takes longer than
+drawing them again.  The database is kept under `max_bytes` by evicting the
+entries that were used least recently.
+
+Only bindings that are numbers, arrays or quantities are cached; a block that
+defines a function always runs.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+import numpy as np
+import pint
+
+from simplefermi import config
+from simplefermi import sampling
+from simplefermi import serialize
+from simplefermi import utils
+from simplefermi.core import ureg
+
+# Bump this when the rendering or the storage format changes, so that old
+# entries are no longer found.
+VERSION = 2
+
+# Float arrays with at least this many values are stored quantized to BITS bits.
+MIN_QUANTIZED = 1024
+BITS = 16
+
+
+def default_path():
+    """Where the notebook keeps its cache, following the XDG convention."""
+    root = os.environ.get("XDG_CACHE_HOME") or os.path.expanduser("~/.cache")
+    return os.path.join(root, "simplefermi", "notebook.sqlite")
+
+
+def key(code, inputs):
+    """The key of a block's result, from its code and where the values it reads come from.
+
+    `inputs` maps the names the block uses to the keys of the blocks that
+    bound them, or to None for the names that come from the library.
+    """
+    description = {
+        "version": VERSION,
+        "code": code,
+        "inputs": sorted(inputs.items()),
+        "seed": sampling.root_key(),
+        "samples": config.get("samples"),
+        "dtype": config.get("dtype").str,
+        "design": config.get("design"),
+        "reduction": config.get("reduction"),
+        "plots": config.get("plots"),
+    }
+    data = json.dumps(description, sort_keys=True, default=repr).encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def seed(key):
+    """The seed a block with `key` is run with, so that its results only depend on the key."""
+    return np.random.SeedSequence(int(key, 16))
+
+
+def _compress(plane):
+    data = plane.tobytes()
+    # The low bytes of random samples are noise, check a prefix first so
+    # that they aren't run through zlib for nothing.
+    probe = data[:_PROBE]
+    if len(zlib.compress(probe, 1)) > 0.9 * len(probe):
+        return data, False
+    compressed = zlib.compress(data, 1)
+    if len(compressed) > 0.9 * len(data):
+        return data, False
+    return compressed, True
+
+
+_PROBE = 2**14
+
+
+def _encode(array):
+    """The bytes of an array, shuffled into planes of the n-th byte of every value.
+
+    Floats of similar magnitude share their sign and exponent bytes, so those
+    planes compress well while the rest are stored as they are.
+    """
+    array = np.ascontiguousarray(array)
+    planes = array.reshape(-1).view(np.uint8).reshape(-1, array.itemsize).T
+    chunks, layout = [], []
+    for plane in planes:
+        data, compressed = _compress(plane)
+        chunks.append(data)
+        layout.append((len(data), compressed))
+    meta = {"dtype": array.dtype.str, "shape": array.shape, "planes": layout}
+    return b"".join(chunks), meta
+
+
+def _decode(data, meta):
+    dtype = np.dtype(meta["dtype"])
+    planes = []
+    offset = 0
+    for length, compressed in meta["planes"]:
+        chunk = data[offset : offset + length]
+        offset += length
+        planes.append(zlib.decompress(chunk) if compressed else chunk)
+    size = int(np.prod(meta["shape"], dtype=np.int64))
+    shuffled = np.frombuffer(b"".join(planes), dtype=np.uint8)
+    values = shuffled.reshape(dtype.itemsize, size).T.copy().view(dtype)
+    return values.reshape(meta["shape"])
+
+
+_SCALARS = {"bool": bool, "int": int, "float": float, "complex": complex}
+
+
+def _pack(bindings):
+    """The bindings as one blob of bytes and a json description of it."""
+    chunks, description = [], {}
+    offset = 0
+    for name, value in bindings.items():
+        entry = {"units": None, "type": None}
+        if isinstance(value, pint.Quantity):
+            entry["units"] = str(value.units)
+            value = value.magnitude
+        if isinstance(value, (bool, int, float, complex)):
+            entry["type"] = type(value).__name__
+        elif not (isinstance(value, np.ndarray) and value.dtype.kind in "biufc"):
+            return None
+        value = np.asarray(value)
+        if (
+            value.dtype.kind == "f"
+            and value.size >= MIN_QUANTIZED
+            and np.isfinite(value).all()
+        ):
+            codes, entry["quantized"] = serialize.quantize(value.ravel(), BITS)
+            entry["dtype"] = value.dtype.str
+            value = codes.reshape(value.shape)
+        data, entry["array"] = _encode(value)
+        entry["offset"], entry["length"] = offset, len(data)
+        offset += len(data)
+        chunks.append(data)
+        description[name] = entry
+    return b"".join(chunks), json.dumps(description)
+
+
+def _unpack(data, description):
+    bindings = {}
+    for name, entry in json.loads(description).items():
+        start = entry["offset"]
+        value = _decode(data[start : start + entry["length"]], entry["array"])
+        if "quantized" in entry:
+            value = serialize.dequantize(value, entry["quantized"], entry["dtype"])
+        if entry["type"] is not None:
+            value = _SCALARS[entry["type"]](value.item())
+        if entry["units"] is not None:
+            value = ureg.Quantity(value, entry["units"])
+        bindings[name] = value
+    return bindings
+
+
+class DiskCache:
+    """The outputs and bindings of fermi blocks, stored in a SQLite file at `path`.
+
+    Blocks that ran in less than `min_seconds` aren't stored.
+    """
+
+    def __init__(self, path=None, max_bytes=2**28, min_seconds=0.1):
+        self.path = default_path() if path is None else path
+        self.max_bytes = max_bytes
+        self.min_seconds = min_seconds
+        self.hits = 0
+        self.misses = 0
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results ("
+                " key TEXT PRIMARY KEY, output TEXT, bindings BLOB, description TEXT,"
+                " size INTEGER, used REAL)"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS results_used ON results (used)"
+            )
+
+    def get(self, key):
+        """The `(output, bindings)` stored under `key`, or None."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT output, bindings, description FROM results WHERE key = ?",
+                (key,),
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            with self._db:
+                self._db.execute(
+                    "UPDATE results SET used = ? WHERE key = ?", (time.time(), key)
+                )
+        output, data, description = row
+        return output, _unpack(data, description)
+
+    def put(self, key, output, bindings, seconds=None):
+        """Stores a block's result that took `seconds` to run.
+
+        Returns False if the block was too quick to be worth storing, or if
+        its bindings can't be stored.
+        """
+        if seconds is not None and seconds < self.min_seconds:
+            return False
+        packed = _pack(bindings)
+        if packed is None:
+            return False
+        data, description = packed
+        size = len(data) + len(output) + len(description)
+        if size > self.max_bytes:
+            return False
+        with self._lock, self._db:
+            self._db.execute(
+                "INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?)",
+                (key, output, data, description, size, time.time()),
+            )
+            self._evict()
+        return True
+
+    def _evict(self):
+        total = self._size()
+        if total <= self.max_bytes:
+            return
+        rows = self._db.execute("SELECT key, size FROM results ORDER BY used")
+        stale = []
+        for key, size in rows:
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        self._db.executemany("DELETE FROM results WHERE key = ?", stale)
+
+    def _size(self):
+        return self._db.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM results"
+        ).fetchone()[0]
+
+    def __contains__(self, key):
+        with self._lock:
+            row = self._db.execute(
+                "SELECT 1 FROM results WHERE key = ?", (key,)
+            ).fetchone()
+        return row is not None
+
+    def __len__(self):
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def clear(self):
+        with self._lock, self._db:
+            self._db.execute("DELETE FROM results")
+            self.hits = self.misses = 0
+
+    def info(self):
+        """Hits and misses, with the sizes in bytes."""
+        with self._lock:
+            size = self._size()
+        return utils.CacheInfo(self.hits, self.misses, self.max_bytes, size)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
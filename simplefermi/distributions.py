@@ -1,19 +1,33 @@
 """Distributions are simple utility functions to generate random samples of various shapes."""
 
+import hashlib
 import math
 import numpy as np
 from scipy.special import erfinv
 
 from simplefermi.core import Q
+from simplefermi import config
 from simplefermi import utils
+from simplefermi.graph import deferred
+from simplefermi.sampling import draw
 
 from functools import partial
 
-N = 200_000
+N = config.N
 P = utils.P
 
 
+def _samples(n=None):
+    """The number of samples to draw, defaulting to the current `config.samples` policy."""
+    if n is None:
+        return config.get("samples")
+    return n
+
+
 def _unitize(vals, units=None):
+    dtype = config.get("dtype")
+    if vals.dtype.kind == "f" and vals.dtype != dtype:
+        vals = vals.astype(dtype)
     if units is None:
         return vals
     return Q(vals, units)
@@ -26,17 +40,19 @@ def _factor(x):
 ## Normal Distributions
 
 
-def plusminus(mean=0.0, sig=1.0, units=None, n=N):
+@deferred
+def plusminus(mean=0.0, sig=1.0, units=None, n=None):
     """Generates normally distributed random numbers with the given mean and standard deviation."""
-    return _unitize(mean + sig * np.random.randn(n), units)
+    return _unitize(mean + sig * draw("standard_normal", _samples(n)), units)
 
 
-def normal(a, b, units=None, p=P, n=N):
+@deferred
+def normal(a, b, units=None, p=P, n=None):
     """A normal distribution with the given left and right endpoints."""
     mu = 0.5 * (a + b)
     factor = -_factor(0.5 * (1 - p))
     sig = 0.5 * (b - a) / factor
-    return _unitize(mu + sig * np.random.randn(n), units)
+    return _unitize(mu + sig * draw("standard_normal", _samples(n)), units)
 
 
 epsilon = partial(plusminus, mean=0.0, sig=1.0)
@@ -44,17 +60,20 @@ epsilon = partial(plusminus, mean=0.0, sig=1.0)
 ## Rectangles and triangles
 
 
-def uniform(left, right, units=None, n=N):
+@deferred
+def uniform(left, right, units=None, n=None):
     """A uniform, or rectangular distribution from the left to the right."""
-    return _unitize(left + (right - left) * np.random.uniform(size=n), units)
+    return _unitize(left + (right - left) * draw("random", _samples(n)), units)
 
 
-def rectangular(center, width, units=None, n=N):
+@deferred
+def rectangular(center, width, units=None, n=None):
     """A rectangular distribution with the given center and width."""
-    return _unitize(center + width * (2 * np.random.uniform(size=n) - 1), units)
+    return _unitize(center + width * (2 * draw("random", _samples(n)) - 1), units)
 
 
-def triangular(center, width, units=None, right=None, n=N):
+@deferred
+def triangular(center, width, units=None, right=None, n=None):
     """A triangular distribution, with two arguments is center and width and with three is center and left and right endpoint."""
     u = uniform(0, 1, n=n)
     c = center
@@ -78,25 +97,31 @@ def triangular(center, width, units=None, right=None, n=N):
 ## LogNormal
 
 
-def lognormal(a, b, units=None, p=P, n=N):
+@deferred
+def lognormal(a, b, units=None, p=P, n=None):
     """A lognormal distribution with the given endpoints."""
     mu = np.log(np.sqrt(b * a))
     factor = -_factor(0.5 * (1 - p))
     sig = np.log(np.sqrt(b / a)) / factor
-    return _unitize(np.exp(mu + sig * np.random.randn(n)), units)
+    return _unitize(np.exp(mu + sig * draw("standard_normal", _samples(n))), units)
 
 
-def timesdivide(mean, rel_error, units=None, p=P, n=N):
+@deferred
+def timesdivide(mean, rel_error, units=None, p=P, n=None):
     """A number with some relative error."""
     factor = -_factor(0.5 * (1 - p))
     error = rel_error / factor
-    return _unitize(np.exp(np.log(mean) + np.log(error) * np.random.randn(n)), units)
+    return _unitize(
+        np.exp(np.log(mean) + np.log(error) * draw("standard_normal", _samples(n))),
+        units,
+    )
 
 
 ## Helper
 
 
-def to(a, b, units=None, p=P, n=N):
+@deferred
+def to(a, b, units=None, p=P, n=None):
     """Represent a range, uses lognormal if both are positive, normal otherwise."""
     if a > 0 and b > 0:
         return lognormal(a, b, units, p, n)
@@ -107,29 +132,33 @@ def to(a, b, units=None, p=P, n=N):
 ## Student and Gamma
 
 
-def logstudent(a, b, units=None, df=2.0, p=P, n=N):
+@deferred
+def logstudent(a, b, units=None, df=2.0, p=P, n=None):
     """A logstudent distribution with left and right endpoints."""
     mu = np.log(np.sqrt(b * a))
     beta = np.sqrt(0.5 * (1 - p**2)) / p
     sig = beta * np.log(np.sqrt(b / a))
-    return _unitize(np.exp(mu + sig * np.random.standard_t(df, size=n)), units)
+    return _unitize(np.exp(mu + sig * draw("standard_t", _samples(n), df=df)), units)
 
 
-def gamma(a, units=None, n=N):
+@deferred
+def gamma(a, units=None, n=None):
     """Give gamma distributed random numbers."""
-    return _unitize(np.random.gamma(shape=a + 1, size=n), units)
+    return _unitize(draw("gamma", _samples(n), shape=a + 1), units)
 
 
 ## Twiddles
 
 
-def percent(percentage, units=None, p=P, n=N):
+@deferred
+def percent(percentage, units=None, p=P, n=None):
     """Twiddles a result to within the given percentage. A times_divide type distribution."""
     top = 1.0 + percentage / 100.0
-    return _unitize(lognormal(1.0 / top, top, p=p, n=N), units)
+    return _unitize(lognormal(1.0 / top, top, p=p, n=n), units)
 
 
-def db(x=1.0, units=None, p=P, n=N):
+@deferred
+def db(x=1.0, units=None, p=P, n=None):
     """Gives a value with a certain uncertainty in decibels. ten decibels is an order of magnitude, 3 is a factor of 2."""
     return _unitize(lognormal(10 ** (-x / 10.0), 10 ** (x / 10.0), p=p, n=n), units)
 
@@ -137,44 +166,106 @@ def db(x=1.0, units=None, p=P, n=N):
 ## Fractions
 
 
-def beta(a, b, units=None, n=N):
-    return _unitize(np.random.beta(a + 1, b + 1, size=n), units)
+@deferred
+def beta(a, b, units=None, n=None):
+    return _unitize(draw("beta", _samples(n), a=a + 1, b=b + 1), units)
 
 
-def outof(frac, tot, units=None, n=N):
-    return _unitize(np.random.beta(frac + 1, tot - frac + 1, size=n), units)
+@deferred
+def outof(frac, tot, units=None, n=None):
+    return _unitize(draw("beta", _samples(n), a=frac + 1, b=tot - frac + 1), units)
 
 
-def against(a, b, units=None, n=N):
-    return _unitize(np.random.beta(a, b, size=n), units)
+@deferred
+def against(a, b, units=None, n=None):
+    return _unitize(draw("beta", _samples(n), a=a, b=b), units)
 
 
 ## Data based
 
-
-def data(values, weights=None, units=None, n=N):
-    """Bootstraps a finite dataset."""
-    if weights is not None:
-        weights = np.asarray(weights)
-        weights = weights / weights.sum()
-    return _unitize(np.random.choice(values, size=N, replace=True, p=weights), units)
-
-
-def mixture(*dists, weights=None, units=None, n=N):
-    """Create a mixture of several sources."""
+# Alias tables of the weights of datasets, keyed by a hash of the weights, so
+# that constants like `year` and `month` only build theirs once.
+_alias_tables = utils.LRUCache(maxsize=256)
+
+
+def _alias(weights):
+    """The alias table of Vose's method for drawing indices with the given weights.
+
+    Index `i` is kept with probability `keep[i]` and replaced by `alias[i]`
+    otherwise, so a draw takes one uniform number whatever the weights.
+    """
+    weights = np.ascontiguousarray(weights, dtype=np.float64)
+    key = hashlib.blake2b(weights.tobytes(), digest_size=16).digest()
+    table = _alias_tables.get(key)
+    if table is not None:
+        return table
+    if weights.ndim != 1 or not weights.size:
+        raise ValueError("Weights must be a non-empty list of numbers.")
+    total = weights.sum()
+    if not np.isfinite(total) or total <= 0 or (weights < 0).any():
+        raise ValueError("Weights must be non-negative, finite and not all zero.")
+    size = weights.size
+    # Plain lists, since the loop goes over every weight once.
+    scaled = (weights * (size / total)).tolist()
+    keep = [1.0] * size
+    alias = list(range(size))
+    small = [i for i, x in enumerate(scaled) if x < 1.0]
+    large = [i for i, x in enumerate(scaled) if x >= 1.0]
+    while small and large:
+        less, more = small.pop(), large.pop()
+        keep[less] = scaled[less]
+        alias[less] = more
+        scaled[more] -= 1.0 - scaled[less]
+        (small if scaled[more] < 1.0 else large).append(more)
+    # What is left over only differs from one by rounding.
+    table = np.array(keep), np.array(alias, dtype=np.int64)
+    _alias_tables.put(key, table)
+    return table
+
+
+def _indices(size, weights=None, n=None):
+    """Draws `n` indices into `range(size)`, uniformly or with the given weights."""
+    u = draw("random", _samples(n)) * size
+    indices = np.minimum(u.astype(np.int64), size - 1)
     if weights is None:
-        return data([x for d in dists for x in data(d)], units=units, n=n)
-    else:
-        values, weights = zip(
-            *[(x, w) for d, w in zip(dists, weights) for x in data(d)]
-        )
-        return data(values, units=units, weights=weights, n=n)
+        return indices
+    keep, alias = _alias(weights)
+    return np.where(u - indices < keep[indices], indices, alias[indices])
 
 
-def normalfit(values, units=None, n=N):
+@deferred
+def data(values, weights=None, units=None, n=None):
+    """Bootstraps a finite dataset."""
+    values = np.asarray(values)
+    if weights is not None and np.size(weights) != values.size:
+        raise ValueError("There must be one weight for every value.")
+    return _unitize(values[_indices(values.size, weights, n)], units)
+
+
+@deferred
+def mixture(*dists, weights=None, units=None, n=None):
+    """Create a mixture of several sources.
+
+    Each sample comes from one of the sources, chosen with the given weights
+    (or with equal weights), and is drawn from that source's samples.
+    """
+    if weights is not None and len(weights) != len(dists):
+        raise ValueError("There must be one weight for every source.")
+    sources = [np.ravel(d) for d in dists]
+    sizes = np.array([source.size for source in sources])
+    starts = np.cumsum(sizes) - sizes
+    which = _indices(len(sources), weights, n)
+    within = draw("random", which.size) * sizes[which]
+    within = np.minimum(within.astype(np.int64), sizes[which] - 1)
+    return _unitize(np.concatenate(sources)[starts[which] + within], units)
+
+
+@deferred
+def normalfit(values, units=None, n=None):
     return _unitize(plusminus(np.mean(values), np.std(values), n=n), units)
 
 
-def sigfig(s, units=None):
+@deferred
+def sigfig(s, units=None, n=None):
     """Given a number as a string, generate the uniform distribution that accounts for the sigfigs."""
-    return _unitize(plusminus(float(s), 0.5 * utils.sigfig_resolution(s)), units)
+    return _unitize(plusminus(float(s), 0.5 * utils.sigfig_resolution(s), n=n), units)
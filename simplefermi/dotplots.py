@@ -1,71 +1,64 @@
+"""Quantile dotplots, drawn with matplotlib or written directly as SVG.
+
+matplotlib is only imported when a figure is drawn, the binning and the SVG
+renderer only need numpy.
+"""
+
+import html
+import math
+
 import numpy as np
-from matplotlib import patches
-import matplotlib.pyplot as plt
 
 
-def smoothing(v, thres):
-    n = len(v)
-    a = 0
-    b = 1
+def _runs(v):
+    """The start index of each run of equal values in `v`, and the end of the last."""
+    return np.concatenate([[0], np.flatnonzero(v[1:] != v[:-1]) + 1, [len(v)]])
 
-    # get left stack
-    while v[a] == v[b]:
-        b += 1
 
-    while b < n:
-        # get right stack
-        c = b + 1
-        while c < n and v[b] == v[c]:
-            c += 1
+def smoothing(v, thres):
+    """Evens out the heights of adjacent stacks that are closer than `thres`.
 
+    Dots are moved between neighbouring stacks so that their sizes differ by at
+    most one, working from left to right.  Only the stack boundaries are looped
+    over, the dots are moved with slice assignments.
+    """
+    v = np.asarray(v)
+    if len(v) < 2:
+        return v
+    original = v.copy()
+    runs = _runs(original)
+    for a, b, c in zip(runs[:-2], runs[1:-1], runs[2:]):
         # are stacks adjacent?
         # if so, compare sizes and swap as needed
-        if (v[b] - v[b - 1]) < thres:
+        if (original[b] - original[b - 1]) < thres:
             d = b + ((a + c - b - b) >> 1)
-            while d < b:
-                v[d] = v[b]
-                d += 1
-            while d > b:
-                v[d] = v[a]
-                d -= 1
-
-        a = b
-        b = c
-
+            if d < b:
+                v[d:b] = original[b]
+            elif d > b:
+                v[b + 1 : d + 1] = original[a]
     return v
 
 
 def dotbin(array, step, smooth=False, f=None):
-    if f is None:
-
-        def f(x):
-            return x
-
-    n = len(array)
-    v = np.zeros(n)
-
-    i = 0
-    j = 1
-    a = f(array[0])
-    b = a
-    w = a + step
-
-    while j < n:
-        x = f(array[j])
-        if x >= w:
-            b = (a + b) / 2
-            while i < j:
-                v[i] = b
-                i += 1
-            w = x + step
-            a = x
-        b = x
-        j += 1
-
-    b = (a + b) / 2
-    while i < j:
-        v[i] = b
-        i += 1
+    """Greedily bins the sorted `array` into stacks at most `step` wide.
+
+    Each stack starts at the first value not in the previous one and is placed
+    at the midpoint of the values in it.
+    """
+    x = np.asarray(array if f is None else [f(value) for value in array], dtype=float)
+    n = len(x)
+    if not n:
+        return np.zeros(0)
+
+    # Where the bin starting at each value would end, then follow the chain
+    # of bins from the first value.
+    ends = np.searchsorted(x, x + step, side="left")
+    starts = [0]
+    while (end := ends[starts[-1]]) < n:
+        starts.append(end)
+    starts = np.array(starts)
+    stops = np.append(starts[1:], n)
+    v = np.repeat((x[starts] + x[stops - 1]) / 2, stops - starts)
 
     if smooth:
         return smoothing(v, step + step / 4)
@@ -97,6 +90,8 @@ def circle(fig, ax, xy, radius, kwargs=None):
     ctscale = tscale.transform_point(xy)
     cfig = fig.transFigure.inverted().transform(ctscale)
 
+    from matplotlib import patches
+
     # Create circle
     if kwargs is None:
         circ = patches.Ellipse(cfig, radius, radius * pr, transform=fig.transFigure)
@@ -115,47 +110,174 @@ def padinterval(interval, f=0.05):
     return left - f * range, right + f * range
 
 
-def placedots(fig, ax, array, width, **circle_kwargs):
-    last = None
-    height = 0.5 * width
-    # artists = []
-    maxheight = height
-    for value in array:
-        if value == last:
-            height += width
-            if height > maxheight:
-                maxheight = height
-        else:
-            height = 0.5 * width
-            last = value
-        # circle(fig, ax, (value, height), radius=width/2.0)
-        circle = plt.Circle(
-            (value, height),
-            radius=width / 2.0,
-            linewidth=2,
-            edgecolor="k",
-            **circle_kwargs,
-        )
-        ax.add_artist(circle)
-    ax.set_xlim(padinterval((min(array) - width / 2.0, max(array) + width / 2.0)))
-    ax.set_ylim(padinterval((0, maxheight + width / 2.0)))
+def stackheights(array, width):
+    """The height of the center of each dot, stacking equal values on each other."""
+    array = np.asarray(array)
+    runs = _runs(array)[:-1]
+    lengths = np.diff(np.append(runs, len(array)))
+    position = np.arange(len(array)) - np.repeat(runs, lengths)
+    return (position + 0.5) * width
 
 
-def dotplot(arr, quantiles=20, log=False, width=None, figsize=(3, 2), **circle_kwargs):
+def placedots(fig, ax, array, width, **circle_kwargs):
+    from matplotlib import collections
+
+    array = np.asarray(array)
+    heights = stackheights(array, width)
+    circle_kwargs.setdefault("linewidth", 2)
+    circle_kwargs.setdefault("edgecolor", "k")
+    # All of the dots are drawn as a single artist.
+    dots = collections.EllipseCollection(
+        width,
+        width,
+        0,
+        units="xy",
+        offsets=np.column_stack([array, heights]),
+        offset_transform=ax.transData,
+        **circle_kwargs,
+    )
+    ax.add_collection(dots)
+    ax.set_xlim(padinterval((array.min() - width / 2.0, array.max() + width / 2.0)))
+    ax.set_ylim(padinterval((0, heights.max() + width / 2.0)))
+
+
+def dotquantiles(arr, quantiles=20, log=False):
+    """The evenly spaced quantiles of `arr` that are drawn as dots, in log10 if `log`."""
     n = quantiles
     qs = np.arange(0.5 / n, 1, 1 / n)
-    if log:
+    if hasattr(arr, "quantile"):
+        # Summaries like streamed results only give us their quantiles.
+        quantiles = arr.quantile(qs)
+        if log:
+            quantiles = np.log10(quantiles)
+    elif log:
         quantiles = np.quantile(np.log10(arr), qs)
     else:
         quantiles = np.quantile(arr, qs)
+    return quantiles
+
+
+def dotwidth(quantiles):
+    return 5 / 2 * (quantiles.max() - quantiles.min()) / len(quantiles)
+
+
+def dotplot(arr, quantiles=20, log=False, width=None, figsize=(3, 2), **circle_kwargs):
+    import matplotlib.pyplot as plt
+
+    quantiles = dotquantiles(arr, quantiles, log)
 
     fig, axs = plt.subplots(figsize=figsize)
     axs.set_yticks([])
     axs.set_aspect("equal")
 
     if width is None:
-        width = 5 / 2 * (quantiles.max() - quantiles.min()) / n
+        width = dotwidth(quantiles)
     dotlocs = dotbin(quantiles, width, False)
     placedots(fig, axs, dotlocs, width, **circle_kwargs)
 
     return fig, axs
+
+
+## SVG
+
+
+def _ticks(left, right, count=5):
+    """Round numbered ticks between `left` and `right`, and the spacing between them."""
+    raw = (right - left) / count
+    magnitude = 10.0 ** math.floor(math.log10(raw))
+    step = magnitude * min((1, 2, 2.5, 5, 10), key=lambda m: abs(m * magnitude - raw))
+    ticks = np.arange(math.ceil(left / step), math.floor(right / step) + 1) * step
+    return ticks, step
+
+
+def _ticklabel(tick, step):
+    if tick == 0:
+        return "0"
+    if 1e-3 <= abs(tick) < 1e5:
+        decimals = max(0, -math.floor(math.log10(step) + 1e-9))
+        return f"{tick:.{decimals}f}"
+    digits = max(
+        0, math.floor(math.log10(abs(tick))) - math.floor(math.log10(step) + 1e-9)
+    )
+    return f"{tick:.{digits}e}"
+
+
+def svg(
+    arr,
+    quantiles=20,
+    log=False,
+    width=None,
+    label="",
+    size=(300, 200),
+    facecolor="#1f77b4",
+    edgecolor="black",
+    linewidth=2,
+):
+    """A quantile dotplot of `arr` as the text of an SVG image, without matplotlib.
+
+    The dots are placed exactly like `dotplot` places them, with an x axis and
+    `label` below them.  `size` is the largest the image can be in pixels, its
+    height is cropped to the height of the stacks.
+    """
+    quantiles = dotquantiles(arr, quantiles, log)
+    if width is None:
+        width = dotwidth(quantiles)
+    if not width:
+        width = max(abs(quantiles.max()), 1.0) / len(quantiles)
+    dotlocs = dotbin(quantiles, width, False)
+    heights = stackheights(dotlocs, width)
+
+    left, right = padinterval((dotlocs.min() - width / 2, dotlocs.max() + width / 2))
+    bottom, top = padinterval((0, heights.max() + width / 2))
+    margin, axis = 10, 40 if label else 25
+    # Keep the dots round, like `set_aspect("equal")`.
+    scale = min(
+        (size[0] - 2 * margin) / (right - left),
+        (size[1] - margin - axis) / (top - bottom),
+    )
+    plot_width = scale * (right - left)
+    plot_height = scale * (top - bottom)
+    image_width = size[0]
+    image_height = plot_height + margin + axis
+    start = (image_width - plot_width) / 2
+    base = margin + plot_height
+
+    def x(value):
+        return start + scale * (value - left)
+
+    def y(value):
+        return base - scale * (value - bottom)
+
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{image_width:.0f}"'
+        f' height="{image_height:.0f}" viewBox="0 0 {image_width:.1f}'
+        f' {image_height:.1f}" font-family="sans-serif" font-size="10">',
+        f'<g fill="{facecolor}" stroke="{edgecolor}" stroke-width="{linewidth}">',
+    ]
+    radius = scale * width / 2
+    parts.extend(
+        f'<circle cx="{x(value):.2f}" cy="{y(height):.2f}" r="{radius:.2f}"/>'
+        for value, height in zip(dotlocs, heights)
+    )
+    parts.append("</g>")
+
+    parts.append(
+        f'<line x1="{start:.2f}" y1="{base:.2f}" x2="{start + plot_width:.2f}"'
+        f' y2="{base:.2f}" stroke="black"/>'
+    )
+    # About one tick every 60 pixels.
+    ticks, step = _ticks(left, right, count=max(1, round(plot_width / 60)))
+    for tick in ticks:
+        parts.append(
+            f'<line x1="{x(tick):.2f}" y1="{base:.2f}" x2="{x(tick):.2f}"'
+            f' y2="{base + 4:.2f}" stroke="black"/>'
+            f'<text x="{x(tick):.2f}" y="{base + 15:.2f}" text-anchor="middle">'
+            f"{_ticklabel(tick, step)}</text>"
+        )
+    if label:
+        parts.append(
+            f'<text x="{image_width / 2:.2f}" y="{base + 32:.2f}"'
+            f' text-anchor="middle">{html.escape(label)}</text>'
+        )
+    parts.append("</svg>")
+    return "".join(parts)
@@ -0,0 +1,436 @@
+"""Evaluates fermi blocks, the little language of the notebooks.
+
+A block of source is parsed with the tree-sitter grammar and compiled once
+into a `Plan`, a list of python closures, one per statement.  Compiling is
+where all of the work on the syntax happens: operators are looked up,
+literals are converted to numbers and names that refer to units or constants
+are resolved against the library, so running a plan only does the
+arithmetic.  Plans are cached by a hash of their source, so rerunning an
+unchanged block never reparses it.
+
+    >>> plan = compile("x = 1 to 10 m\\nx * 2")
+    >>> outputs, bindings = plan.run()
+
+Names are looked up in the bindings of the block first, then in the bindings
+it was run with (the blocks above it in a notebook), and finally in the
+library of units and constants.
+"""
+
+import collections
+import hashlib
+import operator
+
+import numpy as np
+import pint
+
+from simplefermi import distributions
+from simplefermi import library
+from simplefermi import parser
+from simplefermi import utils
+from simplefermi.core import ureg
+
+# The value of a statement that is shown, `line` counts from zero.
+Output = collections.namedtuple("Output", ["line", "source", "value", "kind"])
+
+_BINARY = {
+    "+": operator.add,
+    "-": operator.sub,
+    "*": operator.mul,
+    "/": operator.truediv,
+    "^": operator.pow,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    ">": operator.gt,
+    "<=": operator.le,
+    ">=": operator.ge,
+    "to": distributions.to,
+    "outof": distributions.outof,
+    # Twiddles a value by a percentage.
+    "%": lambda value, percentage: value * distributions.percent(percentage),
+}
+
+_CONVERSIONS = {"->", "as"}
+
+_UNARY = {
+    "-": operator.neg,
+    "+": operator.pos,
+}
+
+# Functions that can be called from fermi blocks, besides the ones they define.
+BUILTINS = {
+    name: getattr(distributions, name)
+    for name in [
+        "plusminus",
+        "normal",
+        "uniform",
+        "rectangular",
+        "triangular",
+        "lognormal",
+        "timesdivide",
+        "to",
+        "logstudent",
+        "gamma",
+        "percent",
+        "db",
+        "beta",
+        "outof",
+        "against",
+        "normalfit",
+    ]
+}
+BUILTINS.update(
+    sqrt=np.sqrt,
+    exp=np.exp,
+    log=np.log,
+    log10=np.log10,
+    sin=np.sin,
+    cos=np.cos,
+    tan=np.tan,
+    abs=np.abs,
+)
+
+_MISSING = object()
+
+
+class FermiError(ValueError):
+    """An error in a fermi block, with the position it happened at."""
+
+    def __init__(self, message, node=None):
+        if node is not None:
+            line, column = node.start_point
+            message = f"line {line + 1}, column {column + 1}: {message}"
+            self.line = line
+        else:
+            self.line = None
+        super().__init__(message)
+
+
+def _text(node):
+    return node.text.decode("utf-8")
+
+
+def _field(node, name):
+    """The named child in the field, skipping the parentheses that share it."""
+    for child in node.children_by_field_name(name):
+        if child.is_named:
+            return child
+    return None
+
+
+def _syntax_error(node):
+    """The first error or missing node in the tree, if there is one."""
+    if not node.has_error:
+        return None
+    if node.is_missing and not node.type:
+        # The grammar wants a terminator after blocks and definitions, when it
+        # isn't there tree-sitter inserts an empty one and the rest parses fine.
+        return None
+    if node.is_error or node.is_missing:
+        return node
+    for child in node.children:
+        error = _syntax_error(child)
+        if error is not None:
+            return error
+    return None
+
+
+def _resolve(name):
+    """What a name that isn't bound refers to: a unit, a constant or nothing.
+
+    Returns a function of no arguments, the uncertain constants are sampled
+    when they are used so that they follow the sample and seed settings.
+    """
+    if name in library._CONSTANTS or name in library._ALIASES:
+        return lambda: getattr(library, name)
+    value = getattr(library, name, None)
+    if isinstance(value, (pint.Quantity, pint.Unit, int, float)):
+        return lambda: value
+    try:
+        value = ureg(name)
+    except (pint.errors.PintError, ValueError):
+        return None
+    return lambda: value
+
+
+class Function:
+    """A function defined with `func name(params) = body`."""
+
+    def __init__(self, name, parameters, body):
+        self.name = name
+        self.parameters = parameters
+        self.body = body
+        self.env = None
+
+    def __call__(self, *args):
+        if len(args) != len(self.parameters):
+            raise TypeError(
+                f"{self.name} takes {len(self.parameters)} arguments,"
+                f" got {len(args)}."
+            )
+        return self.body(self.env.new_child(dict(zip(self.parameters, args))))
+
+    def __repr__(self):
+        return f"func {self.name}({', '.join(self.parameters)})"
+
+
+class Plan:
+    """A compiled fermi block.
+
+    `defines` are the names it binds and `uses` the names it reads from the
+    bindings it is run with (or from the library), which is what a notebook
+    needs to know to work out which blocks depend on which.
+    """
+
+    def __init__(self, source, steps, defines, uses):
+        self.source = source
+        self.steps = steps
+        self.defines = frozenset(defines)
+        self.uses = frozenset(uses)
+
+    def run(self, env=None):
+        """Runs the block, returns the shown outputs and the names it bound."""
+        scope = collections.ChainMap({}, {} if env is None else env)
+        outputs = []
+        for step in self.steps:
+            output = step(scope)
+            if output is not None:
+                outputs.append(output)
+        return outputs, dict(scope.maps[0])
+
+    def __repr__(self):
+        return f"Plan(defines={sorted(self.defines)}, uses={sorted(self.uses)})"
+
+
+class _Compiler:
+    def __init__(self, source):
+        self.lines = source.splitlines()
+        self.defines = []
+        self.uses = set()
+        # The names bound so far in each enclosing scope.
+        self.scopes = [set()]
+
+    def _bound(self, name):
+        return any(name in scope for scope in self.scopes)
+
+    def _bind(self, name):
+        self.scopes[-1].add(name)
+        if len(self.scopes) == 1 and name not in self.defines:
+            self.defines.append(name)
+
+    def program(self, node):
+        error = _syntax_error(node)
+        if error is not None:
+            raise FermiError(f"can't parse {_text(error)!r}", error)
+        return [self.statement(child) for child in node.named_children]
+
+    def statement(self, node):
+        """A function of the scope that runs the statement and returns its `Output`."""
+        step = self._statement(node)
+
+        def guarded(env):
+            try:
+                return step(env)
+            except FermiError:
+                raise
+            except (pint.errors.PintError, ArithmeticError, TypeError, ValueError) as e:
+                raise FermiError(str(e), node) from e
+
+        return guarded
+
+    def _statement(self, node):
+        line = node.start_point[0]
+        source = self.lines[line] if line < len(self.lines) else ""
+        if node.type == "comment":
+            return lambda env: None
+        if node.type == "assignment":
+            name = _text(_field(node, "id"))
+            expr = self.expression(_field(node, "expr"))
+            self._bind(name)
+
+            def assign(env):
+                env[name] = expr(env)
+
+            return assign
+        if node.type == "functionDeclaration":
+            name = _text(_field(node, "name"))
+            parameters = [
+                _text(child)
+                for child in node.children_by_field_name("parameters")
+                if child.type == "identifier"
+            ]
+            self._bind(name)
+            self.scopes.append(set(parameters))
+            body = self.expression(_field(node, "body"))
+            self.scopes.pop()
+
+            def define(env):
+                function = Function(name, parameters, body)
+                env[name] = function
+                function.env = env
+
+            return define
+        if node.type in ("print", "plot"):
+            expr = self.expression(node.named_children[0])
+            kind = node.type
+            return lambda env: Output(line, source, expr(env), kind)
+        if node.type in ("human", "prefix", "strictPrefix", "help"):
+            raise FermiError(f"{node.type} statements aren't supported yet", node)
+        expr = self.expression(node)
+        return lambda env: Output(line, source, expr(env), "value")
+
+    def expression(self, node):
+        """A function of the scope that evaluates the expression."""
+        method = getattr(self, f"_{node.type}", None)
+        if method is None:
+            raise FermiError(f"unexpected {node.type}", node)
+        return method(node)
+
+    def _integer(self, node):
+        value = int(_text(node))
+        return lambda env: value
+
+    def _real(self, node):
+        value = float(_text(node))
+        return lambda env: value
+
+    def _identifier(self, node):
+        name = _text(node)
+        if not self._bound(name):
+            self.uses.add(name)
+        # Units and constants are looked up once, here, but a binding of the
+        # same name still takes precedence when the plan is run.
+        fallback = _resolve(name)
+
+        def lookup(env):
+            value = env.get(name, _MISSING)
+            if value is not _MISSING:
+                return value
+            if fallback is None:
+                raise FermiError(f"unknown name {name!r}", node)
+            return fallback()
+
+        return lookup
+
+    def _quoted(self, node):
+        name = _text(_field(node, "id"))
+        try:
+            value = ureg(name)
+        except pint.errors.UndefinedUnitError:
+            raise FermiError(f"unknown unit {name!r}", node) from None
+        return lambda env: value
+
+    def _primary(self, node):
+        distribution = _field(node, "distribution")
+        dimension = _field(node, "dimension")
+        if distribution is None:
+            return self.expression(dimension)
+        value = self.expression(distribution)
+        if dimension is None:
+            return value
+        units = self.expression(dimension)
+        return lambda env: value(env) * units(env)
+
+    def _binary(self, node):
+        op_node = node.child_by_field_name("op")
+        left = self.expression(_field(node, "left"))
+        right = self.expression(_field(node, "right"))
+        if op_node is None:
+            # Juxtaposition, like `kg m`, is multiplication.
+            return lambda env: left(env) * right(env)
+        op = _text(op_node)
+        if op in _CONVERSIONS:
+            return lambda env: _convert(left(env), right(env), node)
+        fn = _BINARY.get(op)
+        if fn is None:
+            raise FermiError(f"the operator {op!r} isn't supported yet", op_node)
+        return lambda env: fn(left(env), right(env))
+
+    _value_binary = _distribution_binary = _dimension_binary = _binary
+    _rational_binary = _binary
+
+    def _unary(self, node):
+        op_node = node.child_by_field_name("op")
+        op = _text(op_node)
+        term = _field(node, "term")
+        if op == "~" and term.type in ("integer", "real"):
+            # About a number, to within its significant figures.
+            text = _text(term)
+            return lambda env: distributions.sigfig(text)
+        fn = _UNARY.get(op)
+        if fn is None:
+            raise FermiError(f"the operator {op!r} isn't supported yet", op_node)
+        value = self.expression(term)
+        return lambda env: fn(value(env))
+
+    _value_unary = _distribution_unary = _rational_unary = _unary
+
+    def _block(self, node):
+        self.scopes.append(set())
+        steps = [self.statement(child) for child in node.named_children]
+        self.scopes.pop()
+
+        def block(env):
+            env = env.new_child()
+            result = None
+            for step in steps:
+                output = step(env)
+                if output is not None:
+                    result = output.value
+            return result
+
+        return block
+
+    def _call(self, node):
+        callee, *arguments = node.named_children
+        name = _text(callee)
+        if callee.type == "primary" and _field(callee, "dimension") is not None:
+            name = _text(_field(callee, "dimension"))
+        if not self._bound(name):
+            self.uses.add(name)
+        builtin = BUILTINS.get(name)
+        arguments = [self.expression(argument) for argument in arguments]
+
+        def call(env):
+            fn = env.get(name, builtin)
+            if fn is None:
+                raise FermiError(f"unknown function {name!r}", node)
+            return fn(*[argument(env) for argument in arguments])
+
+        return call
+
+
+def _convert(value, units, node):
+    if isinstance(units, pint.Quantity):
+        units = units.units
+    try:
+        return value.to(units)
+    except AttributeError:
+        return ureg.Quantity(value).to(units)
+    except pint.errors.DimensionalityError as error:
+        raise FermiError(str(error), node) from None
+
+
+# Compiled plans, keyed by a hash of their source.
+plan_cache = utils.LRUCache(maxsize=256)
+
+
+def compile(source, tree=None):
+    """Compiles a fermi block into a `Plan`, reusing the plan for the same source.
+
+    `tree` is the tree-sitter tree of the source, if it has already been parsed.
+    """
+    key = hashlib.blake2b(source.encode("utf-8"), digest_size=16).hexdigest()
+    plan = plan_cache.get(key)
+    if plan is None:
+        root = parser.parse(source) if tree is None else tree.root_node
+        compiler = _Compiler(source)
+        steps = compiler.program(root)
+        plan = Plan(source, steps, compiler.defines, compiler.uses)
+        plan_cache.put(key, plan)
+    return plan
+
+
+def evaluate(source, env=None):
+    """Compiles and runs a fermi block, see `Plan.run`."""
+    return compile(source).run(env)
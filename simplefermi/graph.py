@@ -0,0 +1,792 @@
+"""Deferred sampling, quantities as expression graphs.
+
+Inside of `with lazy():` the distribution constructors return `Leaf` nodes
+instead of sample arrays, and arithmetic on them builds a graph of `Op` nodes.
+The units of every node are worked out when it is built, by running the
+operation on unit quantities, so dimension errors still show up right away.
+Samples are only drawn when something needs them (a repr, a quantile or a
+plot), at which point the whole graph is evaluated at once: identical
+subexpressions are computed once, and intermediate buffers are reused in place
+as soon as nothing else needs them.
+
+Every leaf remembers its own random seed, and the sample policy, design and
+variance reduction in effect when it was made, so evaluating the same node twice, or as part of
+two different graphs, always sees the same samples.
+
+Graphs built only from normal and lognormal leaves with operations that keep
+them in those families (products, quotients and powers of lognormals, sums of
+normals) have a closed form, see `closed_form`.  Their summaries and quantiles
+are then exact and need no samples at all.
+"""
+
+import functools
+import inspect
+import math
+import numbers
+import operator
+
+import numpy as np
+import pint
+from scipy.special import ndtri
+
+from simplefermi import config
+from simplefermi import sampling
+from simplefermi import utils
+from simplefermi.core import Q, ureg
+
+__all__ = ["lazy", "set_lazy", "evaluate", "closed_form"]
+
+# ufuncs that need a dimensionless argument and give a dimensionless result.
+_DIMENSIONLESS_UFUNCS = {
+    np.exp,
+    np.expm1,
+    np.exp2,
+    np.log,
+    np.log10,
+    np.log2,
+    np.log1p,
+    np.sin,
+    np.cos,
+    np.tan,
+    np.arcsin,
+    np.arccos,
+    np.arctan,
+    np.sinh,
+    np.cosh,
+    np.tanh,
+    np.arcsinh,
+    np.arccosh,
+    np.arctanh,
+}
+
+# ufuncs that keep the units of their argument.
+_UNIT_PRESERVING_UFUNCS = {np.negative, np.positive, np.absolute}
+
+_BINARY_UFUNCS = {
+    np.add: "__add__",
+    np.subtract: "__sub__",
+    np.multiply: "__mul__",
+    np.true_divide: "__truediv__",
+    np.power: "__pow__",
+}
+
+
+_OPERATORS = {np.multiply: operator.mul, np.true_divide: operator.truediv}
+
+
+def set_lazy(flag=True):
+    """Turns deferred sampling on or off globally."""
+    config.update(lazy=flag)
+
+
+def lazy(flag=True):
+    """Context manager in which the distributions return lazy expression nodes.
+
+    >>> with lazy():
+    ...     atm_mass = 1.0 * atm / (gravity * percent(7)) * 4 * pi * earth_radius**2
+    """
+    return config.using(lazy=flag)
+
+
+def evaluate(x):
+    """Returns the samples of `x` if it is lazy, otherwise `x` itself."""
+    if isinstance(x, Node):
+        return x.evaluate()
+    return x
+
+
+def _is_multiplicative(units):
+    return Q(1.0, units)._is_multiplicative
+
+
+def _factor(units, target):
+    """The scale factor that converts values in `units` to `target`."""
+    if units == target:
+        return 1.0
+    return Q(1.0, units).to(target).magnitude
+
+
+def _as_node(x):
+    if isinstance(x, Node):
+        return x
+    return Const(x)
+
+
+class Node:
+    """A quantity whose samples have not been drawn yet."""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Tell pint to return NotImplemented, so that `quantity * node` ends up
+        # in our reflected operators instead of turning the node into an array.
+        pint.compat.upcast_type_map[pint.compat.fully_qualified_name(cls)] = cls
+
+    units = ureg.dimensionless
+    # Whether the samples carry units, dimensionless leaves evaluate to plain arrays.
+    quantity = False
+    _value = None
+    _form = None
+    _formed = False
+
+    @property
+    def children(self):
+        return ()
+
+    def _closed_form(self, forms):
+        """The closed form of this node, given those of its children, or None."""
+        return None
+
+    def key(self):
+        """Nodes with equal keys always have the same values."""
+        return id(self)
+
+    @property
+    def dimensionality(self):
+        return self.units.dimensionality
+
+    def evaluate(self):
+        """Draws the samples, returning a quantity or, for dimensionless leaves, an array."""
+        if self._value is None:
+            self._value = _Evaluation().run(self)
+        return self._value
+
+    @property
+    def magnitude(self):
+        return getattr(self.evaluate(), "magnitude", self.evaluate())
+
+    m = magnitude
+
+    def quantile(self, qs):
+        form = closed_form(self)
+        if form is not None:
+            return form.quantile(qs)
+        return np.quantile(self.magnitude, qs)
+
+    def summary(self):
+        """The median and central interval, exact if the node has a closed form."""
+        form = closed_form(self)
+        if form is not None:
+            return form.summary()
+        return utils.summary(self.magnitude)
+
+    ## Arithmetic
+
+    def __add__(self, other):
+        return _additive(np.add, self, other)
+
+    def __radd__(self, other):
+        return _additive(np.add, other, self)
+
+    def __sub__(self, other):
+        return _additive(np.subtract, self, other)
+
+    def __rsub__(self, other):
+        return _additive(np.subtract, other, self)
+
+    def __mul__(self, other):
+        return _multiplicative(np.multiply, self, other)
+
+    def __rmul__(self, other):
+        return _multiplicative(np.multiply, other, self)
+
+    def __truediv__(self, other):
+        return _multiplicative(np.true_divide, self, other)
+
+    def __rtruediv__(self, other):
+        return _multiplicative(np.true_divide, other, self)
+
+    def __pow__(self, other):
+        return _power(self, other)
+
+    def __rpow__(self, other):
+        return _power(other, self)
+
+    def __neg__(self):
+        return Op(np.negative, [self], self.units)
+
+    def __pos__(self):
+        return self
+
+    def __abs__(self):
+        return Op(np.absolute, [self], self.units)
+
+    def to(self, units):
+        units = Q(1.0, units).units
+        if not (_is_multiplicative(units) and _is_multiplicative(self.units)):
+            return self.evaluate().to(units)
+        return _scaled(self, _factor(self.units, units), units, quantity=True)
+
+    def to_base_units(self):
+        return self.to(Q(1.0, self.units).to_base_units().units)
+
+    def to_reduced_units(self):
+        return self.to(Q(1.0, self.units).to_reduced_units().units)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        if method == "__call__" and not kwargs:
+            if ufunc in _BINARY_UFUNCS and len(inputs) == 2:
+                left, right = inputs
+                if isinstance(left, Node):
+                    return getattr(left, _BINARY_UFUNCS[ufunc])(right)
+                return getattr(right, "__r" + _BINARY_UFUNCS[ufunc][2:])(left)
+            if len(inputs) == 1:
+                return _unary(ufunc, inputs[0])
+        # Anything we can't defer is done eagerly on the samples.
+        inputs = [evaluate(x) for x in inputs]
+        return getattr(ufunc, method)(*inputs, **kwargs)
+
+    ## Anything else needs the samples.
+
+    def __array__(self, dtype=None, copy=None):
+        return np.asarray(self.magnitude, dtype=dtype)
+
+    def __len__(self):
+        return len(self.magnitude)
+
+    def __getitem__(self, key):
+        return self.evaluate()[key]
+
+    def __lt__(self, other):
+        return self.evaluate() < evaluate(other)
+
+    def __le__(self, other):
+        return self.evaluate() <= evaluate(other)
+
+    def __gt__(self, other):
+        return self.evaluate() > evaluate(other)
+
+    def __ge__(self, other):
+        return self.evaluate() >= evaluate(other)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return getattr(self.evaluate(), name)
+
+    def __repr__(self):
+        if self.quantity and closed_form(self) is not None:
+            from simplefermi import api
+
+            return api.plain_repr(self)
+        return repr(self.evaluate())
+
+    def _repr_pretty_(self, printer, cycle):
+        if self.quantity and closed_form(self) is not None:
+            from simplefermi import api
+
+            return printer.text(api.repr(self))
+        value = self.evaluate()
+        if hasattr(value, "_repr_pretty_"):
+            return value._repr_pretty_(printer, cycle)
+        printer.text(repr(value))
+
+    def _repr_html_(self):
+        return getattr(self.evaluate(), "_repr_html_", lambda: None)()
+
+    def _repr_png_(self):
+        return getattr(self.evaluate(), "_repr_png_", lambda: None)()
+
+
+class Const(Node):
+    """A known value, either a number, an array, a unit or an eager quantity."""
+
+    def __init__(self, value):
+        if isinstance(value, pint.Unit):
+            value = Q(1.0, value)
+        if isinstance(value, pint.Quantity):
+            self.units = value.units
+            self.value = value.magnitude
+            self.quantity = True
+        else:
+            self.value = value
+
+    @property
+    def scalar(self):
+        return np.ndim(self.value) == 0
+
+    def key(self):
+        if self.scalar:
+            return (Const, self.value, self.units, self.quantity)
+        return (Const, id(self))
+
+    def evaluate(self):
+        if self.quantity:
+            return Q(self.value, self.units)
+        return self.value
+
+    def _closed_form(self, forms):
+        if isinstance(self.value, numbers.Real) or (
+            isinstance(self.value, np.ndarray)
+            and self.value.ndim == 0
+            and self.value.dtype.kind in "biuf"
+        ):
+            return ClosedForm(float(self.value))
+        return None
+
+
+class Leaf(Node):
+    """A call to a distribution constructor that hasn't been made yet."""
+
+    def __init__(self, fn, args, kwargs):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        units = inspect.signature(fn).bind(*args, **kwargs).arguments.get("units")
+        if units is not None:
+            self.units = Q(1.0, units).units
+            self.quantity = True
+        # Freeze the sample policy, design and variance reduction in effect
+        # now, and fix the seed so every evaluation of this leaf gives the
+        # same samples.  Under a low
+        # discrepancy design the leaf also keeps the dimensions of its `quasi`
+        # block, so it doesn't share a dimension with the other inputs of it.
+        self.settings = {
+            "samples": config.get("samples"),
+            "dtype": config.get("dtype"),
+            "design": config.get("design"),
+            "reduction": config.get("reduction"),
+        }
+        self.dimensions = None
+        if self.settings["design"] != "random":
+            self.dimensions = sampling.dimensions()
+        self.seed = sampling.spawn()
+
+    def draw(self):
+        args = [evaluate(x) for x in self.args]
+        kwargs = {k: evaluate(v) for k, v in self.kwargs.items()}
+        with (
+            config.using(lazy=False, **self.settings),
+            sampling.seeded(self.seed),
+            sampling.within(self.dimensions),
+        ):
+            value = self.fn(*args, **kwargs)
+        return getattr(value, "magnitude", value)
+
+    def _closed_form(self, forms):
+        parameters = _CLOSED_FORMS.get(self.fn.__name__)
+        if parameters is None or self.fn.__module__ != "simplefermi.distributions":
+            return None
+        bound = inspect.signature(self.fn).bind(*self.args, **self.kwargs)
+        bound.apply_defaults()
+        arguments = {
+            k: v for k, v in bound.arguments.items() if k not in ("units", "n")
+        }
+        if not all(isinstance(v, numbers.Real) for v in arguments.values()):
+            return None
+        family = parameters(**{k: float(v) for k, v in arguments.items()})
+        if family is None:
+            return None
+        log, mean, sigma = family
+        if not (math.isfinite(mean) and math.isfinite(sigma)):
+            return None
+        return ClosedForm(mean, {id(self): sigma}, log)
+
+
+class Op(Node):
+    """A numpy ufunc applied to the (rescaled) values of its children.
+
+    Each child's values are multiplied by the matching entry of `scales` to put
+    them in the units the operation expects, and the result by `scale`.
+    """
+
+    def __init__(self, ufunc, children, units, scales=None, scale=1.0, quantity=False):
+        self.ufunc = ufunc
+        self._children = tuple(children)
+        self.units = units
+        self.scales = tuple(scales or [1.0] * len(children))
+        self.scale = scale
+        self.quantity = quantity or any(child.quantity for child in self._children)
+
+    @property
+    def children(self):
+        return self._children
+
+    def key(self):
+        return (self.ufunc, tuple(map(id, self._children)), self.scales, self.scale)
+
+    def _closed_form(self, forms):
+        if any(form is None for form in forms):
+            return None
+        forms = [form.scaled(s) for form, s in zip(forms, self.scales)]
+        if any(form is None for form in forms):
+            return None
+        combine = _COMBINATIONS.get(self.ufunc)
+        form = combine(*forms) if combine is not None else None
+        return None if form is None else form.scaled(self.scale)
+
+
+## Building ops
+
+
+def _scaled(node, scale, units, quantity=False):
+    """`node` times a scalar with the new units, folding chains of rescalings."""
+    quantity = quantity or node.quantity
+    if isinstance(node, Op) and node.ufunc is np.positive:
+        node, scale = node.children[0], scale * node.scales[0] * node.scale
+    if scale == 1.0 and units == node.units and quantity == node.quantity:
+        return node
+    return Op(np.positive, [node], units, scales=[scale], quantity=quantity)
+
+
+def _additive(ufunc, left, right):
+    left, right = _as_node(left), _as_node(right)
+    if not (_is_multiplicative(left.units) and _is_multiplicative(right.units)):
+        return ufunc(evaluate(left), evaluate(right))
+    # Pint gives a sum the units of its left operand.
+    factor = _factor(right.units, left.units)
+    return Op(ufunc, [left, right], left.units, scales=[1.0, factor])
+
+
+def _multiplicative(ufunc, left, right):
+    left, right = _as_node(left), _as_node(right)
+    # Use the operators rather than the ufuncs, pint only reduces units for the former.
+    probe = _OPERATORS[ufunc](Q(1.0, left.units), Q(1.0, right.units))
+    units, scale = probe.units, probe.magnitude
+    # Scalar factors are folded into a single rescaling of the other operand.
+    if isinstance(right, Const) and right.scalar:
+        value = right.value if ufunc is np.multiply else 1.0 / right.value
+        return _scaled(left, scale * value, units, right.quantity)
+    if isinstance(left, Const) and left.scalar and ufunc is np.multiply:
+        return _scaled(right, scale * left.value, units, left.quantity)
+    return Op(ufunc, [left, right], units, scale=scale)
+
+
+def _power(base, exponent):
+    base, exponent = _as_node(base), _as_node(exponent)
+    if isinstance(exponent, Const) and exponent.scalar:
+        probe = Q(1.0, base.units) ** exponent.value
+        return Op(np.power, [base, exponent], probe.units, scale=probe.magnitude)
+    # Raising to an uncertain power only makes sense for dimensionless values.
+    scales = [_factor(base.units, ureg.dimensionless), 1.0]
+    if exponent.units != ureg.dimensionless:
+        scales[1] = _factor(exponent.units, ureg.dimensionless)
+    return Op(np.power, [base, exponent], ureg.dimensionless, scales=scales)
+
+
+def _unary(ufunc, x):
+    if ufunc in _UNIT_PRESERVING_UFUNCS:
+        return Op(ufunc, [x], x.units)
+    if ufunc is np.sqrt:
+        return _power(x, 0.5)
+    if ufunc is np.square:
+        return _power(x, 2)
+    if ufunc is np.cbrt:
+        return _power(x, 1 / 3)
+    if ufunc in _DIMENSIONLESS_UFUNCS:
+        factor = _factor(x.units, ureg.dimensionless)
+        return Op(ufunc, [x], ureg.dimensionless, scales=[factor])
+    return ufunc(x.evaluate())
+
+
+## Closed forms
+
+
+class ClosedForm:
+    """A normal or lognormal distribution, known exactly.
+
+    The value (or for a lognormal, its logarithm) is `mean + sum(terms[k] * Z_k)`
+    where each `Z_k` is the standard normal drawn by one leaf, so a leaf that
+    shows up more than once in a graph stays perfectly correlated with itself.
+    `log` is None for constants, which belong to either family.
+    """
+
+    def __init__(self, mean, terms=None, log=None):
+        self.mean = mean
+        self.terms = terms or {}
+        self.log = log if self.terms else None
+
+    @property
+    def sigma(self):
+        """The standard deviation of the value, or of its logarithm."""
+        return math.sqrt(sum(t * t for t in self.terms.values()))
+
+    def quantile(self, qs):
+        values = self.mean + self.sigma * ndtri(np.asarray(qs, dtype=float))
+        return np.exp(values) if self.log else values
+
+    def summary(self, alpha=utils.ALPHA):
+        """The median and central interval, as `utils.summary` finds them from samples."""
+        low, mid, high = self.quantile([alpha / 2, 0.5, 1 - alpha / 2])
+        return utils.Summary(float(mid), float(low), float(high))
+
+    def linear(self):
+        """As a normal, None if it is a lognormal."""
+        return None if self.log else self
+
+    def logarithmic(self):
+        """As a lognormal, described by its logarithm, None if that isn't one."""
+        if self.log is None:
+            return ClosedForm(math.log(self.mean), log=True) if self.mean > 0 else None
+        return self if self.log else None
+
+    def scaled(self, scale):
+        """The distribution of the value times `scale`."""
+        if self.log is None:
+            return ClosedForm(self.mean * scale)
+        if not self.log:
+            terms = {k: t * scale for k, t in self.terms.items()}
+            return ClosedForm(self.mean * scale, terms, log=False)
+        if scale > 0:
+            return ClosedForm(self.mean + math.log(scale), self.terms, log=True)
+        return None
+
+    def power(self, exponent):
+        """The distribution of the value raised to a constant `exponent`."""
+        if self.log is None:
+            try:
+                value = self.mean**exponent
+            except (ZeroDivisionError, OverflowError):
+                return None
+            return ClosedForm(value) if isinstance(value, float) else None
+        if not self.log:
+            return self if exponent == 1 else None
+        terms = {k: t * exponent for k, t in self.terms.items()}
+        return ClosedForm(self.mean * exponent, terms, log=True)
+
+    def exp(self):
+        if self.log is None:
+            try:
+                return ClosedForm(math.exp(self.mean))
+            except OverflowError:
+                return None
+        if self.log:
+            return None
+        return ClosedForm(self.mean, self.terms, log=True)
+
+    def ln(self):
+        if self.log is None:
+            return ClosedForm(math.log(self.mean)) if self.mean > 0 else None
+        if self.log:
+            return ClosedForm(self.mean, self.terms, log=False)
+        return None
+
+
+def _sum(a, b, sign=1.0):
+    a, b = a.linear(), b.linear()
+    if a is None or b is None:
+        return None
+    terms = dict(a.terms)
+    for k, t in b.terms.items():
+        terms[k] = terms.get(k, 0.0) + sign * t
+    # Leaves that cancel out, like in `x / x`, drop out altogether.
+    terms = {k: t for k, t in terms.items() if t}
+    return ClosedForm(a.mean + sign * b.mean, terms, log=False)
+
+
+def _product(a, b, sign=1.0):
+    if b.log is None:
+        if sign < 0:
+            return a.scaled(1.0 / b.mean) if b.mean else None
+        return a.scaled(b.mean)
+    if a.log is None and sign > 0:
+        return b.scaled(a.mean)
+    a, b = a.logarithmic(), b.logarithmic()
+    if a is None or b is None:
+        return None
+    return _sum(
+        ClosedForm(a.mean, a.terms, log=False),
+        ClosedForm(b.mean, b.terms, log=False),
+        sign,
+    ).exp()
+
+
+def _raised(base, exponent):
+    if exponent.log is None:
+        return base.power(exponent.mean)
+    # A positive constant to a normal power is a lognormal.
+    if base.log is None and base.mean > 0:
+        return exponent.scaled(math.log(base.mean)).exp()
+    return None
+
+
+_COMBINATIONS = {
+    np.positive: lambda a: a,
+    np.negative: lambda a: a.scaled(-1.0),
+    np.add: _sum,
+    np.subtract: lambda a, b: _sum(a, b, -1.0),
+    np.multiply: _product,
+    np.true_divide: lambda a, b: _product(a, b, -1.0),
+    np.power: _raised,
+    np.exp: ClosedForm.exp,
+    np.log: ClosedForm.ln,
+}
+
+
+def _spread(p):
+    """The number of standard deviations the central interval `p` spans on either side."""
+    return -float(ndtri(0.5 * (1 - p)))
+
+
+def _normal(a, b, p):
+    return False, 0.5 * (a + b), 0.5 * (b - a) / _spread(p)
+
+
+def _lognormal(a, b, p):
+    if a <= 0 or b <= 0:
+        return None
+    return True, math.log(math.sqrt(b * a)), math.log(math.sqrt(b / a)) / _spread(p)
+
+
+def _timesdivide(mean, rel_error, p):
+    if mean <= 0 or rel_error <= 0:
+        return None
+    return True, math.log(mean), math.log(rel_error / _spread(p))
+
+
+def _percent(percentage, p):
+    top = 1.0 + percentage / 100.0
+    return _lognormal(1.0 / top, top, p)
+
+
+def _db(x, p):
+    return _lognormal(10 ** (-x / 10.0), 10 ** (x / 10.0), p)
+
+
+# The families of the distribution constructors whose leaves have closed
+# forms: given their arguments, whether they are lognormal, and the mean and
+# standard deviation of the (log of the) value.
+_CLOSED_FORMS = {
+    "plusminus": lambda mean, sig: (False, mean, sig),
+    "normal": _normal,
+    "lognormal": _lognormal,
+    "timesdivide": _timesdivide,
+    "to": lambda a, b, p: _lognormal(a, b, p) if a > 0 and b > 0 else _normal(a, b, p),
+    "percent": _percent,
+    "db": _db,
+}
+
+
+def closed_form(x):
+    """The exact distribution of a lazy node as a `ClosedForm`, None if it has none.
+
+    Leaves of normal and lognormal distributions have closed forms, and so do
+    products, quotients and constant powers of lognormals, sums and
+    differences of normals, and constant rescalings of either.  Anything else
+    leaves the families, and has to be sampled.
+    """
+    if not isinstance(x, Node):
+        return None
+    stack = [(x, False)]
+    while stack:
+        node, ready = stack.pop()
+        if node._formed:
+            continue
+        if not ready:
+            stack.append((node, True))
+            stack.extend((child, False) for child in node.children)
+            continue
+        node._form = node._closed_form([child._form for child in node.children])
+        node._formed = True
+    return x._form
+
+
+## Evaluation
+
+
+class _Evaluation:
+    """Evaluates a graph once, sharing common subexpressions and reusing buffers."""
+
+    def __init__(self):
+        self.canonical = {}
+        self.values = {}
+        # Buffers created by this evaluation, which are safe to overwrite.
+        self.owned = set()
+
+    def canonicalize(self, root):
+        """Merges identical ops, returns the new root and the nodes in evaluation order."""
+        replaced = {}
+        order = []
+        stack = [(root, False)]
+        while stack:
+            node, ready = stack.pop()
+            if id(node) in replaced:
+                continue
+            if not ready:
+                stack.append((node, True))
+                stack.extend((child, False) for child in node.children)
+                continue
+            original = node
+            if isinstance(node, Op):
+                children = tuple(replaced[id(child)] for child in node.children)
+                if any(a is not b for a, b in zip(children, node.children)):
+                    node = _rebuild(node, children)
+            canonical = self.canonical.setdefault(node.key(), node)
+            if canonical is node:
+                order.append(node)
+            replaced[id(original)] = canonical
+        return replaced[id(root)], order
+
+    def run(self, root):
+        root, order = self.canonicalize(root)
+        consumers = {}
+        for node in order:
+            for child in node.children:
+                consumers[id(child)] = consumers.get(id(child), 0) + 1
+        for node in order:
+            self.values[id(node)] = self.compute(node, consumers)
+            for child in node.children:
+                consumers[id(child)] -= 1
+                if not consumers[id(child)]:
+                    self.values.pop(id(child), None)
+        value = self.values.pop(id(root))
+        if root.quantity:
+            return Q(value, root.units)
+        return value
+
+    def free(self, node, consumers):
+        """Whether the values of `node` can be overwritten once they have been read."""
+        return id(node) in self.owned and consumers[id(node)] == 1
+
+    def compute(self, node, consumers):
+        if node._value is not None:
+            return getattr(node._value, "magnitude", node._value)
+        if isinstance(node, Const):
+            return node.value
+        if isinstance(node, Leaf):
+            value = node.draw()
+            self.owned.add(id(node))
+            return value
+
+        inputs = []
+        out = None
+        for child, scale in zip(node.children, node.scales):
+            value = self.values[id(child)]
+            reusable = self.free(child, consumers) and _is_float_array(value)
+            if scale != 1.0:
+                value = np.multiply(value, scale, out=value if reusable else None)
+                # Rescaling made a copy, which is ours to overwrite.
+                reusable = _is_float_array(value)
+            if out is None and reusable:
+                out = value
+            inputs.append(value)
+
+        if out is not None:
+            shape = np.broadcast_shapes(*(np.shape(x) for x in inputs))
+            if out.shape != shape or np.result_type(*inputs) != out.dtype:
+                out = None
+        result = node.ufunc(*inputs, out=out)
+        if node.scale != 1.0:
+            result = np.multiply(result, node.scale, out=result)
+        if isinstance(result, np.ndarray):
+            self.owned.add(id(node))
+        return result
+
+
+def _is_float_array(x):
+    return isinstance(x, np.ndarray) and x.dtype.kind == "f"
+
+
+def _rebuild(op, children):
+    return Op(op.ufunc, children, op.units, scales=op.scales, scale=op.scale)
+
+
+def deferred(fn):
+    """Makes a distribution constructor return a `Leaf` while lazy mode is on."""
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if config.get("lazy"):
+            return Leaf(fn, args, kwargs)
+        return fn(*args, **kwargs)
+
+    return wrapper
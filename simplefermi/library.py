@@ -1,12 +1,18 @@
 """Defines the basic quantities and units and things that are unique to this package."""
 
 import math
-import sys
 
-from simplefermi.core import ureg, make, store
+from pint.errors import UndefinedUnitError
+
+from simplefermi import config
+from simplefermi import sampling
+from simplefermi.core import ureg, make, name_unit, store
 from simplefermi.distributions import data, plusminus
+from simplefermi.utils import LRUCache
 
-_this_module = sys.modules[__name__]
+# The constants are drawn from their own fixed seed unless one is set, so they
+# are the same in every session.
+LIBRARY_SEED = 20190520
 
 m = ureg.m
 s = ureg.s
@@ -87,11 +93,21 @@ store(J / K, "heat capacity")
 store(J * kg**-1 * K**-1, "specific heat capacity")
 lumen = ureg.lumen
 
+# The units that `best_unit` expresses quantities in.
+for _unit in [m, s, kg, A, K, mol, cd, dollar]:
+    name_unit(_unit)
+for _unit in [N, J, watt, ureg.pascal, C, volt, ohm, siemens, ureg.farad]:
+    name_unit(_unit)
+for _unit in [weber, henry, tesla]:
+    name_unit(_unit)
+
 ## populate from pint
 
-for name in ureg:
-    if name in ureg:
-        setattr(_this_module, name, ureg(name))
+# Like every other unit in pint, which are looked up on first use by
+# `__getattr__` below, the ones defined above are unit quantities.
+_UNIT_NAMES = set(ureg)
+for _name in _UNIT_NAMES & set(globals()):
+    globals()[_name] = ureg(_name)
 
 ## Mathematical constants
 
@@ -110,30 +126,8 @@ c = speed_of_light = 299_792_458 * (m / s)
 vcs = 9_192_631_770 * (s**-1)
 kcd = 683 * (lumen / watt)
 
-# CODATA Physical constants
-
-# c = speed_of_light = constants.c * m / s
-# elementary_charge = plusminus(1.6021766208e-19, 0.0000000098e-19) * C
-# h = plusminus(6.626070040e-34, 0.000000081e-34) * (J * s)
 hbar = h / (2 * pi)
-classical_electron_radius = plusminus(2.8179403227e-15, 0.0000000019e-15) * m
-thomson_cross_section = plusminus(0.66524587158e-28, 0.00000000091e-28) * (m**2)
-G = plusminus(6.67408e-11, 0.00031e-11) * (N * m**2 / kg**2)
 standard_gravity = 9.80662 * m / s**2
-atomic_mass_unit = plusminus(1.660539040e-27, 0.000000020e-27) * kg
-# avogadro = plusminus(6.022140857e23, 0.000000074e23) * (mol**-1)
-# gas_constant = plusminus(8.3144598, 0.0000048) * (J / (mol * K))
-# boltzmann = plusminus(1.38064852e-23, 0.00000079e-23) * J/K
-wien_displacement = plusminus(2.8977729e-3, 0.0000017e-3) * (m * K)
-# alpha = plusminus(7.2973525664e-3, 0.0000000017e-3) * dimensionless
-Rydberg_constant = plusminus(10973731.568508, 0.000065) * (m**-1)
-bohr_radius = plusminus(0.52917721067e-10, 0.00000000012e-10) * m
-planck_temperature = plusminus(1.416808e32, 0.000033e32) * K
-muon_magnetic_moment = plusminus(-4.49044826e-26, 0.00000010e-26) * (J / T)
-proton_magnetic_moment = plusminus(1.4106067873e-26, 0.0000000097e-26) * (J / T)
-electron_magnetic_moment = plusminus(-928.4764520e-26, 0.0000057e-26) * (J / T)
-neutron_magnetic_moment = plusminus(-0.96623650e-26, 0.00000023e-26) * (J / T)
-deuteron_magnetic_moment = plusminus(0.4330735040e-26, 0.0000000036e-26) * (J / T)
 
 ## Derived values
 
@@ -141,18 +135,95 @@ deuteron_magnetic_moment = plusminus(0.4330735040e-26, 0.0000000036e-26) * (J /
 # epsilon0 = 1/(mu0 * c**2)
 R = gas_constant = avogadro * boltzmann
 
-
-# DATA
-
-earth_mass = plusminus(5.9722e24, 6.0e20) * kg
-earth_radius = plusminus(6371, 10) * kilo * m
-sigma = stefan_boltzmann = 2 * pi**5 * boltzmann**4 / (15 * c**2 * h**3)
-solar_constant = plusminus(1.3608, 0.0005) * kilo * watt / m**2
-
-# In the gregorian calendar, the calendar cycles every 400 years.
-year = data(values=[365, 366], weights=[303, 97]) * day
-# 303 are 365, 97 are leap years with 366 days.
-yr = year
-
-month = data(values=[31, 29, 30, 28], weights=[2800, 97, 1600, 303]) * day
-# Using the same math above, in a 400 year cycle the calendar repeats.
+## Uncertain constants
+
+# These are only sampled when they are first used, see `__getattr__` below.
+
+_CONSTANTS = {
+    # CODATA Physical constants
+    # c = speed_of_light = constants.c * m / s
+    # elementary_charge = plusminus(1.6021766208e-19, 0.0000000098e-19) * C
+    # h = plusminus(6.626070040e-34, 0.000000081e-34) * (J * s)
+    "classical_electron_radius": lambda: plusminus(2.8179403227e-15, 0.0000000019e-15)
+    * m,
+    "thomson_cross_section": lambda: plusminus(0.66524587158e-28, 0.00000000091e-28)
+    * (m**2),
+    "G": lambda: plusminus(6.67408e-11, 0.00031e-11) * (N * m**2 / kg**2),
+    "atomic_mass_unit": lambda: plusminus(1.660539040e-27, 0.000000020e-27) * kg,
+    # avogadro = plusminus(6.022140857e23, 0.000000074e23) * (mol**-1)
+    # gas_constant = plusminus(8.3144598, 0.0000048) * (J / (mol * K))
+    # boltzmann = plusminus(1.38064852e-23, 0.00000079e-23) * J/K
+    "wien_displacement": lambda: plusminus(2.8977729e-3, 0.0000017e-3) * (m * K),
+    # alpha = plusminus(7.2973525664e-3, 0.0000000017e-3) * dimensionless
+    "Rydberg_constant": lambda: plusminus(10973731.568508, 0.000065) * (m**-1),
+    "bohr_radius": lambda: plusminus(0.52917721067e-10, 0.00000000012e-10) * m,
+    "planck_temperature": lambda: plusminus(1.416808e32, 0.000033e32) * K,
+    "muon_magnetic_moment": lambda: plusminus(-4.49044826e-26, 0.00000010e-26)
+    * (J / T),
+    "proton_magnetic_moment": lambda: plusminus(1.4106067873e-26, 0.0000000097e-26)
+    * (J / T),
+    "electron_magnetic_moment": lambda: plusminus(-928.4764520e-26, 0.0000057e-26)
+    * (J / T),
+    "neutron_magnetic_moment": lambda: plusminus(-0.96623650e-26, 0.00000023e-26)
+    * (J / T),
+    "deuteron_magnetic_moment": lambda: plusminus(0.4330735040e-26, 0.0000000036e-26)
+    * (J / T),
+    # DATA
+    "earth_mass": lambda: plusminus(5.9722e24, 6.0e20) * kg,
+    "earth_radius": lambda: plusminus(6371, 10) * kilo * m,
+    "stefan_boltzmann": lambda: 2 * pi**5 * boltzmann**4 / (15 * c**2 * h**3),
+    "solar_constant": lambda: plusminus(1.3608, 0.0005) * kilo * watt / m**2,
+    # In the gregorian calendar, the calendar cycles every 400 years.
+    # 303 are 365, 97 are leap years with 366 days.
+    "year": lambda: data(values=[365, 366], weights=[303, 97]) * day,
+    # Using the same math above, in a 400 year cycle the calendar repeats.
+    "month": lambda: data(values=[31, 29, 30, 28], weights=[2800, 97, 1600, 303]) * day,
+}
+
+_ALIASES = {
+    "sigma": "stefan_boltzmann",
+    "yr": "year",
+}
+
+# Keyed by the name, the sample policy, the design and the seed they were
+# drawn with.  Under a low discrepancy design the key includes the dimensions
+# of the `quasi` block, a constant drawn in another block would share its
+# dimension with an input of this one.
+_cache = LRUCache(maxsize=256)
+
+
+def _constant(name):
+    root = sampling.root_key()
+    key = (
+        name,
+        config.get("samples"),
+        config.get("dtype").str,
+        sampling.design_key(),
+        root,
+    )
+    value = _cache.get(key)
+    if value is None:
+        # Each constant gets its own seed, derived from its name, so it doesn't
+        # matter in which order they are first used.
+        seed = sampling.derive(name, default=LIBRARY_SEED)
+        with config.using(lazy=False), sampling.seeded(seed):
+            value = _CONSTANTS[name]()
+        _cache.put(key, value)
+    return value
+
+
+def __getattr__(name):
+    """Samples the uncertain constants, and looks up units from pint, on first use."""
+    if name in _CONSTANTS or name in _ALIASES:
+        return _constant(_ALIASES.get(name, name))
+    if name in _UNIT_NAMES:
+        try:
+            globals()[name] = ureg(name)
+            return globals()[name]
+        except UndefinedUnitError:
+            pass
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_CONSTANTS) | set(_ALIASES) | _UNIT_NAMES)
@@ -1,16 +1,38 @@
+"""A live markdown notebook, rendered in the browser as the file is saved.
+
+Usage:
+    python -m simplefermi.notebook [directory]
+
+Every markdown file under the directory (by default the current one) is
+watched.  The results of slow fermi blocks are cached in
+`~/.cache/simplefermi/notebook.sqlite`, so that restarting the server doesn't
+run them again (see `benchmarks/notebook_benchmark.py`).
+"""
+
 import time
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
 import markdown
-from markdown.preprocessors import Preprocessor
-from markdown.extensions import Extension
 from flask import Flask, render_template
 from flask_socketio import SocketIO
-import os
+import flask_socketio
 import re
 import sys
+import threading
 import functools
-import parser
+import html
+
+import numpy as np
+import pint
+
+from simplefermi import api
+from simplefermi import config
+from simplefermi import diskcache
+from simplefermi import evaluator
+from simplefermi import graph
+from simplefermi import parser
+from simplefermi import sampling
+from simplefermi import watcher
 
 app = Flask(__name__)
 socketio = SocketIO(app)
@@ -100,37 +122,429 @@ def preprocess_math(s):
     return s
 
 
-class FermiExtension(markdown.Extension):
-    def extendMarkdown(self, md):
-        # TODO: Implement Fermi language parsing and execution
-        pass
+FERMI_BLOCK = re.compile(r"(```fermi\n(.*?)(?<=\n)```($|\n))", re.DOTALL)
+
 
+def format_output(output):
+    value = graph.evaluate(output.value)
+    if isinstance(value, np.ndarray):
+        value = api.u.Quantity(value)
+    if isinstance(value, pint.Quantity):
+        return api.html_repr(value)
+    return html.escape(str(value))
 
-FERMI_BLOCK = re.compile(r"(```fermi\n(.*?)(?<=\n)```($|\n))", re.DOTALL)
+
+def run_fermi(plan, env):
+    """Runs a compiled fermi block, returns the html of its outputs and its bindings."""
+    try:
+        outputs, bindings = plan.run(env)
+    except evaluator.FermiError as e:
+        return f"<div class='fermierror'>{html.escape(str(e))}</div>", {}
+    return "<br>".join(format_output(output) for output in outputs), bindings
+
+
+def render_fermi(code, env):
+    """Runs a fermi block with the bindings of the blocks above it, adding its own to `env`."""
+    try:
+        plan = evaluator.compile(code)
+    except evaluator.FermiError as e:
+        return f"<div class='fermierror'>{html.escape(str(e))}</div>"
+    out, bindings = run_fermi(plan, env)
+    env.update(bindings)
+    return out
 
 
 def preprocess_fermi(s):
+    env = {}
+
     def subfn(match):
         full = match.group(0)
-        fermi_code = match.group(1)
-        out = str(parser.parse(fermi_code))
+        fermi_code = match.group(2)
+        out = render_fermi(fermi_code, env)
         return f"{full}\n<div class='fermiout'>{out}</div>"
 
     return FERMI_BLOCK.sub(subfn, s)
 
 
+# Markdown instances aren't thread safe, and the pipeline renders on several.
+_local = threading.local()
+
+
+def _markdown():
+    """The markdown converter of the current thread."""
+    try:
+        return _local.markdown
+    except AttributeError:
+        _local.markdown = markdown.Markdown(extensions=["codehilite", "fenced_code"])
+        return _local.markdown
+
+
+def render_markdown(s):
+    s = preprocess_math(s)
+    return _markdown().reset().convert(s)
+
+
+def split_blocks(s):
+    """Splits a document into a list of its markdown and fermi blocks, as (kind, source)."""
+    blocks = []
+    start = 0
+    for match in FERMI_BLOCK.finditer(s):
+        if match.start() > start:
+            blocks.append(("markdown", s[start : match.start()]))
+        # The newline after the fence goes with the markdown, so that a block's
+        # source doesn't depend on whether anything follows it.
+        blocks.append(("fermi", s[match.start() : match.start(3)]))
+        start = match.start(3)
+    if start < len(s):
+        blocks.append(("markdown", s[start:]))
+    return blocks
+
+
+_MISSING = object()
+
+
+class Block:
+    """One markdown or fermi block of a document and what it rendered to."""
+
+    def __init__(self, kind, source):
+        self.kind = kind
+        self.source = source
+        self.html = None
+        # Fermi blocks only.
+        self.code = None
+        self.tree = None
+        self.plan = None
+        self.error = None
+        self.inputs = None
+        self.code_html = None
+        self.bindings = {}
+        self.output = None
+        # The cache key of the result, if there is a cache.
+        self.key = None
+
+
+def subsample(value, n):
+    """The first `n` samples of a value, so that it can be combined with `n` new ones."""
+    magnitude = getattr(value, "magnitude", value)
+    if isinstance(magnitude, np.ndarray) and magnitude.ndim == 1:
+        if magnitude.size > n:
+            return value[:n]
+    return value
+
+
+class Document:
+    """A notebook that is updated incrementally as its file is saved.
+
+    The text is split into markdown and fermi blocks.  Markdown is only
+    rendered again when its text changes.  Fermi blocks are reparsed
+    incrementally from their previous tree, and only run again if their
+    code changed or one of the names they use was bound to something new by
+    a block above them.
+
+    With `stages`, the blocks that have to run again are first run with each
+    of those (smaller) numbers of samples, and `progress` is told about the
+    quick estimates before the final run.
+
+    With a `cache` (a `diskcache.DiskCache`), every block is run seeded from
+    a key of its code and of the keys of the blocks above it that it uses.
+    The results of slow blocks are stored on disk, and a block whose key is
+    in the cache is restored from it instead of being run, which makes
+    opening a notebook again after a restart quick.
+    """
+
+    def __init__(self, stages=(), cache=None):
+        self.blocks = []
+        self.stages = stages
+        self.cache = cache
+        self.runs = 0
+        self.restored = 0
+        self._redraw = False
+
+    def update(self, text, cancelled=None, progress=None):
+        """Updates the document to `text`.
+
+        Returns the indices of the blocks whose html changed, or None if blocks
+        were added or removed and the whole document has to be redrawn.
+        `progress` is called the same way with the blocks that changed after
+        each preliminary stage.  If `cancelled()` becomes true the update stops
+        before the next fermi block with `watcher.Cancelled`, and the next
+        update redraws everything.
+        """
+        new = split_blocks(text)
+        old = self.blocks
+        same_structure = [kind for kind, _ in new] == [block.kind for block in old]
+        if same_structure:
+            blocks = old
+        else:
+            # Blocks that are still there keep their state, new fermi blocks
+            # at least start out from the tree of the block that was in their
+            # place.
+            unused = {}
+            for block in old:
+                unused.setdefault((block.kind, block.source), []).append(block)
+            blocks = []
+            for index, (kind, source) in enumerate(new):
+                matches = unused.get((kind, source))
+                if matches:
+                    blocks.append(matches.pop(0))
+                    continue
+                block = Block(kind, None)
+                if index < len(old) and old[index].kind == kind:
+                    block.code = old[index].code
+                    block.tree = old[index].tree
+                blocks.append(block)
+
+        before = [block.html for block in blocks]
+        for block, (kind, source) in zip(blocks, new):
+            if kind == "markdown":
+                if source != block.source:
+                    block.source = source
+                    block.html = render_markdown(source)
+            else:
+                self._compile(block, source)
+        self.blocks = blocks
+        redraw = self._redraw or not same_structure
+
+        def check():
+            if cancelled is not None and cancelled():
+                # Some of the blocks are already updated, but they haven't
+                # been sent anywhere.
+                self._redraw = True
+                raise watcher.Cancelled()
+
+        restored = set()
+        if self.cache is not None:
+            restored = self._restore_all(check)
+
+        previewed = set()
+        samples = config.get("samples")
+        for n in self.stages:
+            if n >= samples:
+                continue
+            indices = self._preview(n, check, restored)
+            previewed.update(indices)
+            if progress is not None and indices:
+                progress(None if redraw else indices)
+
+        env, keys = {}, {}
+        for block in blocks:
+            if block.kind == "fermi":
+                check()
+                self._run(block, env, keys)
+        self._redraw = False
+        if redraw:
+            return None
+        return [
+            index
+            for index, block in enumerate(blocks)
+            if block.html is not before[index] or index in previewed
+        ]
+
+    def _compile(self, block, source):
+        code = FERMI_BLOCK.match(source + "\n").group(2)
+        if source != block.source:
+            block.source = source
+            # Pygments has no lexer for fermi, and guessing one is slow.
+            block.code_html = (
+                "<div class='codehilite'><pre><code>"
+                f"{html.escape(code)}</code></pre></div>"
+            )
+        compiled = block.plan is not None or block.error is not None
+        if code != block.code or not compiled:
+            if block.tree is not None:
+                parser.edit(block.tree, block.code, code)
+            block.tree = parser.parse_tree(code, block.tree)
+            block.code = code
+            try:
+                block.plan = evaluator.compile(code, block.tree)
+                block.error = None
+            except evaluator.FermiError as e:
+                block.plan = None
+                block.error = f"<div class='fermierror'>{html.escape(str(e))}</div>"
+            block.inputs = None
+            block.html = None
+
+    def _preview(self, n, check, restored=()):
+        """Runs the blocks that are out of date with `n` samples, returns their indices.
+
+        Blocks in `restored` are up to date, whatever they use.
+        """
+        env = {}
+        changed_names = set()
+        indices = []
+        for index, block in enumerate(self.blocks):
+            if block.kind != "fermi" or block.plan is None:
+                continue
+            if index not in restored and (
+                block.inputs is None or block.plan.uses & changed_names
+            ):
+                check()
+                with config.samples(n):
+                    output, bindings = run_fermi(block.plan, env)
+                changed_names.update(block.plan.defines)
+                block.html = (
+                    f"{block.code_html}\n<div class='fermiout preview'>{output}"
+                    f"<br><small>{n:,} samples, refining...</small></div>"
+                )
+                indices.append(index)
+            else:
+                bindings = block.bindings
+            env.update({name: subsample(v, n) for name, v in bindings.items()})
+        return indices
+
+    def _inputs(self, block, env):
+        """The values of the names the block uses, and whether they changed since it ran."""
+        inputs = {name: env.get(name, _MISSING) for name in block.plan.uses}
+        stale = block.inputs is None or any(
+            block.inputs.get(name, _MISSING) is not value
+            for name, value in inputs.items()
+        )
+        return inputs, stale
+
+    def _key(self, block, keys):
+        """The cache key of a block, from the `keys` of the blocks that bound the names it uses."""
+        if self.cache is None:
+            return None
+        return diskcache.key(
+            block.code, {name: keys.get(name) for name in block.plan.uses}
+        )
+
+    def _restore(self, block, key):
+        """Restores the result of the block from the cache, if it is there."""
+        entry = self.cache.get(key)
+        if entry is None:
+            return False
+        block.output, block.bindings = entry
+        block.key = key
+        self.restored += 1
+        return True
+
+    def _restore_all(self, check):
+        """Restores the out of date blocks that are in the cache, returns their indices."""
+        keys = {}
+        restored = set()
+        for index, block in enumerate(self.blocks):
+            if block.kind != "fermi" or block.plan is None:
+                continue
+            key = self._key(block, keys)
+            if key != block.key:
+                check()
+                if self._restore(block, key):
+                    # Whatever the inputs are now, they have the same key.
+                    block.inputs = None
+                    restored.add(index)
+            keys.update(dict.fromkeys(block.plan.defines, key))
+        return restored
+
+    def _run(self, block, env, keys):
+        if block.plan is None:
+            output, bindings = block.error, {}
+        else:
+            inputs, stale = self._inputs(block, env)
+            key = self._key(block, keys)
+            if key is not None:
+                # With a cache, the key says whether the result is current.
+                stale = key != block.key
+            if stale and not (key is not None and self._restore(block, key)):
+                self.runs += 1
+                start = time.perf_counter()
+                if key is None:
+                    block.output, block.bindings = run_fermi(block.plan, env)
+                else:
+                    with sampling.seeded(diskcache.seed(key)):
+                        block.output, block.bindings = run_fermi(block.plan, env)
+                    block.key = key
+                    seconds = time.perf_counter() - start
+                    self.cache.put(key, block.output, block.bindings, seconds)
+            block.inputs = inputs
+            keys.update(dict.fromkeys(block.plan.defines, key))
+            output, bindings = block.output, block.bindings
+        env.update(bindings)
+        rendered = f"{block.code_html}\n<div class='fermiout'>{output}</div>"
+        if rendered != block.html:
+            block.html = rendered
+
+    def html(self):
+        return "\n".join(
+            f"<div class='block' id='block-{index}'>{block.html}</div>"
+            for index, block in enumerate(self.blocks)
+        )
+
+
 class MarkdownHandler(FileSystemEventHandler):
+    """Renders the markdown files that change, once their events settle.
+
+    Rendering happens on the pipeline's worker threads, so the server stays
+    responsive, and blocks that take a while show quick estimates from
+    `stages` samples first.  The documents share the `cache` of results.
+    """
+
+    def __init__(self, delay=0.1, workers=2, stages=(2_000, 20_000), cache=None):
+        super().__init__()
+        self.stages = stages
+        self.cache = cache
+        self.documents = {}
+        self.contents = {}
+        self.pipeline = watcher.Pipeline(self.render, delay=delay, workers=workers)
+
+    def _changed(self, path):
+        if path.endswith(".md"):
+            self.pipeline.submit(path)
+
     def on_modified(self, event):
-        if event.src_path.endswith(".md"):
-            eprint(f"Updating {event.src_path}...")
-            with open(event.src_path, "r") as f:
+        if not event.is_directory:
+            self._changed(event.src_path)
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self._changed(event.src_path)
+
+    def on_moved(self, event):
+        # Some editors save by writing a new file and moving it into place.
+        if not event.is_directory:
+            self._changed(event.dest_path)
+
+    def render(self, path, cancelled):
+        try:
+            with open(path, "r") as f:
                 content = f.read()
-                content = preprocess_math(content)
-                content = preprocess_fermi(content)
-            html = markdown.markdown(
-                content, extensions=[FermiExtension(), "codehilite", "fenced_code"]
+        except FileNotFoundError:
+            return
+        if content == self.contents.get(path):
+            return
+        eprint(f"Updating {path}...")
+        start = time.perf_counter()
+        document = self.documents.setdefault(path, Document(self.stages, self.cache))
+        changed = document.update(
+            content,
+            cancelled,
+            progress=lambda changed: self.emit(path, document, changed),
+        )
+        self.contents[path] = content
+        self.emit(path, document, changed)
+        eprint(f"Updated in {1e3 * (time.perf_counter() - start):.1f}ms")
+
+    def emit(self, path, document, changed):
+        if changed is None:
+            socketio.emit("update", {"path": path, "html": document.html()})
+        elif changed:
+            patches = [
+                {"id": f"block-{index}", "html": document.blocks[index].html}
+                for index in changed
+            ]
+            socketio.emit("patch", {"path": path, "blocks": patches})
+
+    def show(self, data):
+        """Sends the client that asks for it the whole of the document at `data["path"]`.
+
+        Patches go to every client, and a client that is showing another
+        document asks for the whole of the patched one instead.
+        """
+        document = self.documents.get(data.get("path"))
+        if document is not None:
+            flask_socketio.emit(
+                "update", {"path": data["path"], "html": document.html()}
             )
-            socketio.emit("update", {"html": html})
 
 
 @app.route("/")
@@ -139,10 +553,11 @@ def index():
 
 
 if __name__ == "__main__":
-    path = "."  # Path to watch
-    event_handler = MarkdownHandler()
+    path = sys.argv[1] if len(sys.argv) > 1 else "."  # Path to watch
+    event_handler = MarkdownHandler(cache=diskcache.DiskCache())
+    socketio.on_event("show", event_handler.show)
     observer = Observer()
-    observer.schedule(event_handler, path, recursive=False)
+    observer.schedule(event_handler, path, recursive=True)
     observer.start()
 
     try:
@@ -150,3 +565,5 @@ if __name__ == "__main__":
     except KeyboardInterrupt:
         observer.stop()
     observer.join()
+    event_handler.pipeline.close()
+    event_handler.cache.close()
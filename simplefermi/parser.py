@@ -1,11 +1,86 @@
+"""Parsing fermi blocks with the tree-sitter grammar.
+
+Each thread keeps one `tree_sitter.Parser`, since parsers can't be shared
+between threads but are expensive to make for every parse.  Trees are kept
+in a cache keyed by a hash of their source, so parsing the same block again,
+from any thread or document, is a dictionary lookup.
+"""
+
+import hashlib
+import threading
+
 import tree_sitter
-import tree_sitter_fermi as tsfermi
+
+from simplefermi import tree_sitter_fermi as tsfermi
+from simplefermi import utils
 
 FERMI = tree_sitter.Language(tsfermi.language())
 
+_local = threading.local()
+
+# Parsed trees, keyed by a hash of their source.
+tree_cache = utils.LRUCache(maxsize=1024)
+
+
+def parser() -> tree_sitter.Parser:
+    """The parser of the current thread."""
+    try:
+        return _local.parser
+    except AttributeError:
+        _local.parser = tree_sitter.Parser(FERMI)
+        return _local.parser
+
+
+def _key(data: bytes):
+    return hashlib.blake2b(data, digest_size=16).digest()
+
 
 def parse(s: str):
-    parser = tree_sitter.Parser()
-    parser.set_language(FERMI)
-    return parser.parse(bytes(s, "utf-8")).root_node
-    return parser.parse(bytes(s, "utf-8")).root_node.sexp()
+    return parse_tree(s).root_node
+
+
+def parse_tree(s: str, old_tree=None):
+    """Parses `s` into a tree, reusing the unchanged parts of `old_tree` (see `edit`).
+
+    The tree is a copy of the cached one, so it can be edited.
+    """
+    data = bytes(s, "utf-8")
+    key = _key(data)
+    tree = tree_cache.get(key)
+    if tree is None:
+        if old_tree is None:
+            tree = parser().parse(data)
+        else:
+            tree = parser().parse(data, old_tree)
+        tree_cache.put(key, tree)
+    return tree.copy()
+
+
+def _point(data: bytes, offset: int):
+    row = data.count(b"\n", 0, offset)
+    return row, offset - (data.rfind(b"\n", 0, offset) + 1)
+
+
+def edit(tree, old: str, new: str):
+    """Tells `tree`, parsed from `old`, about the edit that turns it into `new`.
+
+    The edit is taken to be the single span between the longest common prefix
+    and suffix, which is what a save in an editor usually is.
+    """
+    old, new = bytes(old, "utf-8"), bytes(new, "utf-8")
+    start = 0
+    end = min(len(old), len(new))
+    while start < end and old[start] == new[start]:
+        start += 1
+    suffix = 0
+    while suffix < end - start and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+    tree.edit(
+        start_byte=start,
+        old_end_byte=len(old) - suffix,
+        new_end_byte=len(new) - suffix,
+        start_point=_point(old, start),
+        old_end_point=_point(old, len(old) - suffix),
+        new_end_point=_point(new, len(new) - suffix),
+    )
+    return tree
@@ -0,0 +1,576 @@
+"""Random number generation for the distributions.
+
+Every call to `draw` gets its own `numpy.random.SeedSequence`.  The samples
+are split into fixed size blocks and each block is drawn from its own
+`Generator`, seeded by spawning a child of that sequence.  Since the split
+into blocks does not depend on how many workers there are, the blocks can be
+filled on a thread or process pool and the result is bit-identical for any
+number of workers.
+"""
+
+import atexit
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import itertools
+import threading
+import warnings
+import zlib
+
+import numpy as np
+import scipy.special
+
+from simplefermi import config
+from simplefermi import storage
+from simplefermi import utils
+
+__all__ = [
+    "parallel",
+    "set_parallel",
+    "seed",
+    "rng",
+    "memoize",
+    "quasi",
+    "set_design",
+    "reduced",
+    "set_reduction",
+]
+
+# Changing the block size changes which samples a given seed produces.
+BLOCK = 2**16
+
+# The seed sequence the next draws spawn their seeds from.  The one set by a
+# `with rng(...)` block takes precedence over the global one set by `seed`,
+# and if neither is set every draw gets fresh entropy from the OS.
+_root = contextvars.ContextVar("simplefermi_root", default=None)
+_global_root = None
+_spawn_lock = threading.Lock()
+
+
+def _as_seed_sequence(seed):
+    if isinstance(seed, np.random.SeedSequence):
+        return _fresh(seed)
+    return np.random.SeedSequence(seed)
+
+
+def seed(seed=None):
+    """Seeds all of the following draws, `seed(None)` goes back to fresh entropy.
+
+    >>> seed(42)
+    >>> lognormal(1, 10)  # the same samples every time
+    """
+    global _global_root
+    _global_root = None if seed is None else _as_seed_sequence(seed)
+
+
+def rng(seed=None):
+    """Context manager in which every draw is reproducible from `seed`.
+
+    The seed only applies to the current thread (or asyncio task), so models can
+    be run concurrently without interfering with each other's random numbers.
+
+    >>> with rng(42):
+    ...     x = lognormal(1, 10)
+    """
+    return seeded(_as_seed_sequence(seed))
+
+
+def _current_root():
+    root = _root.get()
+    if root is None:
+        return _global_root
+    return root
+
+
+def state():
+    """A hashable description of where the seeded random stream currently is.
+
+    Two runs that start from the same state (with the same sample policy) draw
+    the same samples, so this is a key for caching results.  Returns None if
+    nothing is seeded.
+    """
+    root = _current_root()
+    if root is None:
+        return None
+    return (
+        *root_key(),
+        root.n_children_spawned,
+        config.get("samples"),
+        config.get("dtype").str,
+        design_key(),
+    )
+
+
+def root_key():
+    """A hashable description of the current root, None if nothing is seeded."""
+    root = _current_root()
+    if root is None:
+        return None
+    return (tuple(np.atleast_1d(root.entropy).tolist()), root.spawn_key)
+
+
+def derive(key, default=None):
+    """A seed for `key` derived from the current root (or `default`), without spawning from it."""
+    root = _current_root()
+    if root is None:
+        if default is None:
+            return np.random.SeedSequence()
+        root = _as_seed_sequence(default)
+    return np.random.SeedSequence(
+        root.entropy,
+        spawn_key=root.spawn_key + (zlib.crc32(key.encode()),),
+        pool_size=root.pool_size,
+    )
+
+
+def _advance(root, count):
+    with _spawn_lock:
+        root.spawn(count)
+
+
+def memoize(fn=None, maxsize=32):
+    """Caches the results of an expensive model by its arguments and the seed.
+
+    Results are only cached while a seed is set, and a cached call advances the
+    random stream exactly as far as running the model would have, so the draws
+    that come after it are unchanged.
+
+    >>> @memoize
+    ... def model(efficiency):
+    ...     return lognormal(1, 10) * efficiency
+    """
+    if fn is None:
+        return functools.partial(memoize, maxsize=maxsize)
+    cache = utils.LRUCache(maxsize)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        root, key = _current_root(), state()
+        if key is not None:
+            key = (key, args, tuple(sorted(kwargs.items())))
+            try:
+                hash(key)
+            except TypeError:
+                key = None
+        if key is None:
+            return fn(*args, **kwargs)
+        cached = cache.get(key)
+        if cached is not None:
+            spawned, result = cached
+            _advance(root, spawned)
+            return result
+        before = root.n_children_spawned
+        result = fn(*args, **kwargs)
+        cache.put(key, (root.n_children_spawned - before, result))
+        return result
+
+    wrapper.cache = cache
+    return wrapper
+
+
+def set_parallel(workers=config.UNSET, backend=config.UNSET):
+    """Sets the default number of workers and whether they are "thread"s or "process"es."""
+    config.update(workers=workers, backend=backend)
+
+
+def parallel(workers=config.UNSET, backend=config.UNSET):
+    """Context manager that draws samples on a pool of workers.
+
+    >>> with parallel(8):
+    ...     x = lognormal(1, 10, n=10_000_000)
+    """
+    return config.using(workers=workers, backend=backend)
+
+
+def spawn():
+    """A new seed sequence, a child of the current root if there is one."""
+    root = _current_root()
+    if root is None:
+        return np.random.SeedSequence()
+    with _spawn_lock:
+        return root.spawn(1)[0]
+
+
+def _fresh(seed):
+    """A copy of `seed` that has not spawned any children yet."""
+    return np.random.SeedSequence(
+        seed.entropy, spawn_key=seed.spawn_key, pool_size=seed.pool_size
+    )
+
+
+@contextlib.contextmanager
+def seeded(seed):
+    """Draws inside the block spawn their seeds from `seed`, so they are reproducible."""
+    token = _root.set(_fresh(seed))
+    try:
+        yield
+    finally:
+        _root.reset(token)
+
+
+def _block(seed, method, size, params):
+    return getattr(np.random.Generator(np.random.PCG64(seed)), method)(
+        size=size, **params
+    )
+
+
+_executors = {}
+
+
+def _executor(backend, workers):
+    key = (backend, workers)
+    if key not in _executors:
+        if backend == "process":
+            _executors[key] = concurrent.futures.ProcessPoolExecutor(workers)
+        else:
+            _executors[key] = concurrent.futures.ThreadPoolExecutor(workers)
+    return _executors[key]
+
+
+@atexit.register
+def _shutdown():
+    for pool in _executors.values():
+        pool.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+
+
+def fill(seed, method, size, workers=1, backend="thread", **params):
+    """Draws `size` samples with the `Generator` method, blockwise from `seed`."""
+    starts = range(0, size, BLOCK)
+    seeds = _fresh(seed).spawn(len(starts))
+    sizes = [min(BLOCK, size - start) for start in starts]
+    if not size:
+        return _block(seed, method, 0, params)
+
+    # The first block tells us the dtype of the output.
+    first = _block(seeds[0], method, sizes[0], params)
+    out = storage.empty(size, first.dtype)
+    out[: first.size] = first
+
+    def task(item):
+        start, seed, size = item
+        out[start : start + size] = _block(seed, method, size, params)
+
+    rest = list(zip(starts, seeds, sizes))[1:]
+    if workers <= 1 or not rest:
+        for item in rest:
+            task(item)
+    elif backend == "process":
+        pool = _executor(backend, workers)
+        blocks = pool.map(
+            _block,
+            [seed for _, seed, _ in rest],
+            itertools.repeat(method),
+            [size for _, _, size in rest],
+            itertools.repeat(params),
+        )
+        for (start, _, size), block in zip(rest, blocks):
+            out[start : start + size] = block
+    else:
+        # Generators release the GIL while filling, so threads run in parallel.
+        list(_executor(backend, workers).map(task, rest))
+    return out
+
+
+def draw(method, size, **params):
+    """Draws `size` samples from a `numpy.random.Generator` method, e.g. `draw("beta", n, a=1, b=2)`."""
+    design = config.get("design")
+    if design != "random" and method in _INVERSE_CDFS:
+        seed = spawn()
+        u = _uniforms(design, _dimension(seed), seed, size)
+        return _INVERSE_CDFS[method](u, **params)
+    reduction = config.get("reduction")
+    if reduction == "antithetic" and method in _MIRRORS:
+        return _antithetic(method, size, **params)
+    if reduction == "stratified" and method in _INVERSE_CDFS:
+        u = _uniforms("lhs", None, spawn(), size)
+        return _INVERSE_CDFS[method](u, **params)
+    return fill(
+        spawn(),
+        method,
+        size,
+        workers=config.get("workers"),
+        backend=config.get("backend"),
+        **params,
+    )
+
+
+## Designs
+
+# Instead of pseudo-random numbers, every input can be drawn from its own
+# dimension of a scrambled low discrepancy sequence ("sobol" or "halton"), or
+# from a Latin hypercube ("lhs").  Each input scrambles its dimension with its
+# own seed, which keeps the points evenly spread but breaks up the
+# correlations between the higher dimensions of the plain sequences.  The
+# uniform numbers are turned into samples with the inverse of the
+# distribution's CDF.
+
+# Only this many inputs get a dimension of their own, the rest are drawn from
+# a Latin hypercube.
+DIMENSIONS = 64
+
+# The precision of the Sobol points.
+_BITS = 30
+
+_INVERSE_CDFS = {
+    "random": lambda u: u,
+    "standard_normal": lambda u: scipy.special.ndtri(u),
+    "standard_t": lambda u, df: scipy.special.stdtrit(df, u),
+    "gamma": lambda u, shape: scipy.special.gammaincinv(shape, u),
+    "beta": lambda u, a, b: scipy.special.betaincinv(a, b, u),
+    "exponential": lambda u: -np.log1p(-u),
+}
+
+
+def set_design(kind=config.UNSET):
+    """Sets whether inputs are drawn "random"ly, from "sobol" or "halton" sequences or from an "lhs"."""
+    global _global_dimensions
+    config.update(design=kind)
+    _global_dimensions = _Dimensions()
+
+
+@contextlib.contextmanager
+def quasi(kind="sobol"):
+    """Context manager in which inputs are drawn from a low discrepancy sequence.
+
+    Every input drawn in the block gets its own dimension of a randomized
+    "sobol" or "halton" sequence, or of a Latin hypercube with "lhs", so
+    quantiles converge much faster than with pseudo-random samples.
+
+    >>> with quasi(), samples(10_000):
+    ...     x = lognormal(1, 10) * lognormal(2, 20)
+    """
+    with within(_Dimensions()), config.using(design=kind):
+        yield
+
+
+class _Dimensions:
+    """The dimensions handed out to the inputs, by their seeds."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.assigned = {}
+        self.count = 0
+        self.warned = False
+
+
+_global_dimensions = _Dimensions()
+_dimensions = contextvars.ContextVar("simplefermi_dimensions", default=None)
+
+
+def dimensions():
+    """The dimensions handed out to the inputs drawn now, the same for a whole `quasi` block.
+
+    Inputs that share a dimension are correlated, so anything that is drawn
+    later but belongs with the inputs of a block has to use its dimensions,
+    see `within`.
+    """
+    return _dimensions.get() or _global_dimensions
+
+
+@contextlib.contextmanager
+def within(dimensions):
+    """Draws inside the block take their dimensions from `dimensions`, None for the global ones."""
+    token = _dimensions.set(dimensions)
+    try:
+        yield
+    finally:
+        _dimensions.reset(token)
+
+
+def design_key():
+    """A hashable description of the design and variance reduction of the draws made now.
+
+    For a low discrepancy design it includes the dimensions handed out, so
+    the draws of one `quasi` block don't match those of another.
+    """
+    design = config.get("design")
+    return (
+        design,
+        config.get("reduction"),
+        None if design == "random" else dimensions(),
+    )
+
+
+def _dimension(seed):
+    """The dimension for the input drawn with `seed`, None once they have run out.
+
+    An input drawn again with the same seed gets the same dimension, so
+    seeded draws stay reproducible.  The dimensions are handed out again in
+    every `quasi` block, and after every `set_design`.
+    """
+    current = dimensions()
+    with current.lock:
+        if not seed.spawn_key:
+            # Unseeded draws have nothing to be reproducible with.
+            key = current.count
+        else:
+            key = (tuple(np.atleast_1d(seed.entropy).tolist()), seed.spawn_key)
+        if key not in current.assigned:
+            if current.count >= DIMENSIONS:
+                if not current.warned:
+                    current.warned = True
+                    warnings.warn(
+                        f"All {DIMENSIONS} dimensions of the low discrepancy sequence "
+                        "are in use, further inputs are drawn from a Latin hypercube. "
+                        "Draw each model in its own `with quasi():` block.",
+                        stacklevel=4,
+                    )
+                return None
+            current.assigned[key] = current.count
+            current.count += 1
+        return current.assigned[key]
+
+
+# The unscrambled Sobol points, as integers, by size.
+_points = utils.LRUCache(maxsize=4)
+
+
+def _sobol(dimension, size):
+    from scipy.stats import qmc
+
+    points = _points.get(size)
+    if points is None or points.shape[1] <= dimension:
+        # Made for a few more dimensions than needed, they are cheap.
+        d = min(DIMENSIONS, 2 * (dimension + 1))
+        with warnings.catch_warnings():
+            # Sobol points are only balanced for powers of two.
+            warnings.simplefilter("ignore", UserWarning)
+            points = qmc.Sobol(d, scramble=False, bits=_BITS).random(size)
+        points = np.ldexp(points, _BITS).astype(np.uint32)
+        _points.put(size, points)
+    return points[:, dimension]
+
+
+def _digits(size, base):
+    """How many digits in `base` the indices of `size` points have."""
+    digits, scale = 0, 1
+    while scale < size:
+        digits, scale = digits + 1, scale * base
+    return digits
+
+
+def _scrambled_sobol(dimension, size, generator):
+    """One dimension of the Sobol points with a random linear scramble and digital shift.
+
+    The first `size` points only differ in their leading bits, the bits
+    below them are filled in at random.
+    """
+    x = _sobol(dimension, size)
+    bits = min(_BITS, _digits(size, 2))
+    u = np.zeros(size, dtype=np.uint32)
+    for i in range(bits):
+        # Bit i (counting from the most significant one) of the scrambled
+        # point is a random combination of bit i and the bits above it.
+        mask = int(generator.integers(0, 2**i)) << (_BITS - i) | 1 << (_BITS - 1 - i)
+        parity = np.bitwise_count(x & np.uint32(mask)) & np.uint32(1)
+        u |= parity << np.uint32(_BITS - 1 - i)
+    u ^= np.uint32(int(generator.integers(0, 2**bits)) << (_BITS - bits))
+    return np.ldexp(u, -_BITS) + np.ldexp(generator.random(size), -bits)
+
+
+def _primes(n):
+    primes = []
+    candidate = 2
+    while len(primes) < n:
+        if all(candidate % p for p in primes if p * p <= candidate):
+            primes.append(candidate)
+        candidate += 1
+    return primes
+
+
+_PRIMES = _primes(DIMENSIONS)
+
+
+def _scrambled_halton(dimension, size, generator):
+    """One dimension of the Halton points, with every digit randomly permuted.
+
+    Below the digits that the first `size` points differ in, they are filled
+    in at random.
+    """
+    base = _PRIMES[dimension]
+    digits = _digits(size, base)
+    # The digits are scrambled a few at a time, with a table of the scrambled
+    # values of all the combinations of them.
+    group = max(1, _digits(4096, base) - 1)
+    index = np.arange(size)
+    u = np.zeros(size)
+    scale = 1.0
+    for start in range(0, digits, group):
+        count = min(group, digits - start)
+        values = np.arange(base**count)
+        table = np.zeros(values.size)
+        step = 1.0
+        for _ in range(count):
+            step /= base
+            values, digit = np.divmod(values, base)
+            table += step * generator.permutation(base)[digit]
+        index, low = np.divmod(index, base**count)
+        u += scale * table[low]
+        scale *= step
+    return u + scale * generator.random(size)
+
+
+def _uniforms(kind, dimension, seed, size):
+    """Uniform numbers in (0, 1) for one input."""
+    generator = np.random.Generator(np.random.PCG64(seed))
+    if kind == "lhs" or dimension is None:
+        u = (generator.permutation(size) + generator.random(size)) / size
+    elif kind == "sobol":
+        u = _scrambled_sobol(dimension, size, generator)
+    else:
+        u = _scrambled_halton(dimension, size, generator)
+    return np.clip(u, _TINY, 1 - _EPS)
+
+
+_TINY = np.finfo(np.float64).tiny
+_EPS = np.finfo(np.float64).epsneg
+
+
+## Variance reduction
+
+# Symmetric draws can be made in antithetic pairs, the second half of the
+# samples mirrors the first.  Every input mirrors at the same positions, so
+# the samples of a model come in mirrored pairs too.
+_MIRRORS = {
+    "standard_normal": lambda x, out: np.negative(x, out=out),
+    "standard_t": lambda x, out: np.negative(x, out=out),
+    "random": lambda x, out: np.subtract(1.0, x, out=out),
+}
+
+
+def set_reduction(kind=config.UNSET):
+    """Sets whether draws are made "antithetic"ally, "stratified" or with "none" of them."""
+    config.update(reduction=kind)
+
+
+def reduced(kind="antithetic"):
+    """Context manager in which draws are made with a variance reduction.
+
+    With "antithetic" the normal, student-t and uniform draws come in
+    mirrored pairs, with "stratified" every draw takes one sample from each of
+    `n` equally likely strata.  Either way the mean and quantiles of a model
+    vary less than with independent samples.  The low discrepancy designs of
+    `quasi` take precedence.
+
+    >>> with reduced("stratified"):
+    ...     x = lognormal(1, 10) * percent(20)
+    """
+    return config.using(reduction=kind)
+
+
+def _antithetic(method, size, **params):
+    half = (size + 1) // 2
+    first = fill(
+        spawn(),
+        method,
+        half,
+        workers=config.get("workers"),
+        backend=config.get("backend"),
+        **params,
+    )
+    out = storage.empty(size, first.dtype)
+    out[:half] = first
+    _MIRRORS[method](first[: size - half], out[half:])
+    return out
@@ -0,0 +1,473 @@
+"""A compact file format for uncertain quantities.
+
+    >>> save("results.sfq", {"mass": atm_mass, "moles": atm_mol})
+    >>> load("results.sfq")["mass"]
+
+A file holds any number of named values, each stored in the smallest way
+that describes it:
+
+* Lazy values (see `graph.lazy`) whose leaves are calls to the distributions
+  are stored as their provenance: every distribution call with its arguments,
+  seed, design and variance reduction, and the operations that combine them.
+  Loading gives back the same lazy value, which draws the same samples when
+  it is evaluated.
+* Other quantities are stored as their samples, either as they are or
+  quantized to 16 or 8 bits (in log space for positive samples).
+* Streamed results, or any quantity with `encoding="sketch"`, are stored as
+  their quantile sketch and moments.
+
+The file starts with a json header that describes the values, followed by
+their arrays, each aligned to 64 bytes.  Arrays stored as they are are
+loaded without copying: from a memory map of the file, or with
+`np.frombuffer` when loading from bytes.
+"""
+
+import io
+import json
+import os
+import struct
+
+import numpy as np
+import pint
+
+from simplefermi import distributions
+from simplefermi import graph
+from simplefermi import sampling
+from simplefermi import streaming
+from simplefermi.core import ureg
+
+__all__ = ["save", "load"]
+
+MAGIC = b"SFQ\x01"
+ALIGN = 64
+
+_ENCODINGS = ("raw", "quantized", "sketch")
+
+
+class FormatError(ValueError):
+    """The data isn't a file of quantities that can be read."""
+
+
+## Writing
+
+
+class _Writer:
+    def __init__(self):
+        self.blobs = []
+        self.size = 0
+        # The dimensions of the `quasi` blocks the stored leaves were made in.
+        self.dimensions = []
+
+    def dimension_group(self, dimensions):
+        """The index of the dimensions of a leaf in the header, None if it has none."""
+        if dimensions is None:
+            return None
+        for i, other in enumerate(self.dimensions):
+            if other is dimensions:
+                return i
+        self.dimensions.append(dimensions)
+        return len(self.dimensions) - 1
+
+    def array(self, values):
+        """Adds the bytes of an array, returns where they are in the data."""
+        values = np.asarray(values, order="C")
+        offset = self.size
+        self.blobs.append(values)
+        self.size += _padded(values.nbytes)
+        return {
+            "dtype": values.dtype.str,
+            "shape": list(values.shape),
+            "offset": offset,
+        }
+
+
+def _padded(size):
+    return -(-size // ALIGN) * ALIGN
+
+
+def _units(value):
+    if isinstance(value, pint.Quantity):
+        return str(value.units)
+    return None
+
+
+def _json_value(value, nodes):
+    """An argument of a distribution as json, raises TypeError if it can't be."""
+    if isinstance(value, graph.Node):
+        return {"node": nodes[id(value)]}
+    if isinstance(value, pint.Quantity) and np.ndim(value.magnitude) == 0:
+        return {"quantity": [_json_value(value.magnitude, nodes), str(value.units)]}
+    if isinstance(value, pint.Unit):
+        return {"unit": str(value)}
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (bool, int, float, str, type(None))):
+        return value
+    if isinstance(value, (list, tuple)):
+        return {"list": [_json_value(v, nodes) for v in value]}
+    raise TypeError(f"Can't store {type(value).__name__} arguments.")
+
+
+def _seed(seed):
+    entropy = seed.entropy
+    if isinstance(entropy, np.ndarray):
+        entropy = entropy.tolist()
+    return {
+        "entropy": entropy,
+        "spawn_key": list(seed.spawn_key),
+        "pool_size": seed.pool_size,
+    }
+
+
+def _assigned(dimensions):
+    """The dimensions handed out to the inputs of a `quasi` block, as json."""
+    with dimensions.lock:
+        assigned = [
+            [key if isinstance(key, int) else [list(key[0]), list(key[1])], dimension]
+            for key, dimension in dimensions.assigned.items()
+        ]
+        return {"count": dimensions.count, "assigned": assigned}
+
+
+def _provenance(root, writer):
+    """The nodes of a lazy graph as json, in evaluation order, or None if it can't be stored."""
+    order, seen, stack = [], set(), [(root, False)]
+    while stack:
+        node, ready = stack.pop()
+        if ready:
+            order.append(node)
+            continue
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        stack.append((node, True))
+        children = node.children
+        if isinstance(node, graph.Leaf):
+            children = [
+                x
+                for x in [*node.args, *node.kwargs.values()]
+                if isinstance(x, graph.Node)
+            ]
+        stack.extend((child, False) for child in children)
+    nodes, described = {}, []
+    try:
+        for node in order:
+            entry = {"units": str(node.units), "quantity": node.quantity}
+            if isinstance(node, graph.Leaf):
+                name = node.fn.__name__
+                if getattr(distributions, name, None) is None:
+                    return None
+                entry.update(
+                    type="leaf",
+                    fn=name,
+                    args=[_json_value(x, nodes) for x in node.args],
+                    kwargs={k: _json_value(v, nodes) for k, v in node.kwargs.items()},
+                    seed=_seed(node.seed),
+                    samples=node.settings["samples"],
+                    dtype=node.settings["dtype"].str,
+                    design=node.settings["design"],
+                    reduction=node.settings["reduction"],
+                    dimensions=writer.dimension_group(node.dimensions),
+                )
+            elif isinstance(node, graph.Op):
+                entry.update(
+                    type="op",
+                    ufunc=node.ufunc.__name__,
+                    children=[nodes[id(child)] for child in node.children],
+                    scales=list(node.scales),
+                    scale=node.scale,
+                )
+            elif isinstance(node, graph.Const) and node.scalar:
+                entry.update(type="const", value=_json_value(node.value, nodes))
+            else:
+                return None
+            nodes[id(node)] = len(described)
+            described.append(entry)
+    except TypeError:
+        return None
+    return described
+
+
+def quantize(values, bits):
+    """Finite samples rounded to `bits` bits, as codes and the scale that decodes them."""
+    dtype = np.uint16 if bits == 16 else np.uint8
+    log = bool(values.min() > 0)
+    x = np.log(values) if log else values.astype(np.float64)
+    low, high = float(x.min()), float(x.max())
+    step = (high - low) / (2**bits - 1) or 1.0
+    codes = np.rint((x - low) / step).astype(dtype)
+    return codes, {"log": log, "low": low, "step": step}
+
+
+def dequantize(codes, scale, dtype):
+    """The samples that `quantize` gave `codes` and `scale` for, rounded."""
+    x = scale["low"] + scale["step"] * codes
+    if scale["log"]:
+        x = np.exp(x)
+    return x.astype(dtype)
+
+
+def _sketch(result, writer):
+    sketch = result.sketch
+    stores = {}
+    for side in ("positive", "negative"):
+        store = getattr(sketch, side)
+        stores[side] = {"offset": store.offset, "counts": writer.array(store.counts)}
+    return {
+        "alpha": sketch.alpha,
+        "max_bins": sketch.max_bins,
+        "zeros": sketch.zeros,
+        "count": sketch.count,
+        "min": sketch.min,
+        "max": sketch.max,
+        "stores": stores,
+        "n": result.n,
+        "mean": result.mean,
+        "m2": result._m2,
+        "history": [list(map(float, h)) for h in result.history],
+    }
+
+
+def _entry(value, writer, encoding, bits):
+    if isinstance(value, graph.Node):
+        nodes = _provenance(value, writer)
+        if nodes is not None:
+            return {"kind": "graph", "nodes": nodes}
+        value = value.evaluate()
+    if isinstance(value, streaming.Result):
+        units = None if value.units is None else str(value.units)
+        return {"kind": "sketch", "units": units, **_sketch(value, writer)}
+    magnitude = np.asarray(getattr(value, "magnitude", value))
+    if magnitude.dtype.kind not in "biuf":
+        raise TypeError(f"Can't store values of type {type(value).__name__}.")
+    if encoding == "sketch":
+        return _entry(streaming.Result().add(value), writer, encoding, bits)
+    units = _units(value)
+    if (
+        encoding == "quantized"
+        and magnitude.dtype.kind == "f"
+        and magnitude.size
+        and np.isfinite(magnitude).all()
+    ):
+        codes, scale = quantize(magnitude, bits)
+        return {
+            "kind": "quantized",
+            "units": units,
+            "dtype": magnitude.dtype.str,
+            "codes": writer.array(codes),
+            **scale,
+        }
+    return {"kind": "samples", "units": units, "array": writer.array(magnitude)}
+
+
+def _write(out, values, encoding, bits):
+    if encoding not in _ENCODINGS:
+        raise ValueError(f"Encoding must be one of {_ENCODINGS}, not {encoding!r}.")
+    if bits not in (8, 16):
+        raise ValueError(f"Samples are quantized to 8 or 16 bits, not {bits}.")
+    batch = isinstance(values, dict)
+    writer = _Writer()
+    entries = {
+        str(name): _entry(value, writer, encoding, bits)
+        for name, value in (values.items() if batch else [("", values)])
+    }
+    header = {"version": 1, "batch": batch, "values": entries}
+    if writer.dimensions:
+        header["dimensions"] = [_assigned(d) for d in writer.dimensions]
+    header = json.dumps(header).encode()
+    size = len(MAGIC) + 8 + len(header)
+    out.write(MAGIC)
+    out.write(struct.pack("<Q", len(header)))
+    out.write(header)
+    out.write(b"\0" * (_padded(size) - size))
+    for blob in writer.blobs:
+        out.write(blob.reshape(-1).view(np.uint8).data)
+        out.write(b"\0" * (_padded(blob.nbytes) - blob.nbytes))
+
+
+def dumps(values, encoding="raw", bits=16):
+    """The bytes of a file holding `values`, a quantity or a dict of named ones; see `save`."""
+    out = io.BytesIO()
+    _write(out, values, encoding, bits)
+    return out.getvalue()
+
+
+def save(file, values, encoding="raw", bits=16):
+    """Saves a quantity, or a dict of named ones, to a file name or an open binary file.
+
+    Lazy values are stored by how they are made whenever they can be, the
+    `encoding` of the rest is one of:
+
+    * "raw": the samples as they are, which are loaded without a copy.
+    * "quantized": the samples rounded to `bits` bits, 4 or 8 times smaller.
+    * "sketch": a quantile sketch of the samples, loaded as a `streaming.Result`.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "wb") as f:
+            _write(f, values, encoding, bits)
+    else:
+        _write(file, values, encoding, bits)
+
+
+## Reading
+
+
+def _from_json(value, nodes):
+    if isinstance(value, dict):
+        if "node" in value:
+            return nodes[value["node"]]
+        if "quantity" in value:
+            magnitude, units = value["quantity"]
+            return ureg.Quantity(_from_json(magnitude, nodes), units)
+        if "unit" in value:
+            return ureg.Unit(value["unit"])
+        if "list" in value:
+            return [_from_json(v, nodes) for v in value["list"]]
+    return value
+
+
+def _dimensions(description):
+    dimensions = sampling._Dimensions()
+    dimensions.count = description["count"]
+    for key, dimension in description["assigned"]:
+        if not isinstance(key, int):
+            key = (tuple(key[0]), tuple(key[1]))
+        dimensions.assigned[key] = dimension
+    return dimensions
+
+
+def _graph(entries, dimensions):
+    nodes = []
+    for entry in entries:
+        units = ureg.Unit(entry["units"])
+        if entry["type"] == "leaf":
+            node = graph.Leaf.__new__(graph.Leaf)
+            node.fn = getattr(distributions, entry["fn"]).__wrapped__
+            node.args = [_from_json(x, nodes) for x in entry["args"]]
+            node.kwargs = {k: _from_json(v, nodes) for k, v in entry["kwargs"].items()}
+            node.settings = {
+                "samples": entry["samples"],
+                "dtype": np.dtype(entry["dtype"]),
+                "design": entry.get("design", "random"),
+                "reduction": entry.get("reduction", "none"),
+            }
+            group = entry.get("dimensions")
+            node.dimensions = None if group is None else dimensions[group]
+            seed = entry["seed"]
+            node.seed = np.random.SeedSequence(
+                seed["entropy"],
+                spawn_key=tuple(seed["spawn_key"]),
+                pool_size=seed["pool_size"],
+            )
+        elif entry["type"] == "op":
+            node = graph.Op(
+                getattr(np, entry["ufunc"]),
+                [nodes[i] for i in entry["children"]],
+                units,
+                scales=entry["scales"],
+                scale=entry["scale"],
+            )
+        else:
+            node = graph.Const(_from_json(entry["value"], nodes))
+        node.units = units
+        node.quantity = entry["quantity"]
+        nodes.append(node)
+    return nodes[-1]
+
+
+class _Reader:
+    def __init__(self, buffer, start, path=None):
+        self.buffer = buffer
+        self.start = start
+        self.path = path
+
+    def array(self, description):
+        dtype = np.dtype(description["dtype"])
+        shape = tuple(description["shape"])
+        offset = self.start + description["offset"]
+        count = int(np.prod(shape, dtype=np.int64))
+        if not count:
+            return np.empty(shape, dtype)
+        if self.path is not None:
+            values = np.memmap(self.path, dtype, "r", offset, shape)
+            return values.view(np.ndarray)
+        return np.frombuffer(self.buffer, dtype, count, offset).reshape(shape)
+
+
+def _with_units(magnitude, units):
+    if units is None:
+        return magnitude
+    return ureg.Quantity(magnitude, units)
+
+
+def _result(entry, reader):
+    units = None if entry["units"] is None else ureg.Unit(entry["units"])
+    result = streaming.Result(units=units, alpha=entry["alpha"])
+    sketch = result.sketch = streaming.Sketch(entry["alpha"], entry["max_bins"])
+    for side, store in entry["stores"].items():
+        getattr(sketch, side).offset = store["offset"]
+        getattr(sketch, side).counts = reader.array(store["counts"])
+    sketch.zeros, sketch.count = entry["zeros"], entry["count"]
+    sketch.min, sketch.max = entry["min"], entry["max"]
+    result.n, result.mean, result._m2 = entry["n"], entry["mean"], entry["m2"]
+    result.history = [tuple(h) for h in entry["history"]]
+    return result
+
+
+def _value(entry, reader, dimensions):
+    kind = entry["kind"]
+    if kind == "graph":
+        return _graph(entry["nodes"], dimensions)
+    if kind == "sketch":
+        return _result(entry, reader)
+    if kind == "quantized":
+        x = dequantize(reader.array(entry["codes"]), entry, entry["dtype"])
+        return _with_units(x, entry["units"])
+    if kind == "samples":
+        return _with_units(reader.array(entry["array"]), entry["units"])
+    raise FormatError(f"Unknown kind of value {kind!r}.")
+
+
+def _header(buffer):
+    if bytes(buffer[: len(MAGIC)]) != MAGIC:
+        raise FormatError("Not a file of simplefermi quantities.")
+    (size,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+    header = json.loads(bytes(buffer[len(MAGIC) + 8 : len(MAGIC) + 8 + size]))
+    return header, _padded(len(MAGIC) + 8 + size)
+
+
+def loads(data):
+    """The values stored in `data`, the arrays share its memory; see `load`."""
+    header, start = _header(memoryview(data))
+    reader = _Reader(data, start)
+    return _unpack(header, reader)
+
+
+def load(file):
+    """Loads what `save` saved to a file name (whose arrays are memory mapped) or a binary file.
+
+    Returns a single value, or a dict of them if a dict was saved.
+    """
+    if not isinstance(file, (str, os.PathLike)):
+        return loads(file.read())
+    with open(file, "rb") as f:
+        prefix = f.read(len(MAGIC) + 8)
+        if len(prefix) < len(MAGIC) + 8:
+            raise FormatError("Not a file of simplefermi quantities.")
+        (size,) = struct.unpack_from("<Q", prefix, len(MAGIC))
+        head = prefix + f.read(size)
+    header, start = _header(head)
+    return _unpack(header, _Reader(None, start, os.fspath(file)))
+
+
+def _unpack(header, reader):
+    if header.get("version") != 1:
+        raise FormatError(f"Unsupported version {header.get('version')!r}.")
+    dimensions = [_dimensions(d) for d in header.get("dimensions", [])]
+    values = {
+        name: _value(entry, reader, dimensions)
+        for name, entry in header["values"].items()
+    }
+    if header["batch"]:
+        return values
+    return values[""]
@@ -0,0 +1,273 @@
+"""Sample arrays that live in memory-mapped scratch files instead of RAM.
+
+Inside of `with mapped():` (or after `set_storage("mmap")`) large sample
+arrays are drawn into `MappedArray`s, `np.memmap`s of files in a scratch
+directory.  Elementwise arithmetic on them, which is what pint does with the
+magnitudes of quantities, runs over the files a chunk at a time and writes
+its result to a new file, so a model can have intermediates that are larger
+than RAM.  Their medians, intervals and quantiles are exact order statistics
+found in a few passes over the file, without sorting it.
+
+A mapped array is pickled as a reference to its file rather than its
+samples, which makes sending it to another process free.  The file is
+removed when the array that created it is garbage collected, so the array
+has to outlive its pickles.
+
+    >>> with mapped("/scratch"):
+    ...     x = lognormal(1, 10, n=1_000_000_000)
+"""
+
+import os
+import tempfile
+import weakref
+
+import numpy as np
+
+from simplefermi import config
+
+__all__ = ["mapped", "set_storage"]
+
+# Arrays smaller than this always stay in memory.
+MIN_BYTES = 2**20
+
+# The number of values worked on at a time.
+CHUNK = 2**20
+
+# Order statistics are narrowed down by counting the values in this many bins
+# at a time, until the bin that holds one is small enough to load.
+BINS = 256
+LIMIT = 2**23
+
+
+def set_storage(kind=config.UNSET, directory=config.UNSET):
+    """Sets whether large samples are kept in "memory" or "mmap"ed scratch files in `directory`.
+
+    A `directory` of None goes back to the system's temporary directory.
+    """
+    config.update(storage=kind, scratch=directory)
+
+
+def mapped(directory=config.UNSET):
+    """Context manager in which large samples are kept in scratch files in `directory`.
+
+    The directory defaults to the one set with `set_storage`, or else the
+    system's temporary directory.
+    """
+    return config.using(storage="mmap", scratch=directory)
+
+
+def _directory():
+    directory = config.get("scratch") or tempfile.gettempdir()
+    os.makedirs(directory, exist_ok=True)
+    return directory
+
+
+def empty(shape, dtype):
+    """A new uninitialized array, backed by a scratch file if it is large and the storage is "mmap"."""
+    dtype = np.dtype(dtype)
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    if config.get("storage") == "mmap" and nbytes >= MIN_BYTES:
+        return MappedArray.create(shape, dtype)
+    return np.empty(shape, dtype)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _open(path, dtype, shape, offset):
+    # Copy on write, so that changes made by whoever unpickled it stay local.
+    return MappedArray(path, dtype=dtype, mode="c", shape=shape, offset=offset)
+
+
+def _chunks(size, step=None):
+    step = step or CHUNK
+    for start in range(0, size, step):
+        yield slice(start, min(start + step, size))
+
+
+class MappedArray(np.memmap):
+    """A `np.memmap` whose elementwise arithmetic streams over the file in chunks."""
+
+    _finalizer = None
+
+    @classmethod
+    def create(cls, shape, dtype, directory=None):
+        """A new array in a scratch file, that is removed again with the array."""
+        fd, path = tempfile.mkstemp(
+            prefix="simplefermi-", suffix=".dat", dir=directory or _directory()
+        )
+        os.close(fd)
+        array = cls(path, dtype=dtype, mode="w+", shape=shape)
+        array._finalizer = weakref.finalize(array, _remove, path)
+        return array
+
+    def _root(self):
+        """The array that maps the file this one is a view of, None if it is in memory."""
+        array = self
+        while isinstance(array.base, MappedArray):
+            array = array.base
+        if array.base is None or isinstance(array.base, np.ndarray):
+            return None
+        return array
+
+    def __reduce__(self):
+        root = self._root()
+        if root is None or not self.flags.c_contiguous:
+            return np.asarray(self).view(np.ndarray).__reduce__()
+        start = self.__array_interface__["data"][0]
+        offset = root.offset + start - root.__array_interface__["data"][0]
+        return _open, (root.filename, self.dtype.str, self.shape, offset)
+
+    def __array_ufunc__(self, ufunc, method, *inputs, **kwargs):
+        inputs = [_plain(x) for x in inputs]
+        out = kwargs.pop("out", None)
+        if out is not None:
+            getattr(ufunc, method)(*inputs, out=tuple(_plain(x) for x in out), **kwargs)
+            return out[0] if len(out) == 1 else out
+        shape = np.broadcast_shapes(*(np.shape(x) for x in inputs))
+        if (
+            method != "__call__"
+            or ufunc.nout != 1
+            or "where" in kwargs
+            or not shape
+            or int(np.prod(shape, dtype=np.int64)) < MIN_BYTES // 8
+        ):
+            return getattr(ufunc, method)(*inputs, **kwargs)
+        # Only the arrays that span the leading axis are split into chunks,
+        # the rest broadcast against every chunk.
+        split = [
+            isinstance(x, np.ndarray) and x.ndim == len(shape) and x.shape[0] > 1
+            for x in inputs
+        ]
+        step = max(1, CHUNK // max(1, int(np.prod(shape[1:], dtype=np.int64))))
+        result = None
+        for chunk in _chunks(shape[0], step):
+            values = ufunc(
+                *[x[chunk] if s else x for x, s in zip(inputs, split)], **kwargs
+            )
+            if result is None:
+                result = MappedArray.create(shape, values.dtype)
+            result[chunk] = values
+        return result
+
+    def astype(self, dtype, order="K", casting="unsafe", subok=True, copy=True):
+        dtype = np.dtype(dtype)
+        if not copy and dtype == self.dtype:
+            return self
+        if self._root() is None or self.ndim == 0:
+            return super().astype(dtype, order, casting, subok, copy)
+        result = MappedArray.create(self.shape, dtype)
+        for chunk in _chunks(self.shape[0], max(1, CHUNK * self.shape[0] // self.size)):
+            result[chunk] = self[chunk].view(np.ndarray).astype(dtype, casting=casting)
+        return result
+
+    def order_statistics(self, kth):
+        """The `k`-th smallest values for each `k` in `kth`, see `order_statistics`."""
+        return order_statistics(self, kth)
+
+    def quantile(self, qs):
+        """The quantiles, with the same linear interpolation as `np.quantile`."""
+        qs = np.asarray(qs, dtype=float)
+        position = qs * (self.size - 1)
+        below = np.floor(position).astype(np.int64)
+        above = np.minimum(below + 1, self.size - 1)
+        ranks = np.unique(np.concatenate([below.ravel(), above.ravel()]))
+        values = dict(zip(ranks.tolist(), order_statistics(self, ranks)))
+        low = np.vectorize(values.get, otypes=[float])(below)
+        high = np.vectorize(values.get, otypes=[float])(above)
+        return low + (high - low) * (position - below)
+
+
+def _plain(x):
+    if isinstance(x, MappedArray):
+        return x.view(np.ndarray)
+    return x
+
+
+def _edges(inner):
+    """Bin edges around `inner`, with bins of their own for -inf, inf and NaN."""
+    fmax = np.finfo(np.float64).max
+    return np.unique(np.concatenate([[-np.inf, -fmax], inner, [np.inf, np.nan]]))
+
+
+def order_statistics(values, kth, bins=BINS, limit=LIMIT):
+    """The `k`-th smallest of `values` for each `k` in `kth`, as `np.partition` would place them.
+
+    The values are read in chunks.  Every pass counts them in the bins
+    between a set of edges, which narrows down the range each statistic is
+    in, until the values in its range are few enough to select it from
+    directly.  The first edges are quantiles of a strided subset of the
+    values, so most of the time two passes are enough.  NaNs sort last.
+    """
+    flat = _plain(np.ravel(values))
+    size = flat.size
+    if any(k < 0 or k >= size for k in kth):
+        raise IndexError(
+            f"Order statistics {list(kth)} out of range for {size} values."
+        )
+    subset = flat[:: max(1, size // (16 * bins))]
+    subset = subset[np.isfinite(subset)]
+    inner = np.zeros(0)
+    if subset.size:
+        inner = np.quantile(subset, np.linspace(0, 1, bins + 1)[1:-1])
+    # What is left to do for every statistic: count the values in the bins
+    # between some edges, or collect the values in a range that holds it
+    # (with how many values lie below that range).
+    edges = _edges(inner)
+    pending = {int(k): ("count", edges, 0) for k in kth}
+    results = {}
+    low, high = np.inf, -np.inf
+    first = True
+    while pending:
+        counts = {k: 0 for k in pending}
+        collected = {k: [] for k in pending}
+        for chunk in _chunks(size):
+            part = flat[chunk]
+            if first:
+                finite = part[np.isfinite(part)]
+                if finite.size:
+                    low = min(low, float(finite.min()))
+                    high = max(high, float(finite.max()))
+            # Statistics that share their edges share their counts.
+            binned = {}
+            for k, (action, edges, _) in pending.items():
+                if action == "count":
+                    if id(edges) not in binned:
+                        # Bin i holds the values in [edges[i], edges[i + 1]).
+                        index = np.searchsorted(edges, part, side="right") - 1
+                        binned[id(edges)] = np.bincount(index, minlength=edges.size)
+                    counts[k] = counts[k] + binned[id(edges)]
+                else:
+                    left, right = edges
+                    collected[k].append(part[(part >= left) & (part < right)])
+        first = False
+        for k, (action, edges, below) in list(pending.items()):
+            if action == "collect":
+                values = np.concatenate(collected[k])
+                results[k] = np.partition(values, k - below)[k - below]
+                del pending[k]
+                continue
+            cumulative = np.cumsum(counts[k])
+            i = int(np.searchsorted(cumulative, k, side="right"))
+            below = int(cumulative[i - 1]) if i else 0
+            left, right = edges[i], edges[i + 1] if i + 1 < edges.size else np.nan
+            if np.isinf(left) or np.isnan(left):
+                # The bins of -inf, inf and NaN hold only those.
+                results[k] = left
+                del pending[k]
+                continue
+            # The range of the values that are actually in the bin.
+            lo = max(left, np.float64(low))
+            hi = min(right, np.nextafter(np.float64(high), np.inf))
+            if np.nextafter(lo, np.inf) >= hi:
+                results[k] = lo
+                del pending[k]
+            elif counts[k][i] <= limit:
+                pending[k] = ("collect", (left, right), below)
+            else:
+                pending[k] = ("count", _edges(np.linspace(lo, hi, bins + 1)), 0)
+    return np.array([results[int(k)] for k in kth], dtype=flat.dtype)
@@ -0,0 +1,266 @@
+"""Chunked Monte Carlo evaluation with bounded memory.
+
+Rather than drawing every sample of a model at once, `stream` runs a model
+function again and again with a fixed number of samples per chunk and folds
+each chunk into running summaries: the mean and variance, and a mergeable
+quantile `Sketch`.  Memory use is set by the chunk size, not by the total
+number of samples, so tail quantiles can be estimated from 1e8 samples or
+more.
+"""
+
+import functools
+import math
+import sys
+
+import numpy as np
+import pint
+
+from simplefermi import api
+from simplefermi import config
+from simplefermi import graph
+from simplefermi import sampling
+from simplefermi import utils
+from simplefermi.core import ureg
+
+__all__ = ["stream", "iterstream"]
+
+eprint = functools.partial(print, file=sys.stderr)
+
+
+class Sketch:
+    """A mergeable quantile sketch with bounded relative error.
+
+    Values are counted in logarithmically spaced buckets, so that any quantile
+    is returned to within a relative error of `alpha` (in the style of
+    DDSketch).  Adding a chunk is a single `np.bincount`, and two sketches with
+    the same `alpha` merge by adding their counts.  At most `max_bins` buckets
+    are kept on each side of zero, beyond that the buckets closest to zero are
+    collapsed together.
+    """
+
+    def __init__(self, alpha=1e-3, max_bins=2**15):
+        self.alpha = alpha
+        self.max_bins = max_bins
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.positive = _Store(max_bins)
+        self.negative = _Store(max_bins)
+        self.zeros = 0
+        self.count = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def _keys(self, x):
+        return np.ceil(np.log(x) / self.log_gamma).astype(np.int64)
+
+    def _value(self, keys):
+        return 2 * self.gamma ** keys.astype(float) / (self.gamma + 1)
+
+    def add(self, values):
+        values = np.ravel(values)
+        values = values[np.isfinite(values)]
+        if not values.size:
+            return self
+        self.count += values.size
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+        tiny = np.finfo(float).tiny
+        self.positive.add(self._keys(values[values > tiny]))
+        self.negative.add(self._keys(-values[values < -tiny]))
+        self.zeros += int(np.count_nonzero(np.abs(values) <= tiny))
+        return self
+
+    def merge(self, other):
+        if other.alpha != self.alpha:
+            raise ValueError("Can only merge sketches with the same accuracy.")
+        self.positive.merge(other.positive)
+        self.negative.merge(other.negative)
+        self.zeros += other.zeros
+        self.count += other.count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def quantile(self, qs):
+        """The approximate quantiles, to within a relative error of `alpha`."""
+        qs = np.asarray(qs, dtype=float)
+        if not self.count:
+            return np.full(qs.shape, np.nan)
+        neg_keys, neg_counts = self.negative.items()
+        pos_keys, pos_counts = self.positive.items()
+        values = np.concatenate(
+            [-self._value(neg_keys[::-1]), [0.0], self._value(pos_keys)]
+        )
+        counts = np.concatenate([neg_counts[::-1], [self.zeros], pos_counts])
+        ranks = qs * (self.count - 1)
+        index = np.searchsorted(np.cumsum(counts), ranks, side="right")
+        return np.clip(values[index], self.min, self.max)
+
+
+class _Store:
+    """Dense bucket counts for a contiguous range of keys."""
+
+    def __init__(self, max_bins):
+        self.max_bins = max_bins
+        self.offset = 0
+        self.counts = np.zeros(0, dtype=np.int64)
+
+    def add(self, keys, counts=None):
+        if not keys.size:
+            return
+        lo = int(keys.min())
+        hi = int(keys.max())
+        if self.counts.size:
+            lo = min(lo, self.offset)
+            hi = max(hi, self.offset + self.counts.size - 1)
+        # Collapse the lowest buckets if the range has grown too large.
+        lo = max(lo, hi - self.max_bins + 1)
+        new = np.bincount(
+            np.maximum(keys, lo) - lo, weights=counts, minlength=hi - lo + 1
+        ).astype(np.int64)
+        if self.counts.size:
+            old_keys = np.arange(self.offset, self.offset + self.counts.size)
+            new += np.bincount(
+                np.maximum(old_keys, lo) - lo, weights=self.counts, minlength=new.size
+            ).astype(np.int64)
+        self.offset = lo
+        self.counts = new
+
+    def merge(self, other):
+        keys, counts = other.items()
+        self.add(keys, counts)
+
+    def items(self):
+        nonzero = np.flatnonzero(self.counts)
+        return nonzero + self.offset, self.counts[nonzero]
+
+
+class Result:
+    """The running summary of one output of a streamed model."""
+
+    def __init__(self, units=None, alpha=1e-3):
+        self.units = units
+        self.sketch = Sketch(alpha)
+        self.n = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        # (samples, median, low, high, stderr) after every chunk.
+        self.history = []
+
+    def add(self, values):
+        if isinstance(values, pint.Quantity):
+            if self.units is None:
+                self.units = values.units
+            values = values.to(self.units).magnitude
+        elif self.units is None:
+            self.units = ureg.dimensionless
+        values = np.ravel(values).astype(float)
+        # Combine the moments with Chan et al.'s parallel update.
+        n, mean = values.size, values.mean()
+        m2 = np.sum((values - mean) ** 2)
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self._m2 += m2 + delta**2 * self.n * n / total
+        self.n = total
+        self.sketch.add(values)
+        self.history.append((self.n, *self.summary(), self.stderr))
+        return self
+
+    @property
+    def var(self):
+        return self._m2 / max(self.n - 1, 1)
+
+    @property
+    def std(self):
+        return math.sqrt(self.var)
+
+    @property
+    def stderr(self):
+        """The Monte Carlo standard error of the mean."""
+        return self.std / math.sqrt(max(self.n, 1))
+
+    def quantile(self, qs):
+        return self.sketch.quantile(qs)
+
+    def summary(self, alpha=utils.ALPHA):
+        low, mid, high = self.quantile([alpha / 2, 0.5, 1 - alpha / 2])
+        return utils.Summary(float(mid), float(low), float(high))
+
+    def __repr__(self):
+        return api.plain_repr(self)
+
+    def _repr_pretty_(self, printer, cycle):
+        printer.text(api.repr(self))
+
+    def _repr_html_(self):
+        return api.html_repr(self)
+
+
+def _flatten(outputs):
+    if isinstance(outputs, dict):
+        return list(outputs.items())
+    if isinstance(outputs, (tuple, list)):
+        return list(enumerate(outputs))
+    return [(None, outputs)]
+
+
+def _unflatten(template, results):
+    if isinstance(template, dict):
+        return dict(results)
+    if isinstance(template, (tuple, list)):
+        return type(template)(result for _, result in results)
+    return results[0][1]
+
+
+def iterstream(model, n, chunk=None, alpha=1e-3):
+    """Runs `model` over chunks of samples, yielding the running results after each.
+
+    `model` is a function of no arguments that builds the model from the
+    distributions, it is called with the sample count set to the chunk size.
+    It can return a single quantity, or a tuple or dict of them, and the
+    results have the same structure.  Every chunk is drawn from its own seed,
+    so the library's constants are drawn again for each of them.
+    """
+    chunk = chunk or config.get("samples")
+    results = template = None
+    done = 0
+    while done < n:
+        size = min(chunk, n - done)
+        with config.samples(size), sampling.seeded(sampling.spawn()):
+            outputs = model()
+        if results is None:
+            template = outputs
+            results = [(k, Result(alpha=alpha)) for k, _ in _flatten(outputs)]
+        for (_, result), (_, value) in zip(results, _flatten(outputs)):
+            result.add(graph.evaluate(value))
+        done += size
+        yield _unflatten(template, results)
+
+
+def _report(results):
+    for key, result in _flatten(results):
+        name = "" if key is None else f"{key}: "
+        eprint(
+            f"{name}n={result.n:,} {api.plain_repr(result)} mean={result.mean:.6g}"
+            f" ± {result.stderr:.2g}"
+        )
+
+
+def stream(model, n, chunk=None, alpha=1e-3, callback=None, verbose=False):
+    """Evaluates `model` with `n` samples in total, without holding them all in memory.
+
+    >>> def model():
+    ...     return lognormal(1, 10) * percent(20)
+    >>> stream(model, 100_000_000)
+
+    `callback` is called with the running results after every chunk, and with
+    `verbose=True` the convergence is printed as the chunks arrive.
+    """
+    results = None
+    for results in iterstream(model, n, chunk=chunk, alpha=alpha):
+        if verbose:
+            _report(results)
+        if callback is not None:
+            callback(results)
+    return results
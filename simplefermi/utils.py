@@ -1,7 +1,11 @@
+from collections import OrderedDict, namedtuple
+import hashlib
 from math import floor, log10
 import re
 import sys
+import threading
 
+import numpy as np
 
 P = 0.6826894
 ALPHA = 1 - P
@@ -35,6 +39,101 @@ def shortest_interval(sorted_vals, alpha=ALPHA):
     return sorted_vals[start], sorted_vals[start + cut]
 
 
+CacheInfo = namedtuple("CacheInfo", ["hits", "misses", "maxsize", "currsize"])
+
+
+class LRUCache:
+    """A bounded mapping that evicts the least recently used entries and counts hits and misses."""
+
+    _missing = object()
+
+    def __init__(self, maxsize=128):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            value = self._data.get(key, self._missing)
+            if value is self._missing:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = self.misses = 0
+
+    def info(self):
+        return CacheInfo(self.hits, self.misses, self.maxsize, len(self._data))
+
+
+def fingerprint(values, samples=4096):
+    """A cheap hashable digest of an array, from its shape, dtype and a strided subset of its values.
+
+    Only about `samples` of the values are hashed, so this costs microseconds
+    for any size of array, but two arrays that differ only in the values that
+    were skipped have the same fingerprint.
+    """
+    values = np.asarray(values)
+    flat = values.reshape(-1)
+    step = max(1, flat.size // samples)
+    subset = np.concatenate([flat[::step], flat[-1:]])
+    digest = hashlib.blake2b(subset.tobytes(), digest_size=16).hexdigest()
+    return values.shape, values.dtype.str, digest
+
+
+Summary = namedtuple("Summary", ["median", "low", "high"])
+
+
+def summary(values, alpha=ALPHA, shortest=False):
+    """Gives the median and the central (or shortest) interval of unsorted values.
+
+    Only the handful of order statistics that are needed are selected with
+    `np.partition`, so no Python objects are created and no full sort is done
+    unless the shortest interval is requested.  Arrays that select their own
+    order statistics, like memory-mapped samples, do so with their
+    `order_statistics` method.
+    """
+    values = np.ravel(values)
+    size = values.size
+    lo_mid, hi_mid = (size - 1) // 2, size // 2
+    if shortest:
+        sorted_vals = np.sort(values)
+        low, high = shortest_interval(sorted_vals, alpha)
+    else:
+        cut = int(size * alpha / 2.0)
+        if cut < 10:
+            kth = [0, lo_mid, hi_mid, size - 1]
+        else:
+            kth = [cut, lo_mid, hi_mid, size - cut]
+        if hasattr(values, "order_statistics"):
+            sorted_vals = dict(zip(kth, values.order_statistics(kth)))
+        else:
+            sorted_vals = np.partition(values, kth)
+        low, high = sorted_vals[kth[0]], sorted_vals[kth[-1]]
+    center = 0.5 * (sorted_vals[lo_mid] + sorted_vals[hi_mid])
+    return Summary(float(center), float(low), float(high))
+
+
 def magnitude(x):
     """Return the decimal points of magnitude."""
     if x == 0:
@@ -68,14 +167,6 @@ def repr_mag(x, mag=0, padding=2):
 
 
 def round_repr(center, left, right, padding=2):
-    mag = magnitude(right - left)
-    return (repr_mag(center, mag), repr_mag(left, mag), repr_mag(right, mag))
-
-
-def repr(values, padding=2):
-    sorted_values = list(sorted(values))
-    left, right = interval(sorted_values)
-    center = median(sorted_values)
     mag = magnitude(right - left)
     return (
         repr_mag(center, mag, padding=padding),
@@ -84,6 +175,10 @@ def repr(values, padding=2):
     )
 
 
+def repr(values, padding=2):
+    return round_repr(*summary(values), padding=padding)
+
+
 def sigfig_resolution(number_string):
     """Given a number as a string, return a string with the sigfig width.
 
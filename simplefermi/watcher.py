@@ -0,0 +1,118 @@
+"""Debounced, coalescing processing of file change events.
+
+Editors often write a file several times for one save, and the events arrive
+on the file watcher's thread.  A `Pipeline` takes the events for a path,
+waits until they have stopped arriving for `delay` seconds, and then
+processes the path once on a worker thread.  Events that arrive while a path
+is being processed make the running job stale: it is told so through its
+`cancelled` callback, so that it can stop early with `Cancelled`, and the path
+is processed again once the events settle.
+"""
+
+import collections
+import functools
+import sys
+import threading
+import time
+import traceback
+import queue
+
+eprint = functools.partial(print, file=sys.stderr)
+
+
+class Cancelled(Exception):
+    """Raised by a job that stopped because a newer version of its path arrived."""
+
+
+class Pipeline:
+    """Processes paths with `process(path, cancelled)` after their events settle.
+
+    `cancelled()` returns True once a newer event has arrived for the path.
+    Only one job runs for any path at a time, different paths can run at the
+    same time on up to `workers` threads.
+    """
+
+    def __init__(self, process, delay=0.1, workers=1):
+        self.process = process
+        self.delay = delay
+        self.stats = collections.Counter()
+        self._lock = threading.Condition()
+        # When each path with pending events is due to be processed.
+        self._due = {}
+        self._generation = collections.Counter()
+        self._path_locks = collections.defaultdict(threading.Lock)
+        self._queue = queue.Queue()
+        self._closed = False
+        self._threads = [threading.Thread(target=self._schedule, daemon=True)] + [
+            threading.Thread(target=self._work, daemon=True) for _ in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+
+    def submit(self, path):
+        """Notes an event for `path`, it is processed once its events settle."""
+        with self._lock:
+            self.stats["events"] += 1
+            if path in self._due:
+                self.stats["coalesced"] += 1
+            self._generation[path] += 1
+            self._due[path] = time.monotonic() + self.delay
+            self._lock.notify()
+
+    def _schedule(self):
+        with self._lock:
+            while not self._closed:
+                now = time.monotonic()
+                for path, due in list(self._due.items()):
+                    if due <= now:
+                        del self._due[path]
+                        self._queue.put((path, self._generation[path]))
+                timeout = min(self._due.values()) - now if self._due else None
+                self._lock.wait(timeout)
+
+    def _work(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                self._run(*item)
+            finally:
+                self._queue.task_done()
+
+    def _run(self, path, generation):
+        def cancelled():
+            return self._generation[path] != generation
+
+        with self._path_locks[path]:
+            if cancelled():
+                self.stats["skipped"] += 1
+                return
+            try:
+                self.process(path, cancelled)
+            except Cancelled:
+                self.stats["cancelled"] += 1
+            except Exception:
+                eprint(f"Failed to process {path}:")
+                traceback.print_exc()
+            else:
+                self.stats["processed"] += 1
+
+    def wait(self):
+        """Waits until every event so far has been processed."""
+        while True:
+            with self._lock:
+                if not self._due:
+                    break
+                timeout = max(self._due.values()) - time.monotonic()
+            time.sleep(max(timeout, 0.001))
+        self._queue.join()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            self._lock.notify()
+        for _ in self._threads[1:]:
+            self._queue.put(None)
+        for thread in self._threads:
+            thread.join()
@@ -0,0 +1,74 @@
+"""Test the notebook reprs of quantities."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import api
+from simplefermi import config
+from simplefermi import core
+
+
+class RenderCacheTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        api.render_cache.clear()
+        self.q = core.Q(np.random.default_rng(0).lognormal(size=10_000), "m")
+
+    @parameterized.parameters("svg", "png")
+    def test_redisplay_hits(self, kind):
+        with config.using(plots=kind):
+            html = self.q._repr_html_()
+            plot = getattr(self.q, f"_repr_{kind}_")()
+            misses = api.render_cache.info().misses
+            self.assertEqual(self.q._repr_html_(), html)
+            self.assertEqual(getattr(self.q, f"_repr_{kind}_")(), plot)
+            copy = core.Q(self.q.magnitude.copy(), "m")
+            self.assertEqual(getattr(copy, f"_repr_{kind}_")(), plot)
+            self.assertEqual(api.render_cache.info().misses, misses)
+
+    def test_keyed_by_units_and_values(self):
+        html = self.q._repr_html_()
+        self.assertNotEqual(self.q.to("cm")._repr_html_(), html)
+        self.assertNotEqual((2 * self.q)._repr_html_(), html)
+        self.assertLen(api.render_cache, 6)
+
+    def test_options(self):
+        api._plotter(self.q)
+        api._plotter(self.q, quantiles=50)
+        self.assertEqual(api.render_cache.info().misses, 2)
+
+
+class SvgTest(parameterized.TestCase):
+    def test_only_one_kind(self):
+        q = core.Q(np.random.default_rng(0).lognormal(size=1000), "m")
+        with config.using(plots="svg"):
+            self.assertIsNone(q._repr_png_())
+            self.assertStartsWith(q._repr_svg_(), "<svg")
+            self.assertIn("<svg", q._repr_html_())
+            self.assertNotIn("image/png", q._repr_html_())
+        with config.using(plots="png"):
+            self.assertIsNone(q._repr_svg_())
+            self.assertIn("image/png", q._repr_html_())
+
+    def test_label(self):
+        q = core.Q(np.random.default_rng(0).lognormal(size=1000), "m / s")
+        self.assertIn("m/s {velocity}", api.svgplot(q))
+
+    def test_unknown_kind(self):
+        with self.assertRaises(ValueError):
+            api.set_plots("gif")
+
+
+if __name__ == "__main__":
+    absltest.main()
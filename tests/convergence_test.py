@@ -0,0 +1,89 @@
+"""Test the adaptive sample sizing."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import convergence
+from simplefermi import distributions as d
+from simplefermi import library
+from simplefermi import sampling
+from simplefermi.core import ureg
+
+
+class StderrTest(absltest.TestCase):
+    def test_normal(self):
+        n = 100_000
+        values = np.random.default_rng(0).normal(0.0, 2.0, size=n)
+        mid, low, high = convergence.stderrs(values)
+        # The asymptotic standard error of the median of a normal.
+        self.assertAlmostEqual(mid, 1.2533 * 2.0 / np.sqrt(n), delta=0.002)
+        self.assertGreater(low, mid)
+        self.assertGreater(high, mid)
+
+    def test_shrinks(self):
+        rng = np.random.default_rng(1)
+        small = convergence.stderrs(rng.lognormal(size=4_000))
+        large = convergence.stderrs(rng.lognormal(size=400_000))
+        for a, b in zip(small, large):
+            self.assertBetween(a / b, 5.0, 20.0)
+
+    def test_resolution(self):
+        # "3.2 (1.0 to 10.)" is printed to a tenth.
+        self.assertAlmostEqual(convergence.resolution((3.2, 1.0, 10.1)), 0.1)
+        self.assertAlmostEqual(convergence.resolution((100, 95, 105)), 1.0)
+
+
+class AdaptiveTest(parameterized.TestCase):
+    def test_cheap_model_stops_early(self):
+        with sampling.rng(3):
+            result = convergence.adaptive(lambda: d.normal(95, 105, units="m"))
+        self.assertTrue(result.converged)
+        self.assertLessEqual(result.n, 16_000)
+        self.assertEqual(result.units, ureg.m)
+        self.assertEqual([h[0] for h in result.history][:2], [2_000, 4_000])
+        self.assertLessEqual(max(result.stderr), 0.5)
+        self.assertIn("[m]", repr(result))
+
+    def test_hard_model_gets_more(self):
+        with sampling.rng(3):
+            easy = convergence.adaptive(lambda: d.normal(95, 105))
+            hard = convergence.adaptive(lambda: d.logstudent(1, 10, df=2))
+        self.assertGreater(hard.n, 4 * easy.n)
+
+    def test_max_samples(self):
+        with sampling.rng(0):
+            result = convergence.adaptive(
+                lambda: d.logstudent(1, 10, df=2), tolerance=0.01, max_samples=10_000
+            )
+        self.assertFalse(result.converged)
+        self.assertEqual(result.n, 10_000)
+        self.assertEqual([h[0] for h in result.history], [2_000, 4_000, 8_000, 10_000])
+
+    def test_constants_are_redrawn(self):
+        with sampling.rng(0):
+            result = convergence.adaptive(lambda: library.G * 1.0)
+        # Batches that repeated the constant's samples would settle at once.
+        self.assertGreater(result.n, 4_000)
+        values = result.magnitude
+        self.assertFalse(np.array_equal(values[:2_000], values[2_000:4_000]))
+
+    def test_structure(self):
+        with sampling.rng(0):
+            result = convergence.adaptive(
+                lambda: {"a": d.uniform(0, 1), "b": d.plusminus(10, 0.1, units="s")},
+                max_samples=20_000,
+            )
+        self.assertEqual(set(result), {"a", "b"})
+        self.assertEqual(result["a"].n, result["b"].n)
+        self.assertEqual(result["b"].units, ureg.s)
+
+
+if __name__ == "__main__":
+    absltest.main()
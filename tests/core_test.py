@@ -0,0 +1,214 @@
+"""Test the cached unit arithmetic of quantities."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import operator
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import core
+from simplefermi import library  # noqa: F401, names the units
+
+Q = core.Q
+
+UNITS = ["m", "cm", "km/hour", "m*cm", "1/s", "", "kg*m/s**2", "N", "degC", "percent"]
+MAGNITUDES = [
+    lambda: 3,
+    lambda: 2.5,
+    lambda: np.float64(0.7),
+    lambda: np.linspace(1.0, 2.0, 5),
+    lambda: np.linspace(1.0, 2.0, 5, dtype=np.float32),
+]
+
+
+def _pint(fn):
+    """Runs `fn` with pint's own unit arithmetic."""
+    core.fast_units(False)
+    try:
+        return fn()
+    finally:
+        core.fast_units(True)
+
+
+def _outcome(fn):
+    try:
+        result = fn()
+    except Exception as e:
+        return type(e)
+    units = None
+    if isinstance(result, Q):
+        result, units = result.magnitude, result.units
+    return type(result), np.asarray(result).dtype, result, units
+
+
+class CoreTest(parameterized.TestCase):
+    def setUp(self):
+        core.unit_rules.clear()
+
+    def assertSame(self, fn):
+        """Checks that `fn` gives what pint gives, or raises what pint raises."""
+        expected, actual = _pint(lambda: _outcome(fn)), _outcome(fn)
+        if not isinstance(expected, tuple):
+            self.assertEqual(actual, expected)
+            return
+        self.assertEqual(actual[0], expected[0])
+        self.assertEqual(actual[1], expected[1])
+        np.testing.assert_array_equal(actual[2], expected[2])
+        self.assertEqual(actual[3], expected[3])
+
+    @parameterized.parameters(
+        operator.mul, operator.truediv, operator.add, operator.sub, operator.pow
+    )
+    def test_matches_pint(self, op):
+        for a in UNITS:
+            for b in UNITS:
+                for x in MAGNITUDES:
+                    for y in MAGNITUDES:
+                        self.assertSame(lambda: op(Q(x(), a), Q(y(), b)))
+                    self.assertSame(lambda: op(Q(x(), a), x()))
+                    self.assertSame(lambda: op(x(), Q(x(), a)))
+
+    @parameterized.parameters(2, 3, -1, 0.5, 0, 1, 1.0)
+    def test_pow(self, exponent):
+        for a in UNITS:
+            for x in MAGNITUDES:
+                self.assertSame(lambda: Q(x(), a) ** exponent)
+
+    def test_reduces(self):
+        self.assertSame(lambda: Q(np.ones(3), "m") * Q(np.ones(3), "cm"))
+        result = Q(2.0, "m") / Q(4.0, "cm")
+        self.assertEqual(result.units, core.ureg.dimensionless)
+        self.assertEqual(result.magnitude, 50.0)
+
+    @parameterized.parameters(
+        ("1/s", "hour"), ("delta_degC", "kelvin"), ("m", "cm"), ("m", "m")
+    )
+    def test_integer_arrays(self, a, b):
+        # Pint scales integer arrays in place, which fails for fractional
+        # factors, and keeps them integers for whole ones.
+        for x in [np.arange(1, 4), np.arange(1.0, 4.0), 3]:
+            for y in [np.arange(1, 4), np.arange(1.0, 4.0), 2]:
+                self.assertSame(lambda: Q(x, a) * Q(y, b))
+                self.assertSame(lambda: Q(x, a) / Q(y, b))
+        self.assertSame(lambda: (1 / core.ureg.s) * Q(np.arange(1, 4), "hour"))
+        with self.assertRaises(TypeError):
+            Q(np.arange(1, 4), "m") * Q(np.arange(1, 4), "km")
+
+    @parameterized.parameters(
+        ("s", "day"), ("day", "s"), ("cm", "m"), ("delta_degC", "kelvin")
+    )
+    def test_integer_sums(self, a, b):
+        for x in [np.arange(1, 4), np.arange(1.0, 4.0), 3]:
+            for y in [np.full(3, 3), np.full(3, 3.0), 2]:
+                self.assertSame(lambda: Q(x, a) + Q(y, b))
+                self.assertSame(lambda: Q(x, a) - Q(y, b))
+        result = Q(np.arange(1, 4), "s") + Q(np.full(3, 3), "day")
+        self.assertEqual(result.magnitude.dtype, np.int64)
+
+    def test_rules_are_cached(self):
+        a, b = Q(np.ones(3), "m"), Q(np.ones(3), "cm")
+        a * b
+        misses = core.unit_rules.info().misses
+        a * b
+        self.assertEqual(core.unit_rules.info().misses, misses)
+
+    def test_kernel(self):
+        calls = []
+
+        @core.kernel
+        def speed(distance, time, extra):
+            calls.append(type(distance))
+            return distance / time + extra
+
+        d = Q(np.linspace(1, 2, 4), "km")
+        t = Q(np.linspace(1, 2, 4), "minute")
+        extra = Q(3.0, "m/s")
+        expected = d / t + extra
+        result = speed(d, t, extra)
+        self.assertEqual(result.units, expected.units)
+        np.testing.assert_allclose(result.magnitude, expected.magnitude)
+        self.assertEqual(calls, [Q, np.ndarray])
+        speed(d, t, extra)
+        self.assertEqual(calls, [Q, np.ndarray, np.ndarray])
+
+    def test_kernel_plain_arguments(self):
+        @core.kernel
+        def scaled(x, k):
+            return np.exp(x / Q(1.0, "m") * 0) * x * k
+
+        with self.assertRaises(Exception):
+            # Units that don't come in through the arguments.
+            scaled(Q(1.0, "cm"), 2.0)
+
+        @core.kernel
+        def area(x, k):
+            return x * x * k
+
+        result = area(Q(np.array([1.0, 2.0]), "cm"), 3.0)
+        self.assertEqual(result.units, core.ureg.cm**2)
+        np.testing.assert_allclose(result.magnitude, [3.0, 12.0])
+
+    def test_kernel_offset_units(self):
+        @core.kernel
+        def double(t):
+            return 2 * t
+
+        self.assertSame(lambda: double(Q(np.ones(2), "m")))
+        with self.assertRaises(Exception):
+            double(Q(1.0, "degC"))
+
+
+class HumanTest(parameterized.TestCase):
+    @parameterized.parameters(
+        ("kg*m**2/s**3", "power"),
+        ("J/s", "power"),
+        ("km/hour", "velocity"),
+        ("kg/s**3", None),
+    )
+    def test_human_lookup(self, units, name):
+        self.assertEqual(core.human_lookup(core.ureg(units).units), name)
+        self.assertEqual(core.human_lookup(core.Q(2.0, units)), name)
+
+    def test_human_lookup_is_memoized(self):
+        units = core.ureg("furlong/fortnight").units
+        core.human_lookup(units)
+        hits = core._human_names.info().hits
+        self.assertEqual(core.human_lookup(units), "velocity")
+        self.assertEqual(core._human_names.info().hits, hits + 1)
+
+    def test_store_updates_lookup(self):
+        units = core.ureg("m**4").units
+        self.assertIsNone(core.human_lookup(units))
+        core.store(units, "second moment of area")
+        try:
+            self.assertEqual(core.human_lookup(units), "second moment of area")
+        finally:
+            del core.human[units.dimensionality]
+            core._human_names.clear()
+
+    @parameterized.parameters(
+        ("kg*m**2/s**3", "W"),
+        ("J/s", "W"),
+        ("kg*m/s**2", "N"),
+        ("kg/s**3", "W / m ** 2"),
+        ("kg*m**2/s**3/K", "W / K"),
+        ("A*s", "C"),
+        ("km/hour", "m / s"),
+        ("1/s", "1 / s"),
+        ("", ""),
+    )
+    def test_best_unit(self, units, expected):
+        self.assertEqual(core.best_unit(core.ureg(units)), core.ureg.Unit(expected))
+
+    def test_best_unit_converts(self):
+        q = core.Q(3.0, "kWh/day")
+        self.assertAlmostEqual(q.to(core.best_unit(q)).magnitude, 125.0)
+
+
+if __name__ == "__main__":
+    absltest.main()
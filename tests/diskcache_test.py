@@ -0,0 +1,118 @@
+"""Test the persistent cache of block results."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import config
+from simplefermi import diskcache
+from simplefermi import evaluator
+from simplefermi.core import ureg
+
+
+class DiskCacheTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        directory = self.enter_context(tempfile.TemporaryDirectory())
+        self.path = os.path.join(directory, "cache.sqlite")
+        self.cache = diskcache.DiskCache(self.path)
+        self.addCleanup(self.cache.close)
+
+    def test_roundtrip(self):
+        bindings = {
+            "x": ureg.Quantity(np.arange(5.0), "m/s"),
+            "y": np.linspace(0, 1, 3),
+            "n": 3,
+            "g": ureg.Quantity(9.8, "m/s^2"),
+        }
+        self.assertTrue(self.cache.put("key", "<b>out</b>", bindings))
+        output, restored = self.cache.get("key")
+        self.assertEqual(output, "<b>out</b>")
+        self.assertEqual(set(restored), set(bindings))
+        self.assertEqual(restored["x"].units, ureg("m/s").units)
+        np.testing.assert_array_equal(restored["x"].magnitude, np.arange(5.0))
+        np.testing.assert_array_equal(restored["y"], bindings["y"])
+        self.assertIsInstance(restored["n"], int)
+        self.assertEqual(restored["g"], bindings["g"])
+        self.assertEqual(self.cache.info().hits, 1)
+
+    def test_persists(self):
+        self.cache.put("key", "out", {"x": np.ones(3)})
+        self.cache.close()
+        cache = diskcache.DiskCache(self.path)
+        self.addCleanup(cache.close)
+        output, bindings = cache.get("key")
+        self.assertEqual(output, "out")
+        np.testing.assert_array_equal(bindings["x"], np.ones(3))
+
+    def test_missing(self):
+        self.assertIsNone(self.cache.get("key"))
+        self.assertEqual(self.cache.info().misses, 1)
+
+    def test_quantized(self):
+        x = ureg.Quantity(np.random.default_rng(0).lognormal(size=10_000), "m")
+        self.cache.put("key", "", {"x": x, "n": np.arange(10_000.0)[:10]})
+        _, restored = self.cache.get("key")
+        np.testing.assert_allclose(restored["x"].magnitude, x.magnitude, rtol=1e-3)
+        self.assertEqual(restored["x"].dtype, x.dtype)
+        # Small arrays are stored as they are.
+        np.testing.assert_array_equal(restored["n"], np.arange(10.0))
+        # Four times smaller than the raw samples.
+        self.assertLess(self.cache.info().currsize, 0.3 * x.nbytes)
+
+    def test_quick_blocks_are_not_stored(self):
+        cache = diskcache.DiskCache(self.path + "2", min_seconds=0.5)
+        self.addCleanup(cache.close)
+        self.assertFalse(cache.put("quick", "", {"x": 1.0}, seconds=0.1))
+        self.assertTrue(cache.put("slow", "", {"x": 1.0}, seconds=1.0))
+        self.assertNotIn("quick", cache)
+        self.assertIn("slow", cache)
+
+    def test_functions_are_not_stored(self):
+        _, bindings = evaluator.evaluate("func f(x) = 2 x")
+        self.assertFalse(self.cache.put("key", "", bindings))
+        self.assertNotIn("key", self.cache)
+
+    def test_evicts_least_recently_used(self):
+        cache = diskcache.DiskCache(self.path + "2", max_bytes=20_000)
+        self.addCleanup(cache.close)
+        rng = np.random.default_rng(0)
+        for key in "abc":
+            cache.put(key, "", {"x": rng.normal(size=1000)})
+            # Keep "a" in use.
+            cache.get("a")
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+        self.assertIn("c", cache)
+        self.assertLessEqual(cache.info().currsize, 20_000)
+
+
+class KeyTest(parameterized.TestCase):
+    def test_depends_on_everything(self):
+        base = diskcache.key("y = x", {"x": "a"})
+        self.assertEqual(base, diskcache.key("y = x", {"x": "a"}))
+        self.assertNotEqual(base, diskcache.key("y = 2 x", {"x": "a"}))
+        self.assertNotEqual(base, diskcache.key("y = x", {"x": "b"}))
+        self.assertNotEqual(base, diskcache.key("y = x", {"x": None}))
+        with config.samples(10):
+            self.assertNotEqual(base, diskcache.key("y = x", {"x": "a"}))
+        with config.using(design="sobol"):
+            self.assertNotEqual(base, diskcache.key("y = x", {"x": "a"}))
+
+    def test_seed(self):
+        key = diskcache.key("y = x", {"x": "a"})
+        self.assertEqual(
+            diskcache.seed(key).generate_state(4).tolist(),
+            diskcache.seed(key).generate_state(4).tolist(),
+        )
+
+
+if __name__ == "__main__":
+    absltest.main()
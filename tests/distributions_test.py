@@ -0,0 +1,119 @@
+"""Test the distribution constructors."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import config
+from simplefermi import distributions as d
+
+CONSTRUCTORS = [
+    ("plusminus", lambda **kw: d.plusminus(1.0, 0.1, **kw)),
+    ("normal", lambda **kw: d.normal(1.0, 2.0, **kw)),
+    ("uniform", lambda **kw: d.uniform(1.0, 2.0, **kw)),
+    ("rectangular", lambda **kw: d.rectangular(1.0, 2.0, **kw)),
+    ("triangular", lambda **kw: d.triangular(1.0, 2.0, **kw)),
+    ("lognormal", lambda **kw: d.lognormal(1.0, 10.0, **kw)),
+    ("timesdivide", lambda **kw: d.timesdivide(1.0, 2.0, **kw)),
+    ("to", lambda **kw: d.to(1.0, 10.0, **kw)),
+    ("logstudent", lambda **kw: d.logstudent(1.0, 10.0, **kw)),
+    ("gamma", lambda **kw: d.gamma(3.0, **kw)),
+    ("percent", lambda **kw: d.percent(10, **kw)),
+    ("db", lambda **kw: d.db(3, **kw)),
+    ("beta", lambda **kw: d.beta(3, 4, **kw)),
+    ("outof", lambda **kw: d.outof(3, 10, **kw)),
+    ("against", lambda **kw: d.against(3, 4, **kw)),
+    ("data", lambda **kw: d.data([1.0, 2.0, 3.0], **kw)),
+    ("weighted_data", lambda **kw: d.data([1.0, 2.0], weights=[1, 3], **kw)),
+    ("mixture", lambda **kw: d.mixture([1.0, 2.0], [3.0], **kw)),
+    ("normalfit", lambda **kw: d.normalfit([1.0, 2.0, 3.0], **kw)),
+    ("sigfig", lambda **kw: d.sigfig("1.0", **kw)),
+]
+
+
+class SamplesTest(parameterized.TestCase):
+    @parameterized.named_parameters(*CONSTRUCTORS)
+    def test_default(self, fn):
+        self.assertEqual(fn().shape, (config.get("samples"),))
+
+    @parameterized.named_parameters(*CONSTRUCTORS)
+    def test_explicit(self, fn):
+        self.assertEqual(fn(n=123).shape, (123,))
+
+    @parameterized.named_parameters(*CONSTRUCTORS)
+    def test_context(self, fn):
+        with config.samples(321, dtype="float32"):
+            x = fn(units="m")
+        self.assertEqual(x.magnitude.shape, (321,))
+        self.assertEqual(x.magnitude.dtype, np.float32)
+
+    def test_context_restores(self):
+        with config.samples(10):
+            with config.samples(20):
+                self.assertEqual(d.plusminus().shape, (20,))
+            self.assertEqual(d.plusminus().shape, (10,))
+        self.assertEqual(d.plusminus().shape, (config.N,))
+
+    def test_set_samples(self):
+        try:
+            config.set_samples(50)
+            self.assertEqual(d.lognormal(1, 2).shape, (50,))
+        finally:
+            config.set_samples(config.N)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            config.set_samples(0)
+        with self.assertRaises(ValueError):
+            config.set_samples(dtype="int32")
+
+
+class DataTest(parameterized.TestCase):
+    def test_weighted_frequencies(self):
+        x = d.data([31, 29, 30, 28], weights=[2800, 97, 1600, 303], n=400_000)
+        self.assertEqual(x.dtype, np.int64)
+        for value, weight in [(31, 2800), (29, 97), (30, 1600), (28, 303)]:
+            self.assertAlmostEqual(np.mean(x == value), weight / 4800, delta=0.005)
+
+    def test_zero_weight_is_never_drawn(self):
+        x = d.data([1.0, 2.0, 3.0], weights=[1, 0, 1], n=10_000)
+        self.assertFalse(np.any(x == 2.0))
+
+    def test_alias_table_is_cached(self):
+        d._alias([2, 7, 1])
+        hits = d._alias_tables.info().hits
+        d._alias(np.array([2, 7, 1]))
+        self.assertEqual(d._alias_tables.info().hits, hits + 1)
+
+    @parameterized.parameters(([1.0, -1.0],), ([0, 0],), ([],))
+    def test_invalid_weights(self, weights):
+        with self.assertRaises(ValueError):
+            d.data(np.arange(len(weights)), weights=weights, n=10)
+
+    def test_weights_must_match(self):
+        with self.assertRaises(ValueError):
+            d.data([1.0, 2.0], weights=[1, 2, 3], n=10)
+        with self.assertRaises(ValueError):
+            d.mixture([1.0], [2.0], weights=[1], n=10)
+
+    def test_mixture(self):
+        x = d.mixture([1.0, 2.0, 3.0], [10.0], weights=[3, 1], n=400_000)
+        self.assertAlmostEqual(np.mean(x == 10.0), 0.25, delta=0.005)
+        for value in [1.0, 2.0, 3.0]:
+            self.assertAlmostEqual(np.mean(x == value), 0.25, delta=0.005)
+
+    def test_mixture_of_many(self):
+        sources = [np.full(7 + i, float(i)) for i in range(10)]
+        x = d.mixture(*sources, n=100_000)
+        counts = np.bincount(x.astype(int), minlength=10)
+        np.testing.assert_allclose(counts / x.size, 0.1, atol=0.01)
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,149 @@
+"""Test the binning and placement of quantile dotplots."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import matplotlib
+
+matplotlib.use("Agg")
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import dotplots
+
+
+def reference_smoothing(v, thres):
+    """The original scalar implementation."""
+    n = len(v)
+    a = 0
+    b = 1
+    while v[a] == v[b]:
+        b += 1
+    while b < n:
+        c = b + 1
+        while c < n and v[b] == v[c]:
+            c += 1
+        if (v[b] - v[b - 1]) < thres:
+            d = b + ((a + c - b - b) >> 1)
+            while d < b:
+                v[d] = v[b]
+                d += 1
+            while d > b:
+                v[d] = v[a]
+                d -= 1
+        a = b
+        b = c
+    return v
+
+
+def reference_dotbin(array, step, smooth=False):
+    """The original scalar implementation."""
+    n = len(array)
+    v = np.zeros(n)
+    i = 0
+    j = 1
+    a = array[0]
+    b = a
+    w = a + step
+    while j < n:
+        x = array[j]
+        if x >= w:
+            b = (a + b) / 2
+            while i < j:
+                v[i] = b
+                i += 1
+            w = x + step
+            a = x
+        b = x
+        j += 1
+    b = (a + b) / 2
+    while i < j:
+        v[i] = b
+        i += 1
+    if smooth:
+        return reference_smoothing(v, step + step / 4)
+    return v
+
+
+class DotbinTest(parameterized.TestCase):
+    @parameterized.product(
+        n=[20, 100, 500],
+        dist=["normal", "lognormal", "integers"],
+        smooth=[False, True],
+    )
+    def test_matches_reference(self, n, dist, smooth):
+        rng = np.random.default_rng(n)
+        if dist == "normal":
+            x = rng.standard_normal(n)
+        elif dist == "lognormal":
+            x = rng.lognormal(0, 1, n)
+        else:
+            x = rng.integers(0, 5, n).astype(float)
+        x = np.sort(x)
+        width = 5 / 2 * (x.max() - x.min()) / n
+        np.testing.assert_array_equal(
+            dotplots.dotbin(x, width, smooth), reference_dotbin(x, width, smooth)
+        )
+
+    def test_single_stack(self):
+        # The original smoothing ran off the end of a single stack.
+        np.testing.assert_array_equal(
+            dotplots.dotbin(np.ones(5), 1.0, smooth=True), np.ones(5)
+        )
+
+    def test_transform(self):
+        x = np.array([1.0, 10.0, 100.0, 1000.0])
+        np.testing.assert_allclose(
+            dotplots.dotbin(x, 1.5, f=np.log10), dotplots.dotbin(np.log10(x), 1.5)
+        )
+
+    def test_stackheights(self):
+        heights = dotplots.stackheights([1.0, 1.0, 1.0, 2.0, 3.0, 3.0], 2.0)
+        np.testing.assert_array_equal(heights, [1.0, 3.0, 5.0, 1.0, 1.0, 3.0])
+
+
+class DotplotTest(parameterized.TestCase):
+    @parameterized.parameters(20, 500)
+    def test_single_artist(self, quantiles):
+        x = np.random.default_rng(0).lognormal(0, 1, 10_000)
+        fig, ax = dotplots.dotplot(x, quantiles=quantiles, log=True)
+        self.assertLen(ax.collections, 1)
+        self.assertLen(ax.collections[0].get_offsets(), quantiles)
+        self.assertEmpty(ax.patches)
+
+
+class SvgTest(parameterized.TestCase):
+    @parameterized.parameters(
+        ("normal", 20), ("normal", 500), ("lognormal", 50), ("constant", 20)
+    )
+    def test_dots(self, dist, quantiles):
+        rng = np.random.default_rng(0)
+        if dist == "normal":
+            x = rng.normal(6e24, 1e23, 10_000)
+        elif dist == "lognormal":
+            x = rng.lognormal(0, 1, 10_000)
+        else:
+            x = np.ones(100)
+        svg = dotplots.svg(x, quantiles=quantiles, label="kg")
+        self.assertStartsWith(svg, "<svg")
+        self.assertEqual(svg.count("<circle"), quantiles)
+        self.assertIn(">kg</text>", svg)
+        self.assertNotIn("nan", svg)
+
+    def test_escapes_label(self):
+        svg = dotplots.svg(np.arange(100.0), label="<b>")
+        self.assertIn("&lt;b&gt;", svg)
+
+    def test_ticks(self):
+        ticks, step = dotplots._ticks(0.3, 9.7)
+        self.assertEqual(step, 2)
+        np.testing.assert_allclose(ticks, [2, 4, 6, 8])
+
+
+if __name__ == "__main__":
+    absltest.main()
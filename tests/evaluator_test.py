@@ -0,0 +1,110 @@
+"""Test compiling and running fermi blocks."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import config
+from simplefermi import evaluator
+from simplefermi import parser
+from simplefermi import sampling
+from simplefermi.core import ureg
+
+
+def values(source, env=None):
+    outputs, _ = evaluator.evaluate(source, env)
+    return [output.value for output in outputs]
+
+
+class EvaluatorTest(parameterized.TestCase):
+    @parameterized.parameters(
+        ("3 + 3 * 4", 15),
+        ("2 ^ 3", 8),
+        ("1/2", 0.5),
+        ("-3 + 1", -2),
+        ("{ y = 3; y * 2 }", 6),
+        ("x = 3\nx^2", 9),
+        ("func f(a, b) = a * b\nf(2, 3)", 6),
+    )
+    def test_numbers(self, source, expected):
+        self.assertEqual(values(source)[-1], expected)
+
+    @parameterized.parameters(
+        ("3 m", 3 * ureg.m),
+        ("3 kg^2 / s", 3 * ureg.kg**2 / ureg.s),
+        ("(3 + 4) m", 7 * ureg.m),
+        ("m^(1/2)", 1 * ureg.m**0.5),
+        ("2 km -> m", 2000 * ureg.m),
+        ("2 km as m", 2000 * ureg.m),
+    )
+    def test_units(self, source, expected):
+        (value,) = values(source)
+        self.assertEqual(value.units, expected.units)
+        self.assertAlmostEqual(value.magnitude, expected.magnitude)
+
+    def test_distributions(self):
+        with config.samples(1000):
+            x, y = values("x = 1 to 10 m\nx * 2\ny = lognormal(1, 10)\ny -> percent")
+        self.assertEqual(x.shape, (1000,))
+        self.assertEqual(x.units, ureg.m)
+        self.assertEqual(y.shape, (1000,))
+
+    def test_constants(self):
+        with config.samples(1000):
+            (radius,) = values("earth_radius -> km")
+        self.assertEqual(radius.units, ureg.km)
+        self.assertAlmostEqual(np.median(radius.magnitude), 6371, delta=10)
+
+    def test_sigfigs(self):
+        with config.samples(1000):
+            (value,) = values("~3.5 kg")
+        self.assertAlmostEqual(np.median(value.magnitude), 3.5, delta=0.01)
+        self.assertAlmostEqual(np.std(value.magnitude), 0.05, delta=0.01)
+
+    def test_bindings(self):
+        outputs, bindings = evaluator.evaluate("x = 2 m\ny = x * 3")
+        self.assertEmpty(outputs)
+        self.assertEqual(bindings["y"], 6 * ureg.m)
+        # Names bound above shadow units and constants.
+        self.assertEqual(values("m * 2", {"m": 4}), [8])
+        self.assertEqual(values("y -> cm", bindings)[0], 600 * ureg.cm)
+
+    def test_defines_and_uses(self):
+        plan = evaluator.compile("x = y * m\nfunc f(a) = a * z\nf(x)")
+        self.assertEqual(plan.defines, {"x", "f"})
+        self.assertEqual(plan.uses, {"y", "m", "z"})
+
+    def test_plan_cache(self):
+        source = "x = 1 to 10 m\nx * 2\n"
+        plan = evaluator.compile(source)
+        with mock.patch.object(parser, "parse", wraps=parser.parse) as parse:
+            self.assertIs(evaluator.compile(source), plan)
+            parse.assert_not_called()
+        with config.samples(1000):
+            with sampling.rng(0):
+                first = values(source)
+            with sampling.rng(0):
+                second = values(source)
+        np.testing.assert_array_equal(first[0].magnitude, second[0].magnitude)
+
+    @parameterized.parameters(
+        ("3 +", "line 1"),
+        ("x * 2", "unknown name 'x'"),
+        ("f(1)", "unknown function 'f'"),
+        ("1\n1 m + 1 s", "line 2"),
+        ("1 m -> s", "Cannot convert"),
+    )
+    def test_errors(self, source, message):
+        with self.assertRaisesRegex(evaluator.FermiError, message):
+            evaluator.evaluate(source)
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,143 @@
+"""Test lazy expression graphs."""
+
+from absl.testing import absltest
+
+import os
+import sys
+
+import numpy as np
+import pint
+from scipy.special import ndtr
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import config
+from simplefermi import distributions as d
+from simplefermi import graph
+from simplefermi import sampling
+from simplefermi import utils
+from simplefermi.core import Q, ureg
+
+
+class GraphTest(absltest.TestCase):
+    def test_constructors_are_lazy(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0, units="m")
+        self.assertIsInstance(x, graph.Leaf)
+        self.assertEqual(x.units, ureg.m)
+        self.assertIsInstance(d.lognormal(1.0, 10.0), np.ndarray)
+
+    def test_samples_are_stable(self):
+        with graph.lazy():
+            x = d.plusminus(1.0, 0.1, n=1000)
+        np.testing.assert_array_equal(x.draw(), x.draw())
+        np.testing.assert_array_equal(x.evaluate(), x.draw())
+
+    def test_matches_eager(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0, units="m", n=1000)
+            y = d.plusminus(3.0, 0.1, units="cm", n=1000)
+            z = (x * x + 2 * x * y) / y - Q(1, "km") * np.exp(y / x)
+        xs, ys = Q(x.draw(), "m"), Q(y.draw(), "cm")
+        expected = (xs * xs + 2 * xs * ys) / ys - Q(1, "km") * np.exp(ys / xs)
+        self.assertEqual(z.units, expected.units)
+        np.testing.assert_allclose(z.evaluate().magnitude, expected.magnitude)
+
+    def test_correlations(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0, n=1000)
+            ratio = (x * x) / x**2
+        np.testing.assert_allclose(ratio.evaluate(), 1.0)
+
+    def test_common_subexpressions(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0, n=1000)
+            total = (x + 1) * (x + 1)
+        evaluation = graph._Evaluation()
+        _, order = evaluation.canonicalize(total)
+        self.assertLen(order, 4)
+        np.testing.assert_allclose(total.evaluate(), (x.draw() + 1) ** 2)
+
+    def test_dimension_errors_are_immediate(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0, units="m", n=10)
+            with self.assertRaises(pint.DimensionalityError):
+                x + Q(1, "s")
+
+    def test_sample_policy(self):
+        with graph.lazy(), config.samples(123, dtype="float32"):
+            x = d.lognormal(1.0, 10.0, units="m")
+        self.assertEqual(x.magnitude.shape, (123,))
+        self.assertEqual(x.magnitude.dtype, np.float32)
+
+    def test_design(self):
+        with graph.lazy(), config.samples(4096), sampling.quasi("sobol"):
+            x = d.plusminus(0.0, 1.0)
+            y = d.plusminus(0.0, 1.0)
+        # Evaluated after the block, but still drawn from its dimensions.
+        u = np.sort(ndtr(x.evaluate()))
+        grid = (np.arange(u.size) + 0.5) / u.size
+        self.assertLess(np.abs(u - grid).max(), 1e-3)
+        self.assertLess(abs(np.corrcoef(x.evaluate(), y.evaluate())[0, 1]), 0.01)
+
+    def test_reduction(self):
+        with graph.lazy(), config.samples(1000):
+            with sampling.reduced("antithetic"):
+                x = d.plusminus(0.0, 1.0)
+            with sampling.reduced("stratified"):
+                y = d.plusminus(0.0, 1.0)
+        self.assertAlmostEqual(x.evaluate().mean(), 0.0, places=12)
+        strata = np.floor(ndtr(y.evaluate()) * 1000)
+        np.testing.assert_array_equal(np.sort(strata), np.arange(1000))
+
+
+class ClosedFormTest(absltest.TestCase):
+    def test_lognormal_products(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0, units="m", n=200_000)
+            y = d.percent(20, n=200_000)
+            z = x**2 / (y * Q(3.0, "s")) * x
+        form = graph.closed_form(z)
+        self.assertTrue(form.log)
+        self.assertEqual(z.units, ureg.m**3 / ureg.s)
+        qs = [0.1, 0.5, 0.9]
+        np.testing.assert_allclose(
+            z.quantile(qs), np.quantile(z.magnitude, qs), rtol=0.05
+        )
+        # The summary doesn't need any samples.
+        z._value = None
+        self.assertIn("[m ** 3 / s]", repr(z))
+        self.assertIsNone(z._value)
+
+    def test_normal_sums(self):
+        with graph.lazy():
+            x = d.plusminus(3.0, 0.2, units="kg", n=200_000)
+            y = d.normal(1.0, 2.0, units="g", n=200_000)
+            z = 2 * x - y
+        form = graph.closed_form(z)
+        self.assertFalse(form.log)
+        self.assertAlmostEqual(form.mean, 5.9985)
+        self.assertAlmostEqual(form.sigma, np.hypot(0.4, 0.0005))
+        np.testing.assert_allclose(z.summary(), utils.summary(z.magnitude), rtol=2e-3)
+
+    def test_repeated_leaves(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0)
+            self.assertEqual(graph.closed_form(x * x / x**2).summary(), (1, 1, 1))
+            y = d.plusminus(1.0, 0.5)
+            self.assertAlmostEqual(graph.closed_form(y + y).sigma, 1.0)
+            self.assertAlmostEqual(graph.closed_form(y - y).sigma, 0.0)
+
+    def test_leaving_the_families(self):
+        with graph.lazy():
+            x = d.lognormal(1.0, 10.0)
+            y = d.plusminus(1.0, 0.5)
+            for node in [x + x, y * y, -x, x**y, np.sin(y), d.uniform(0, 1) * x]:
+                self.assertIsNone(graph.closed_form(node))
+            self.assertTrue(graph.closed_form(np.exp(y)).log)
+            self.assertFalse(graph.closed_form(np.log(x)).log)
+            self.assertIsNone(graph.closed_form(d.lognormal(x, 10.0)))
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,87 @@
+"""Test the lazily sampled constants of the library."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+import simplefermi
+from simplefermi import config
+from simplefermi import distributions as d
+from simplefermi import library
+from simplefermi import sampling
+
+
+class LibraryTest(parameterized.TestCase):
+    def test_cached(self):
+        self.assertIs(library.G, library.G)
+        self.assertIs(simplefermi.G, library.G)
+
+    def test_aliases(self):
+        self.assertIs(library.yr, library.year)
+        self.assertIs(library.sigma, library.stefan_boltzmann)
+
+    @parameterized.parameters("G", "earth_mass", "solar_constant", "month")
+    def test_samples(self, name):
+        with config.samples(1000):
+            value = getattr(library, name)
+        self.assertEqual(value.shape, (1000,))
+        self.assertEqual(getattr(library, name).shape, (config.N,))
+
+    def test_deterministic(self):
+        with config.samples(1000):
+            with sampling.rng(1):
+                first = library.G
+            with sampling.rng(1):
+                second = library.G
+            with sampling.rng(2):
+                other = library.G
+        np.testing.assert_array_equal(first.magnitude, second.magnitude)
+        self.assertFalse(np.array_equal(first.magnitude, other.magnitude))
+
+    @parameterized.parameters(
+        {"design": "sobol"}, {"design": "lhs"}, {"reduction": "stratified"}
+    )
+    def test_follows_design(self, **settings):
+        with config.samples(1024):
+            plain = library.G
+            with config.using(**settings):
+                designed = library.G
+                self.assertIs(library.G, designed)
+        self.assertIsNot(designed, plain)
+        # Each of these designs puts a quarter of the samples in every quartile.
+        z = (designed.magnitude - 6.67408e-11) / 0.00031e-11
+        counts = np.histogram(z, bins=[-np.inf, -0.6745, 0, 0.6745, np.inf])[0]
+        np.testing.assert_array_equal(counts, 256)
+
+    def test_quasi_blocks_redraw_constants(self):
+        # A constant kept from another block would share its dimension with
+        # an input of this one.
+        with config.samples(1024):
+            for _ in range(2):
+                with sampling.quasi("sobol"):
+                    g = library.G.magnitude - 6.67408e-11
+                    x = d.plusminus(0, 1)
+                self.assertLess(abs(np.corrcoef(g, x)[0, 1]), 0.1)
+
+    def test_does_not_advance_stream(self):
+        with config.samples(1000):
+            with sampling.rng(3):
+                before = sampling.state()
+                library.earth_radius
+                self.assertEqual(sampling.state(), before)
+
+    def test_units(self):
+        self.assertEqual(str(library.foot), "1 foot")
+        self.assertIn("earth_mass", dir(library))
+        with self.assertRaises(AttributeError):
+            library.not_a_constant
+
+
+if __name__ == "__main__":
+    absltest.main()
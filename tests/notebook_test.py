@@ -0,0 +1,289 @@
+"""Test the incremental updates of the live notebook."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import concurrent.futures
+import os
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import config
+from simplefermi import diskcache
+from simplefermi import notebook
+from simplefermi import watcher
+
+TEXT = """# Title
+
+```fermi
+x = 1 to 10 m
+```
+
+Some text.
+
+```fermi
+y = x * 2
+y
+```
+
+```fermi
+z = 3
+z
+```
+"""
+
+
+class SplitTest(parameterized.TestCase):
+    def test_roundtrip(self):
+        blocks = notebook.split_blocks(TEXT)
+        self.assertEqual("".join(source for _, source in blocks), TEXT)
+        self.assertEqual(
+            [kind for kind, _ in blocks],
+            ["markdown", "fermi", "markdown", "fermi", "markdown", "fermi", "markdown"],
+        )
+
+    def test_fermi_source_ends_at_fence(self):
+        for kind, source in notebook.split_blocks(TEXT + "more"):
+            if kind == "fermi":
+                self.assertTrue(source.endswith("```"))
+
+    def test_markdown_on_threads(self):
+        texts = [f"# Title {i}\n\n* item {i}\n\n`code {i}`" for i in range(200)]
+        expected = [notebook.render_markdown(text) for text in texts]
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            rendered = list(pool.map(notebook.render_markdown, texts))
+        self.assertEqual(rendered, expected)
+
+
+class DocumentTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter_context(config.samples(1000))
+        self.document = notebook.Document()
+        self.assertIsNone(self.document.update(TEXT))
+        self.assertEqual(self.document.runs, 3)
+
+    def test_unchanged(self):
+        with mock.patch.object(notebook, "render_markdown") as render:
+            self.assertEqual(self.document.update(TEXT), [])
+            render.assert_not_called()
+        self.assertEqual(self.document.runs, 3)
+
+    def test_markdown_edit(self):
+        self.assertEqual(self.document.update(TEXT.replace("Some", "Other")), [2])
+        self.assertEqual(self.document.runs, 3)
+
+    def test_independent_block(self):
+        self.assertEqual(self.document.update(TEXT.replace("z = 3", "z = 4")), [5])
+        self.assertEqual(self.document.runs, 4)
+        self.assertIn(">4<", self.document.blocks[5].html)
+
+    def test_upstream_change_reruns_dependents(self):
+        changed = self.document.update(TEXT.replace("1 to 10", "2 to 20"))
+        self.assertEqual(changed, [1, 3])
+        self.assertEqual(self.document.runs, 5)
+
+    def test_incremental_parse(self):
+        with mock.patch.object(
+            notebook.parser, "parse_tree", wraps=notebook.parser.parse_tree
+        ) as parse_tree:
+            self.document.update(TEXT.replace("z = 3", "z = 5"))
+        (call,) = parse_tree.call_args_list
+        self.assertIsNotNone(call.args[1])
+
+    def test_added_block(self):
+        text = TEXT + "\n```fermi\nw = y / 2\nw\n```\n"
+        self.assertIsNone(self.document.update(text))
+        self.assertEqual(self.document.runs, 4)
+        self.assertIn("id='block-8'", self.document.html())
+
+    def test_error(self):
+        self.document.update(TEXT.replace("x = 1 to 10 m", "x = 1 m + 1 s"))
+        self.assertIn("fermierror", self.document.blocks[1].html)
+        self.assertIn("unknown name", self.document.blocks[3].html)
+
+    def test_cancelled(self):
+        text = TEXT.replace("z = 3", "z = 4")
+        with self.assertRaises(watcher.Cancelled):
+            self.document.update(text, cancelled=lambda: True)
+        # What was updated before it stopped hasn't been sent yet.
+        self.assertIsNone(self.document.update(text))
+        self.assertIn(">4<", self.document.blocks[5].html)
+        self.assertEqual(self.document.update(text), [])
+
+
+class ProgressTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter_context(config.samples(10_000))
+        self.document = notebook.Document(stages=(100, 1000, 10_000))
+        self.document.update(TEXT)
+
+    def test_stages(self):
+        previews = []
+
+        def progress(changed):
+            previews.append(
+                (changed, [self.document.blocks[i].html for i in changed or []])
+            )
+
+        changed = self.document.update(
+            TEXT.replace("1 to 10", "2 to 20"), None, progress
+        )
+        # The last stage is the full number of samples, so it isn't a preview.
+        self.assertLen(previews, 2)
+        for (indices, htmls), n in zip(previews, ["100", "1,000"]):
+            self.assertEqual(indices, [1, 3])
+            self.assertIn(f"{n} samples", htmls[1])
+        self.assertEqual(changed, [1, 3])
+        self.assertNotIn("preview", self.document.blocks[3].html)
+        self.assertEqual(self.document.blocks[3].bindings["y"].shape, (10_000,))
+
+    def test_only_stale_blocks(self):
+        previews = []
+        self.document.update(TEXT.replace("z = 3", "z = 4"), None, previews.append)
+        self.assertEqual(previews, [[5], [5]])
+
+    def test_upstream_samples_are_subsampled(self):
+        previews = []
+        text = TEXT.replace("y = x * 2", "y = x * 3")
+        self.assertEqual(self.document.update(text, None, previews.append), [3])
+        self.assertEqual(previews, [[3], [3]])
+
+    def test_cancel_between_stages(self):
+        calls = []
+
+        def cancelled():
+            calls.append(1)
+            return len(calls) > 2
+
+        with self.assertRaises(watcher.Cancelled):
+            self.document.update(TEXT.replace("1 to 10", "2 to 20"), cancelled)
+        self.assertLen(calls, 3)
+
+
+class CacheTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.enter_context(config.samples(1000))
+        directory = self.enter_context(tempfile.TemporaryDirectory())
+        self.cache = diskcache.DiskCache(
+            os.path.join(directory, "cache.sqlite"), min_seconds=0
+        )
+        self.addCleanup(self.cache.close)
+
+    def test_restart(self):
+        first = notebook.Document(cache=self.cache)
+        first.update(TEXT)
+        self.assertEqual(first.runs, 3)
+        second = notebook.Document(cache=self.cache)
+        second.update(TEXT)
+        self.assertEqual((second.runs, second.restored), (0, 3))
+        self.assertEqual(second.html(), first.html())
+
+    def test_downstream_of_a_change_runs(self):
+        notebook.Document(cache=self.cache).update(TEXT)
+        document = notebook.Document(cache=self.cache)
+        document.update(TEXT.replace("1 to 10 m", "2 to 10 m"))
+        # Only the independent block is restored.
+        self.assertEqual((document.runs, document.restored), (2, 1))
+
+    def test_restored_blocks_match_the_blocks_above(self):
+        # Only the block that binds y is slow enough to be stored.
+        put = self.cache.put
+        self.enter_context(
+            mock.patch.object(
+                self.cache,
+                "put",
+                lambda key, output, bindings, seconds: "y" in bindings
+                and put(key, output, bindings),
+            )
+        )
+        first = notebook.Document(cache=self.cache)
+        first.update(TEXT)
+        second = notebook.Document(cache=self.cache)
+        second.update(TEXT)
+        self.assertEqual((second.runs, second.restored), (2, 1))
+        x, y, _ = [block.bindings for block in second.blocks if block.kind == "fermi"]
+        # x ran again with the same seed, y came from the cache.
+        np.testing.assert_array_equal(
+            x["x"].magnitude, first.blocks[1].bindings["x"].magnitude
+        )
+        np.testing.assert_allclose(y["y"].magnitude, 2 * x["x"].magnitude, rtol=1e-3)
+
+    def test_no_previews_for_restored_blocks(self):
+        notebook.Document(cache=self.cache).update(TEXT)
+        progress = mock.Mock()
+        document = notebook.Document(stages=(100,), cache=self.cache)
+        document.update(TEXT, progress=progress)
+        progress.assert_not_called()
+
+
+class HandlerTest(parameterized.TestCase):
+    def test_renders_once_per_save(self):
+        directory = self.enter_context(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "notes.md")
+        with open(path, "w") as f:
+            f.write(TEXT)
+        handler = notebook.MarkdownHandler(delay=0.01, stages=())
+        self.addCleanup(handler.pipeline.close)
+        event = mock.Mock(src_path=path, is_directory=False)
+        with mock.patch.object(notebook, "socketio") as socketio:
+            for _ in range(3):
+                handler.on_modified(event)
+            handler.pipeline.wait()
+            # Saving the same content again doesn't render anything.
+            handler.on_modified(event)
+            handler.pipeline.wait()
+        self.assertEqual(socketio.emit.call_count, 1)
+        name, data = socketio.emit.call_args.args
+        self.assertEqual(name, "update")
+        self.assertEqual(data["path"], path)
+
+    def test_progressive(self):
+        directory = self.enter_context(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "notes.md")
+        with open(path, "w") as f:
+            f.write(TEXT)
+        handler = notebook.MarkdownHandler(delay=0.01, stages=(100,))
+        self.addCleanup(handler.pipeline.close)
+        event = mock.Mock(src_path=path, is_directory=False)
+        with config.samples(1000), mock.patch.object(notebook, "socketio") as socketio:
+            handler.render(path, lambda: False)
+            with open(path, "w") as f:
+                f.write(TEXT.replace("z = 3", "z = 4"))
+            handler.render(path, lambda: False)
+        names = [call.args[0] for call in socketio.emit.call_args_list]
+        self.assertEqual(names, ["update", "update", "patch", "patch"])
+        preview, final = [call.args[1] for call in socketio.emit.call_args_list[2:]]
+        self.assertIn("100 samples", preview["blocks"][0]["html"])
+        self.assertNotIn("samples", final["blocks"][0]["html"])
+
+    def test_show(self):
+        directory = self.enter_context(tempfile.TemporaryDirectory())
+        path = os.path.join(directory, "notes.md")
+        with open(path, "w") as f:
+            f.write(TEXT)
+        handler = notebook.MarkdownHandler(delay=0.01, stages=())
+        self.addCleanup(handler.pipeline.close)
+        with mock.patch.object(notebook, "socketio"):
+            handler.render(path, lambda: False)
+        notebook.socketio.on_event("show", handler.show)
+        client = notebook.socketio.test_client(notebook.app)
+        self.addCleanup(client.disconnect)
+        client.emit("show", {"path": path})
+        client.emit("show", {"path": os.path.join(directory, "other.md")})
+        received = client.get_received()
+        self.assertLen(received, 1)
+        self.assertEqual(received[0]["name"], "update")
+        update = received[0]["args"][0]
+        self.assertEqual(update, {"path": path, "html": handler.documents[path].html()})
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,58 @@
+"""Test the pooled and cached fermi parser."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import concurrent.futures
+import os
+import sys
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import parser
+
+SOURCES = [
+    "3 + 3 * 4",
+    "x = 1 to 10 m\ny = x * 2\n",
+    "func f(a, b) = a * b\nf(2 m, 3 s)",
+    "{ y = 3; y * 2 }",
+]
+
+
+class ParserTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        parser.tree_cache.clear()
+
+    def test_one_parser_per_thread(self):
+        self.assertIs(parser.parser(), parser.parser())
+        with concurrent.futures.ThreadPoolExecutor(1) as pool:
+            other = pool.submit(parser.parser).result()
+        self.assertIsNot(other, parser.parser())
+
+    def test_cached(self):
+        first = parser.parse_tree(SOURCES[1])
+        second = parser.parse_tree(SOURCES[1])
+        self.assertEqual(parser.tree_cache.info().hits, 1)
+        self.assertEqual(str(first.root_node), str(second.root_node))
+
+    def test_edit_does_not_change_cache(self):
+        old, new = SOURCES[1], SOURCES[1].replace("* 2", "* 3 kg")
+        tree = parser.parse_tree(old)
+        parser.edit(tree, old, new)
+        edited = parser.parse_tree(new, tree)
+        self.assertEqual(str(edited.root_node), str(parser.parse(new)))
+        self.assertEqual(str(parser.parse(old)), str(parser.parse_tree(old).root_node))
+        self.assertEqual(parser.parse(old).end_byte, len(old))
+
+    @parameterized.parameters(*SOURCES)
+    def test_threads(self, source):
+        expected = str(parser.parse(source))
+        parser.tree_cache.clear()
+        with concurrent.futures.ThreadPoolExecutor(4) as pool:
+            results = list(pool.map(lambda s: str(parser.parse(s)), [source] * 32))
+        self.assertEqual(results, [expected] * 32)
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,231 @@
+"""Test the blockwise parallel sampler."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import distributions as d
+from simplefermi import sampling
+
+SIZE = 3 * sampling.BLOCK + 17
+
+
+class FillTest(parameterized.TestCase):
+    @parameterized.parameters(
+        ("standard_normal", {}),
+        ("beta", {"a": 2.0, "b": 3.0}),
+        ("choice", {"a": [1, 2, 3], "p": [0.2, 0.3, 0.5]}),
+    )
+    def test_independent_of_workers(self, method, params):
+        seed = np.random.SeedSequence(42)
+        reference = sampling.fill(seed, method, SIZE, **params)
+        self.assertEqual(reference.shape, (SIZE,))
+        for workers, backend in [(2, "thread"), (3, "thread"), (2, "process")]:
+            np.testing.assert_array_equal(
+                sampling.fill(seed, method, SIZE, workers, backend, **params),
+                reference,
+            )
+
+    def test_sizes(self):
+        seed = np.random.SeedSequence(0)
+        self.assertEqual(sampling.fill(seed, "random", 0).shape, (0,))
+        short = sampling.fill(seed, "random", 10)
+        np.testing.assert_array_equal(short, sampling.fill(seed, "random", 1000)[:10])
+
+    def test_draws_differ(self):
+        self.assertFalse(np.array_equal(d.plusminus(n=100), d.plusminus(n=100)))
+
+    def test_seeded(self):
+        seed = np.random.SeedSequence(7)
+        with sampling.seeded(seed):
+            first = d.lognormal(1, 10, n=100), d.beta(1, 2, n=100)
+        with sampling.seeded(seed), sampling.parallel(4):
+            second = d.lognormal(1, 10, n=100), d.beta(1, 2, n=100)
+        np.testing.assert_array_equal(first[0], second[0])
+        np.testing.assert_array_equal(first[1], second[1])
+        self.assertFalse(np.array_equal(first[0], first[1]))
+
+
+class SeedTest(absltest.TestCase):
+    def tearDown(self):
+        sampling.seed(None)
+        super().tearDown()
+
+    def test_global_seed(self):
+        sampling.seed(1)
+        first = d.lognormal(1, 10, n=100)
+        sampling.seed(1)
+        np.testing.assert_array_equal(d.lognormal(1, 10, n=100), first)
+
+    def test_context_takes_precedence(self):
+        sampling.seed(1)
+        with sampling.rng(2):
+            inside = d.plusminus(n=10)
+        with sampling.rng(2):
+            np.testing.assert_array_equal(d.plusminus(n=10), inside)
+        sampling.seed(2)
+        np.testing.assert_array_equal(d.plusminus(n=10), inside)
+
+    def test_state(self):
+        self.assertIsNone(sampling.state())
+        with sampling.rng(3):
+            before = sampling.state()
+            d.plusminus(n=10)
+            self.assertNotEqual(sampling.state(), before)
+
+    def test_memoize(self):
+        calls = []
+
+        @sampling.memoize
+        def model(k):
+            calls.append(k)
+            return d.lognormal(1, 10, n=10) * k
+
+        with sampling.rng(4):
+            first, after_first = model(2), d.plusminus(n=10)
+        with sampling.rng(4):
+            second, after_second = model(2), d.plusminus(n=10)
+        self.assertIs(first, second)
+        np.testing.assert_array_equal(after_first, after_second)
+        self.assertEqual(calls, [2])
+        model(2)
+        self.assertEqual(calls, [2, 2])
+
+
+class DesignTest(parameterized.TestCase):
+    def _quantiles(self, design, n, seed):
+        with sampling.quasi(design), sampling.rng(seed):
+            x = d.lognormal(1, 10, n=n) * d.lognormal(2, 5, n=n)
+        return np.quantile(x, [0.16, 0.5, 0.84])
+
+    @parameterized.parameters("sobol", "halton", "lhs")
+    def test_reproducible(self, design):
+        np.testing.assert_array_equal(
+            self._quantiles(design, 1000, 7), self._quantiles(design, 1000, 7)
+        )
+        self.assertFalse(
+            np.array_equal(
+                self._quantiles(design, 1000, 7), self._quantiles(design, 1000, 8)
+            )
+        )
+
+    @parameterized.parameters("sobol", "halton")
+    def test_more_accurate(self, design):
+        with sampling.rng(0):
+            reference = np.quantile(
+                d.lognormal(1, 10, n=2_000_000) * d.lognormal(2, 5, n=2_000_000),
+                [0.16, 0.5, 0.84],
+            )
+
+        def error(design):
+            errors = [
+                self._quantiles(design, 4096, s) / reference - 1 for s in range(8)
+            ]
+            return np.sqrt(np.mean(np.square(errors)))
+
+        with sampling.quasi("random"):
+            self.assertLess(error(design), 0.5 * error("random"))
+
+    @parameterized.parameters(
+        ("random", {}),
+        ("standard_normal", {}),
+        ("standard_t", {"df": 3.0}),
+        ("gamma", {"shape": 2.5}),
+        ("beta", {"a": 2.0, "b": 3.0}),
+        ("exponential", {}),
+    )
+    def test_marginals(self, method, params):
+        with sampling.rng(1):
+            reference = sampling.draw(method, 200_000, **params)
+            with sampling.quasi("sobol"):
+                x = sampling.draw(method, 4096, **params)
+        self.assertTrue(np.all(np.isfinite(x)))
+        np.testing.assert_allclose(
+            np.quantile(x, [0.1, 0.5, 0.9]),
+            np.quantile(reference, [0.1, 0.5, 0.9]),
+            rtol=0.05,
+            atol=0.02,
+        )
+
+    def test_inputs_get_their_own_dimension(self):
+        with sampling.quasi("sobol"), sampling.rng(3):
+            x = sampling.draw("random", 4096)
+            y = sampling.draw("random", 4096)
+        self.assertLess(abs(np.corrcoef(x, y)[0, 1]), 0.05)
+        # Every quarter of the unit square holds a quarter of the points.
+        counts = np.histogram2d(x, y, bins=2, range=[[0, 1], [0, 1]])[0]
+        np.testing.assert_allclose(counts, 1024, atol=4)
+
+    @parameterized.parameters("sobol", "halton")
+    def test_high_dimensions_are_uncorrelated(self, design):
+        with sampling.quasi(design), sampling.rng(5):
+            draws = [sampling.draw("random", 4096) for _ in range(40)]
+        correlation = np.corrcoef(draws[32], draws[33])[0, 1]
+        self.assertLess(abs(correlation), 0.05)
+
+    def test_out_of_dimensions(self):
+        with sampling.quasi("halton"), sampling.rng(4):
+            with self.assertWarnsRegex(UserWarning, "Latin hypercube"):
+                draws = [
+                    sampling.draw("random", 256) for _ in range(sampling.DIMENSIONS + 3)
+                ]
+        for x in draws[-3:]:
+            # Latin hypercube samples, one in every stratum.
+            np.testing.assert_array_equal(np.sort(np.floor(x * 256)), np.arange(256))
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            with sampling.quasi("grid"):
+                pass
+
+
+class ReductionTest(parameterized.TestCase):
+    def test_antithetic_pairs(self):
+        with sampling.reduced("antithetic"), sampling.rng(0):
+            z = sampling.draw("standard_normal", 1001)
+            u = sampling.draw("random", 1000)
+        np.testing.assert_array_equal(z[501:], -z[:500])
+        np.testing.assert_allclose(u[500:], 1 - u[:500])
+
+    def test_stratified(self):
+        with sampling.reduced("stratified"), sampling.rng(0):
+            u = sampling.draw("random", 500)
+            x = d.data([1.0, 2.0, 3.0, 4.0], weights=[1, 1, 1, 5], n=800)
+        np.testing.assert_array_equal(np.sort(np.floor(u * 500)), np.arange(500))
+        np.testing.assert_array_equal(
+            np.bincount(x.astype(int)), [0, 100, 100, 100, 500]
+        )
+
+    @parameterized.parameters("antithetic", "stratified")
+    def test_reduces_variance(self, reduction):
+        def means(reduction):
+            with sampling.reduced(reduction):
+                return [
+                    np.mean(d.plusminus(3.0, 1.0, n=1000) * d.normal(1.0, 2.0, n=1000))
+                    for _ in range(50)
+                ]
+
+        with sampling.rng(5):
+            self.assertLess(np.std(means(reduction)), 0.5 * np.std(means("none")))
+
+    def test_reproducible(self):
+        def draws():
+            with sampling.reduced("stratified"), sampling.rng(3):
+                return d.lognormal(1, 10, n=100)
+
+        np.testing.assert_array_equal(draws(), draws())
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            with sampling.reduced("control"):
+                pass
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,150 @@
+"""Test the file format for quantities."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import pickle
+import sys
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import distributions as d
+from simplefermi import graph
+from simplefermi import sampling
+from simplefermi import serialize
+from simplefermi import streaming
+from simplefermi.core import Q
+
+
+class SerializeTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = self.enter_context(tempfile.TemporaryDirectory())
+
+    def test_raw_roundtrip(self):
+        x = d.lognormal(1, 10, "m/s", n=1000)
+        loaded = serialize.loads(serialize.dumps(x))
+        self.assertEqual(loaded.units, x.units)
+        np.testing.assert_array_equal(loaded.magnitude, x.magnitude)
+
+    def test_smaller_than_pickle(self):
+        x = d.lognormal(1, 10, "m/s", n=10_000)
+        self.assertLess(len(serialize.dumps(x)), len(pickle.dumps(x)))
+        self.assertLess(
+            len(serialize.dumps(x, encoding="quantized", bits=8)),
+            len(pickle.dumps(x)) / 7,
+        )
+
+    def test_batch(self):
+        values = {
+            "x": d.plusminus(3, 1, "kg", n=100),
+            "y": np.arange(5.0),
+            "z": Q(2.5, "s"),
+            "n": np.int64(7),
+        }
+        loaded = serialize.loads(serialize.dumps(values))
+        self.assertEqual(set(loaded), set(values))
+        np.testing.assert_array_equal(loaded["x"].magnitude, values["x"].magnitude)
+        np.testing.assert_array_equal(loaded["y"], values["y"])
+        self.assertEqual(loaded["z"], values["z"])
+        self.assertEqual(loaded["n"], 7)
+
+    def test_file_is_memory_mapped(self):
+        x = d.lognormal(1, 10, "m", n=1000)
+        path = os.path.join(self.directory, "x.sfq")
+        serialize.save(path, {"x": x})
+        loaded = serialize.load(path)["x"]
+        self.assertIsInstance(loaded.magnitude.base, np.memmap)
+        np.testing.assert_array_equal(loaded.magnitude, x.magnitude)
+        with open(path, "rb") as f:
+            np.testing.assert_array_equal(serialize.load(f)["x"].magnitude, x.magnitude)
+
+    def test_bytes_are_not_copied(self):
+        data = bytearray(serialize.dumps(np.arange(10.0)))
+        loaded = serialize.loads(data)
+        data[-80:] = bytes(80)
+        self.assertEqual(loaded[-1], 0.0)
+
+    @parameterized.parameters(8, 16)
+    def test_quantized(self, bits):
+        x = d.lognormal(1, 10, "m", n=10_000)
+        loaded = serialize.loads(serialize.dumps(x, encoding="quantized", bits=bits))
+        # Quantized in log space, so the error is relative.
+        error = np.log(10) * 2 * 4 / 2**bits
+        np.testing.assert_allclose(loaded.magnitude, x.magnitude, rtol=error)
+        y = d.plusminus(0, 1, n=1000)
+        loaded = serialize.loads(serialize.dumps(y, encoding="quantized", bits=bits))
+        self.assertLess(np.abs(loaded - y).max(), (y.max() - y.min()) / 2**bits)
+
+    def test_sketch(self):
+        with sampling.rng(0):
+            x = d.lognormal(1, 10, "m", n=10_000)
+        loaded = serialize.loads(serialize.dumps(x, encoding="sketch"))
+        self.assertIsInstance(loaded, streaming.Result)
+        self.assertEqual(loaded.units, x.units)
+        np.testing.assert_allclose(
+            loaded.quantile([0.1, 0.5, 0.9]),
+            np.quantile(x.magnitude, [0.1, 0.5, 0.9]),
+            rtol=3e-3,
+        )
+        result = streaming.stream(lambda: d.plusminus(0, 1, "m"), 2000, chunk=500)
+        loaded = serialize.loads(serialize.dumps(result))
+        self.assertEqual(loaded.n, result.n)
+        self.assertEqual(loaded.summary(), result.summary())
+        self.assertEqual(loaded.history, result.history)
+
+    def test_lazy_values_are_stored_as_provenance(self):
+        with graph.lazy():
+            a = d.lognormal(1, 10, "kg", n=100_000)
+            b = d.plusminus(d.uniform(1, 2, n=100_000), 0.1, n=100_000)
+            x = (a * b / Q(2, "s") + d.uniform(0, 1, "kg/s", n=100_000)).to("g/s")
+        data = serialize.dumps({"x": x})
+        self.assertLess(len(data), 4096)
+        loaded = serialize.loads(data)["x"]
+        self.assertIsInstance(loaded, graph.Node)
+        self.assertEqual(loaded.units, x.units)
+        np.testing.assert_array_equal(loaded.magnitude, x.magnitude)
+
+    def test_lazy_values_keep_their_design(self):
+        with graph.lazy(), sampling.quasi("halton"):
+            a = d.lognormal(1, 10, n=1000)
+            b = a * d.plusminus(1, 0.1, n=1000)
+        before = serialize.dumps({"a": a, "b": b})
+        np.testing.assert_array_equal(
+            serialize.loads(before)["b"].evaluate(), b.evaluate()
+        )
+        after = serialize.loads(serialize.dumps({"a": a, "b": b}))
+        np.testing.assert_array_equal(after["a"].evaluate(), a.evaluate())
+        np.testing.assert_array_equal(after["b"].evaluate(), b.evaluate())
+
+    def test_lazy_values_keep_their_reduction(self):
+        with graph.lazy(), sampling.reduced("antithetic"):
+            x = d.plusminus(0, 1, n=1000)
+        loaded = serialize.loads(serialize.dumps(x))
+        self.assertAlmostEqual(loaded.evaluate().mean(), 0.0, places=12)
+        np.testing.assert_array_equal(loaded.evaluate(), x.evaluate())
+
+    def test_lazy_values_without_provenance_store_samples(self):
+        with graph.lazy():
+            x = (
+                d.lognormal(1, 10, "m", n=100)
+                + d.lognormal(1, 2, "m", n=100).evaluate()
+            )
+        loaded = serialize.loads(serialize.dumps(x))
+        np.testing.assert_array_equal(loaded.magnitude, x.magnitude)
+
+    def test_errors(self):
+        with self.assertRaises(serialize.FormatError):
+            serialize.loads(b"not a file of quantities")
+        with self.assertRaises(ValueError):
+            serialize.dumps(np.zeros(3), encoding="zip")
+        with self.assertRaises(TypeError):
+            serialize.dumps(np.array(["a"]))
+
+
+if __name__ == "__main__":
+    absltest.main()
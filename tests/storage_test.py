@@ -0,0 +1,147 @@
+"""Test the memory-mapped sample storage."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import gc
+import os
+import pickle
+import sys
+import tempfile
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import config
+from simplefermi import distributions as d
+from simplefermi import sampling
+from simplefermi import storage
+from simplefermi import utils
+from simplefermi.core import Q
+
+
+class StorageTest(parameterized.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.directory = self.enter_context(tempfile.TemporaryDirectory())
+        # Small enough that the chunking is exercised.
+        self.enter_context(mock.patch.object(storage, "MIN_BYTES", 1024))
+        self.enter_context(mock.patch.object(storage, "CHUNK", 1000))
+
+    def test_scratch_directory(self):
+        self.addCleanup(storage.set_storage, "memory", None)
+        storage.set_storage("mmap", self.directory)
+        self.assertEqual(config.get("scratch"), self.directory)
+        storage.set_storage("memory")
+        self.assertEqual(config.get("scratch"), self.directory)
+        with storage.mapped():
+            self.assertEqual(storage._directory(), self.directory)
+        # None goes back to the default.
+        storage.set_storage(directory=None)
+        self.assertIsNone(config.get("scratch"))
+        self.assertEqual(storage._directory(), tempfile.gettempdir())
+        with self.assertRaises(ValueError):
+            config.update(samples=None)
+
+    def test_draws_are_mapped_and_identical(self):
+        with sampling.rng(0):
+            reference = d.lognormal(1, 10, "m", n=10_001)
+        with sampling.rng(0), storage.mapped(self.directory):
+            x = d.lognormal(1, 10, "m", n=10_001)
+            small = d.lognormal(1, 10, "m", n=10)
+        self.assertIsInstance(x.magnitude, storage.MappedArray)
+        self.assertNotIsInstance(small.magnitude, storage.MappedArray)
+        self.assertLen(os.listdir(self.directory), 1)
+        np.testing.assert_array_equal(x.magnitude, reference.magnitude)
+
+    def test_arithmetic_streams_into_new_files(self):
+        with sampling.rng(0):
+            a, b = d.plusminus(5, 1, "m", n=10_001), d.lognormal(1, 2, "s", n=10_001)
+            reference = (a / b + Q(1, "m/s")).to("km/hr")
+        with sampling.rng(0), storage.mapped(self.directory):
+            a, b = d.plusminus(5, 1, "m", n=10_001), d.lognormal(1, 2, "s", n=10_001)
+        result = (a / b + Q(1, "m/s")).to("km/hr")
+        self.assertIsInstance(result.magnitude, storage.MappedArray)
+        self.assertEqual(result.units, reference.units)
+        np.testing.assert_allclose(result.magnitude, reference.magnitude, rtol=1e-15)
+        del a, b, result
+        gc.collect()
+        self.assertEmpty(os.listdir(self.directory))
+
+    def test_broadcasting(self):
+        x = storage.MappedArray.create((3000, 2), np.float64, self.directory)
+        x[:] = np.arange(6000.0).reshape(3000, 2)
+        row = np.array([1.0, 2.0])
+        np.testing.assert_array_equal(x * row, np.asarray(x) * row)
+        np.testing.assert_array_equal(np.add(x, 1), np.asarray(x) + 1)
+
+    def test_in_place(self):
+        x = storage.MappedArray.create(5000, np.float64, self.directory)
+        x[:] = 1.0
+        y = x
+        x += 1
+        self.assertIs(x, y)
+        np.testing.assert_array_equal(x, 2.0)
+
+    def test_astype(self):
+        x = storage.MappedArray.create(5000, np.float64, self.directory)
+        x[:] = np.linspace(0, 1, 5000)
+        y = x.astype(np.float32)
+        self.assertIsInstance(y, storage.MappedArray)
+        self.assertEqual(y.dtype, np.float32)
+        np.testing.assert_array_equal(y, np.linspace(0, 1, 5000).astype(np.float32))
+
+    def test_pickles_a_reference(self):
+        x = storage.MappedArray.create(10_000, np.float64, self.directory)
+        x[:] = np.random.default_rng(0).normal(size=10_000)
+        for value in [x, x[100:200], Q(x, "m")]:
+            data = pickle.dumps(value)
+            self.assertLess(len(data), 1000)
+            loaded = pickle.loads(data)
+            np.testing.assert_array_equal(
+                getattr(loaded, "magnitude", loaded), getattr(value, "magnitude", value)
+            )
+        # Views that aren't contiguous are copied.
+        np.testing.assert_array_equal(pickle.loads(pickle.dumps(x[::2])), x[::2])
+
+    def test_summary_and_quantiles(self):
+        with sampling.rng(1):
+            reference = d.lognormal(1, 10, n=10_001)
+        with sampling.rng(1), storage.mapped(self.directory):
+            x = d.lognormal(1, 10, n=10_001)
+        self.assertEqual(utils.summary(x), utils.summary(reference))
+        qs = np.linspace(0, 1, 21)
+        np.testing.assert_array_equal(x.quantile(qs), np.quantile(reference, qs))
+
+
+class OrderStatisticsTest(parameterized.TestCase):
+    @parameterized.parameters(
+        dict(bins=256, limit=2**23),
+        dict(bins=4, limit=100),
+        dict(bins=4, limit=3),
+    )
+    def test_matches_partition(self, bins, limit):
+        rng = np.random.default_rng(0)
+        arrays = [
+            rng.normal(size=10_001),
+            np.exp(3 * rng.normal(size=5_000)),
+            rng.integers(0, 3, size=5_000).astype(float),
+            rng.normal(size=5_000).astype(np.float32),
+            np.array([1.0]),
+            np.concatenate([rng.normal(size=1000), [np.inf, -np.inf, np.nan]]),
+        ]
+        for values in arrays:
+            kth = sorted({0, 1 % values.size, values.size // 2, values.size - 1})
+            with mock.patch.object(storage, "CHUNK", 777):
+                got = storage.order_statistics(values, kth, bins=bins, limit=limit)
+            np.testing.assert_array_equal(got, np.partition(values, kth)[kth])
+
+    def test_out_of_range(self):
+        with self.assertRaises(IndexError):
+            storage.order_statistics(np.zeros(3), [3])
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,88 @@
+"""Test chunked evaluation and the quantile sketch."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import distributions as d
+from simplefermi import library
+from simplefermi import streaming
+from simplefermi.core import ureg
+
+QS = [0.001, 0.01, 0.16, 0.5, 0.84, 0.99, 0.999]
+
+
+class SketchTest(parameterized.TestCase):
+    @parameterized.parameters(
+        ("lognormal", {}),
+        ("standard_t", {"df": 2}),
+        ("normal", {}),
+    )
+    def test_relative_error(self, name, kwargs):
+        values = getattr(np.random.default_rng(0), name)(size=100_000, **kwargs)
+        sketch = streaming.Sketch(alpha=1e-3).add(values)
+        expected = np.quantile(values, QS, method="inverted_cdf")
+        np.testing.assert_allclose(sketch.quantile(QS), expected, rtol=2e-3)
+
+    def test_merge(self):
+        values = np.random.default_rng(1).normal(size=10_000)
+        whole = streaming.Sketch().add(values)
+        merged = (
+            streaming.Sketch()
+            .add(values[:3000])
+            .merge(streaming.Sketch().add(values[3000:]))
+        )
+        np.testing.assert_array_equal(whole.quantile(QS), merged.quantile(QS))
+        self.assertEqual(whole.count, merged.count)
+
+    def test_bounded(self):
+        sketch = streaming.Sketch(max_bins=100)
+        sketch.add(np.logspace(-100, 100, 1000))
+        self.assertLessEqual(sketch.positive.counts.size, 100)
+        self.assertEqual(sketch.quantile([1.0])[0], 1e100)
+
+
+class StreamTest(absltest.TestCase):
+    def test_moments(self):
+        values = np.random.default_rng(2).normal(3.0, 2.0, size=10_000)
+        result = streaming.Result()
+        for part in np.array_split(values, 7):
+            result.add(part)
+        self.assertAlmostEqual(result.mean, values.mean())
+        self.assertAlmostEqual(result.var, values.var(ddof=1))
+        self.assertLen(result.history, 7)
+
+    def test_stream(self):
+        result = streaming.stream(
+            lambda: d.lognormal(1.0, 10.0, units="m"), 10_000, chunk=3000
+        )
+        self.assertEqual(result.n, 10_000)
+        self.assertEqual(result.units, ureg.m)
+        self.assertEqual([h[0] for h in result.history], [3000, 6000, 9000, 10_000])
+        mid, low, high = result.summary()
+        self.assertBetween(mid, 2.5, 4.0)
+        self.assertIn("[m]", repr(result))
+
+    def test_constants_are_redrawn(self):
+        chunks = [
+            result.mean
+            for result in streaming.iterstream(lambda: library.G * 1.0, 3000, 1000)
+        ]
+        self.assertLen(set(chunks), 3)
+
+    def test_structure(self):
+        result = streaming.stream(
+            lambda: {"a": d.plusminus(), "b": d.uniform(0, 1)}, 100, chunk=50
+        )
+        self.assertEqual(set(result), {"a", "b"})
+        self.assertEqual(result["b"].n, 100)
+
+
+if __name__ == "__main__":
+    absltest.main()
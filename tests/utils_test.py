@@ -0,0 +1,71 @@
+"""Test the summary and formatting utilities."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import utils
+
+
+class SummaryTest(parameterized.TestCase):
+    @parameterized.parameters(1, 2, 7, 100, 1001, 20_000)
+    def test_matches_sorted(self, size):
+        values = np.random.default_rng(size).lognormal(size=size)
+        sorted_vals = np.sort(values)
+        mid, low, high = utils.summary(values)
+        self.assertEqual(mid, np.median(values))
+        cut = int(size * utils.ALPHA / 2.0)
+        if cut < 10:
+            self.assertEqual((low, high), (sorted_vals[0], sorted_vals[-1]))
+        else:
+            self.assertEqual((low, high), (sorted_vals[cut], sorted_vals[-cut]))
+
+    def test_shortest(self):
+        values = np.random.default_rng(0).exponential(size=10_000)
+        expected = utils.shortest_interval(np.sort(values))
+        _, low, high = utils.summary(values, shortest=True)
+        self.assertEqual((low, high), expected)
+
+    def test_does_not_modify(self):
+        values = np.arange(100.0)[::-1].copy()
+        utils.summary(values)
+        np.testing.assert_array_equal(values, np.arange(100.0)[::-1])
+
+    def test_scalar(self):
+        self.assertEqual(utils.summary(3.0), (3.0, 3.0, 3.0))
+
+    def test_repr(self):
+        values = np.random.default_rng(1).normal(10.0, 1.0, size=200_000)
+        self.assertEqual(utils.repr(values), ("10.", "9.0", "11.0"))
+
+
+class FingerprintTest(parameterized.TestCase):
+    def test_equal_arrays(self):
+        values = np.random.default_rng(0).normal(size=200_000)
+        self.assertEqual(utils.fingerprint(values), utils.fingerprint(values.copy()))
+
+    @parameterized.parameters(0, 48_000, 99_999)
+    def test_changed_sample(self, index):
+        values = np.random.default_rng(0).normal(size=100_000)
+        other = values.copy()
+        other[index] += 1
+        self.assertNotEqual(utils.fingerprint(values), utils.fingerprint(other))
+
+    def test_shape_and_dtype(self):
+        values = np.zeros(16)
+        self.assertNotEqual(
+            utils.fingerprint(values), utils.fingerprint(values.reshape(4, 4))
+        )
+        self.assertNotEqual(
+            utils.fingerprint(values), utils.fingerprint(values.astype(np.float32))
+        )
+
+
+if __name__ == "__main__":
+    absltest.main()
@@ -0,0 +1,94 @@
+"""Test the debounced file event pipeline."""
+
+from absl.testing import absltest
+from absl.testing import parameterized
+
+import collections
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from simplefermi import watcher
+
+
+class PipelineTest(parameterized.TestCase):
+    def make(self, process, delay=0.02, workers=2):
+        pipeline = watcher.Pipeline(process, delay=delay, workers=workers)
+        self.addCleanup(pipeline.close)
+        return pipeline
+
+    def test_debounce(self):
+        calls = collections.Counter()
+        pipeline = self.make(lambda path, cancelled: calls.update([path]))
+        for _ in range(10):
+            pipeline.submit("a.md")
+        pipeline.submit("b.md")
+        pipeline.wait()
+        self.assertEqual(calls, {"a.md": 1, "b.md": 1})
+        self.assertEqual(pipeline.stats["coalesced"], 9)
+        pipeline.submit("a.md")
+        pipeline.wait()
+        self.assertEqual(calls["a.md"], 2)
+
+    def test_cancels_stale(self):
+        started = threading.Event()
+        finished = []
+
+        def process(path, cancelled):
+            started.set()
+            for _ in range(200):
+                if cancelled():
+                    raise watcher.Cancelled()
+                time.sleep(0.005)
+            finished.append(path)
+
+        pipeline = self.make(process)
+        pipeline.submit("a.md")
+        started.wait()
+        pipeline.submit("a.md")
+        pipeline.wait()
+        self.assertEqual(finished, ["a.md"])
+        self.assertEqual(pipeline.stats["cancelled"], 1)
+        self.assertEqual(pipeline.stats["processed"], 1)
+
+    def test_one_job_per_path(self):
+        running = collections.Counter()
+        overlaps = []
+        lock = threading.Lock()
+
+        def process(path, cancelled):
+            with lock:
+                running[path] += 1
+                overlaps.append(running[path])
+            time.sleep(0.03)
+            with lock:
+                running[path] -= 1
+
+        pipeline = self.make(process, delay=0.001, workers=4)
+        for _ in range(5):
+            pipeline.submit("a.md")
+            time.sleep(0.01)
+        pipeline.wait()
+        self.assertEqual(max(overlaps), 1)
+
+    def test_errors_are_reported(self):
+        calls = []
+
+        def process(path, cancelled):
+            calls.append(path)
+            raise RuntimeError("boom")
+
+        pipeline = self.make(process)
+        with absltest.mock.patch.object(watcher.traceback, "print_exc"):
+            pipeline.submit("a.md")
+            pipeline.wait()
+            pipeline.submit("a.md")
+            pipeline.wait()
+        self.assertEqual(calls, ["a.md", "a.md"])
+
+
+if __name__ == "__main__":
+    absltest.main()